@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.append('../../build')
+
+import argparse
+from epidemics.epidemics import EpidemicsBase
+from epidemics.utils.misc import import_from, make_path
+from epidemics.utils.warm_start import load_posterior_samples
+
+parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+        description="Update the posterior of a previous run with new days of data by sequential Monte Carlo.")
+parser.add_argument('--compModel', '-cm', default='country.reparam.sird_int.nbin', help='The computational model.')
+parser.add_argument('--dataFolder', '-df', default='data/test/', help='Folder of the previous run.')
+parser.add_argument('--country', '-c', default='switzerland', help='Country from which to retrieve data./')
+parser.add_argument('--fromDay', '-fd', default=None, help='Last day of data of the previous run, required if it has no saved state.')
+parser.add_argument('--lastDay', '-ld', required=True, help='New last day of data in format %Y-%m-%d.')
+parser.add_argument('--minESS', type=float, default=0.5, help='Relative effective sample size below which the particles are rejuvenated.')
+parser.add_argument('--nMoves', type=int, default=5, help='Number of Metropolis-Hastings moves per rejuvenation.')
+parser.add_argument('--nPropagation', '-np', type=int, default=100, help='Number of points to evaluate the solution in the propagation phase.')
+parser.add_argument('--nThreads', '-nt', type=int, default=1, help='Number of threads.')
+parser.add_argument('--silentPlot', '-sp', action='store_true', help='Close plot window after plot.')
+parser.add_argument('--useIntervention', '-uint', action='store_true', help='Use only data before intervention')
+parser.add_argument('--useInformedPriors', '-uip', action='store_true', help='Use informed priors on D, Z and Y.')
+parser.add_argument('--useInfections', '-ui', action='store_true', help='Use infections to fit data.')
+parser.add_argument('--useDeaths', '-ud', action='store_true', help='Use deaths to fit data.')
+parser.add_argument('--noPropagation', action='store_true', help='Skip the propagation and the plots.')
+
+args = parser.parse_args()
+
+folder = make_path(args.dataFolder, args.country, args.compModel)
+statePath = os.path.join(folder, 'state.pickle')
+
+if os.path.isfile(statePath):
+    a = EpidemicsBase.load(statePath)
+    a.nThreads = args.nThreads
+else:
+    if args.fromDay is None:
+        sys.exit(f"No state in {folder}, pass --fromDay.")
+    obs = []
+    if args.useInfections:
+        obs.append('infections')
+    if args.useDeaths:
+        obs.append('deaths')
+
+    model_class = import_from('epidemics.' + args.compModel, 'Model')
+    a = model_class(country=args.country, dataFolder=args.dataFolder, lastDay=args.fromDay,
+                    observations=obs, nThreads=args.nThreads, silentPlot=args.silentPlot,
+                    useIntervention=args.useIntervention, useInformedPriors=args.useInformedPriors,
+                    preprocess=False)
+
+    js = a.get_variables_and_distributions()
+    names = [v['Name'] for v in js['Variables']]
+    values = load_posterior_samples(folder, names)
+    a.parameters = [{'Name': name, 'Values': values[:, j]} for j, name in enumerate(names)]
+    a.nSamples = len(values)
+    a.has_been_called['sample'] = True
+
+a.assimilate(args.lastDay, minESS=args.minESS, nMoves=args.nMoves)
+a.save()
+
+if not args.noPropagation:
+    a.propagate(args.nPropagation)
+    a.plot_intervals()
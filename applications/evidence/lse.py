@@ -11,28 +11,42 @@ import copy
 from epidemics.utils.misc import import_from
 
 parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-parser.add_argument('--compModel', '-cm', default='sir.altone_nbin', help='The computational mode.')
+parser.add_argument('--compModel', '-cm', default='country.reparam.seiir_int.nbin', help='The computational mode.')
 parser.add_argument('--dataFolder', '-df', default='data/', help='Save all results in the folder \'data\\dataFolder\' ')
 parser.add_argument('--country', '-c', default='switzerland', help='Country from which to retrieve data./')
-parser.add_argument('--nSamples', '-ns', type=int, default=2000, help='Number of samples for TMCMC.')
-parser.add_argument('--nGenerations', '-ng', type=int, default=20, help='Maximum number of generations for CMA-ES.')
+parser.add_argument('--lastDay', '-ld', default='2020-06-13', help='Last day of data sequence in format %%Y-%%m-%%d./')
+parser.add_argument('--preprocess', '-pre', type=bool, default=False, help='Preprocess data')
+parser.add_argument('--nGenerations', '-ng', type=int, default=20, help='Maximum number of residual evaluations of the least squares fit per start.')
+parser.add_argument('--nStarts', '-nst', type=int, default=4, help='Number of starting points of the least squares fit.')
+parser.add_argument('--seed', type=int, default=12345, help='Seed of the random starting points.')
 parser.add_argument('--nThreads', '-nt', type=int, default=1, help='Number of threads.')
-parser.add_argument('--nPropagation', '-np', type=int, default=100, help='Number of points to evaluate the solution in the propagation phase.')
-parser.add_argument('--futureDays', '-fd', type=int, default=2, help='Propagate that many days in future, after the time of observation of the last data.')
-parser.add_argument('--nValidation', '-nv', type=int, default=0, help='Use that many data from the end of the data list to validate the prediction.')
-parser.add_argument('--percentages', '-p', nargs='+', type=float, default=[0.5, 0.95, 0.99], help='Percentages for confidence intervals.')
 parser.add_argument('--silent', action='store_true', help='No output on screen.')
+parser.add_argument('--useInfections', '-ui', action='store_true', help='Use infections to fit data.')
+parser.add_argument('--useDeaths', '-ud', action='store_true', help='Use deaths to fit data.')
 parser.add_argument('--silentPlot', '-sp', action='store_true', help='Close plot window after plot.')
 args = parser.parse_args()
 
-
 x = copy.deepcopy(args)
+
 del x.compModel
-del x.nSamples
 del x.nGenerations
+del x.nStarts
+del x.seed
+del x.useInfections
+del x.useDeaths
+
+obs = []
+if args.useInfections:
+    obs.append('infections')
+if args.useDeaths:
+    obs.append('deaths')
+
+x.observations=obs
 
 model_class = import_from( 'epidemics.' + args.compModel, 'Model')
 
 a = model_class( **vars(x) )
 
-a.least_squares( args.nGenerations )
+a.least_squares( args.nGenerations, args.nStarts, args.seed )
+
+a.save()
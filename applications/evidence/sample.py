@@ -30,6 +30,8 @@ parser.add_argument('--up_to_int', '-utint', type=bool, default=False, help='Use
 parser.add_argument('--plotMeanMedian', dest='plotMeanMedian', action='store_true', default=False, help='Plot mean and median of states.')
 parser.add_argument('--useInfections', '-ui', action='store_true', help='Use infections to fit data.')
 parser.add_argument('--useDeaths', '-ud', action='store_true', help='Use deaths to fit data.')
+parser.add_argument('--warmStart', '-ws', default=None, help='Output folder of a previous run (e.g. with an earlier --lastDay) whose posterior is used as the importance sampling proposal.')
+parser.add_argument('--minESS', type=float, default=0.5, help='Minimum relative effective sample size of the warm start, otherwise sample from scratch.')
 parser.add_argument('--test', action='store_true', help="Test run. Not everything is tested.")
 
 
@@ -51,12 +53,14 @@ del x.tcov
 del x.useInfections
 del x.useDeaths
 del x.test
+del x.warmStart
+del x.minESS
 
 model_class = import_from( 'epidemics.' + args.compModel, 'Model')
 
 a = model_class( **vars(x) )
 
-a.sample( args.nSamples, args.tcov, args.nGenerations )
+a.sample( args.nSamples, args.tcov, args.nGenerations, warmStart=args.warmStart, minESS=args.minESS )
 
 a.propagate( args.nPropagation )
 
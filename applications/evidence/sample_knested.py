@@ -35,6 +35,8 @@ parser.add_argument('--useInformedPriors', '-uip', action='store_true', help='Us
 parser.add_argument('--plotMeanMedian', dest='plotMeanMedian', action='store_true', default=False, help='Plot mean and median of states.')
 parser.add_argument('--useInfections', '-ui', action='store_true', help='Use infections to fit data.')
 parser.add_argument('--useDeaths', '-ud', action='store_true', help='Use deaths to fit data.')
+parser.add_argument('--warmStart', '-ws', default=None, help='Output folder of a previous run (e.g. with an earlier --lastDay) whose posterior is used as the importance sampling proposal.')
+parser.add_argument('--minESS', type=float, default=0.5, help='Minimum relative effective sample size of the warm start, otherwise sample from scratch.')
 parser.add_argument('--test', action='store_true', help="Test run. Not everything is tested.")
 parser.add_argument('--msg', '-m', type=str, required=True, help="Add a comment.")
 
@@ -58,6 +60,8 @@ del x.nGenerations
 del x.useInfections
 del x.useDeaths
 del x.test
+del x.warmStart
+del x.minESS
 del x.msg
 
 
@@ -66,7 +70,8 @@ model_class = import_from( 'epidemics.' + args.compModel, 'Model')
 a = model_class( **vars(x) )
 
 a.sample_knested(nLiveSamples=args.nSamples, freq=args.nSamples, dlogz=args.dLogz, 
-                 batch=args.batchSize, maxiter=(5 if args.test else 1e9))
+                 batch=args.batchSize, maxiter=(5 if args.test else 1e9),
+                 warmStart=args.warmStart, minESS=args.minESS)
 
 if not args.test:
     a.propagate( args.nPropagation )
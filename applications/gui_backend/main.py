@@ -15,6 +15,7 @@ import argparse
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'build'))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from epidemics.utils.misc import printlog, abort, moving_average
 import libepidemics
@@ -33,76 +34,68 @@ def get_mean_parameters(dataFolder):
     return js['Solver']['Mean Theta']
 
 
-parser = argparse.ArgumentParser()
-aa = parser.add_argument
-aa('--dataFolder', default='data', help='Save all results in this folder')
-aa('--data', nargs='+', type=float, help='Total infected.')
-aa('--dataDays',
-   nargs='+',
-   type=float,
-   help='Days at which `data` is defined, defaults to range(len(data)).')
-aa('--populationSize', type=int, help='Total population.')
-aa('--nSamples', type=int, default=2000, help='Number of samples for TMCMC.')
-aa('--nThreads', type=int, default=1, help='Number of threads.')
-aa('--nPropagate',
-   type=int,
-   default=100,
-   help='Number of points to evaluate the solution in the propagation phase.')
-aa('--nIntervals',
-   type=int,
-   default=100,
-   help='Number of points for computing '
-   'means and credible intervals.')
-aa('--futureDays',
-   '-fd',
-   type=int,
-   default=2,
-   help=
-   'Propagate that many days in future, after the time of observation of the last data.'
-   )
-aa('--percentages',
-   nargs='+',
-   type=float,
-   default=[0.5, 0.9],
-   help='Percentages for confidence intervals.')
-aa('--duration',
-   type=float,
-   default=10,
-   help='Duration of applying the  intervention.')
-aa('--silent', action='store_true', help='No output on screen.')
-aa('--moving_average',
-   type=int,
-   default=0,
-   help='Half-width of moving average window applied to data.')
-aa('--infer_duration',
-   action='store_true',
-   help='Infer the duration of intervention from the data.')
-aa('--configure',
-   action='store_true',
-   help='Configure the model and save in dataFolder.')
-aa('--sample', action='store_true', help='Sample model saved in dataFolder')
-aa('--propagate',
-   action='store_true',
-   help='Propagate model saved in dataFolder')
-aa('--intervals',
-   action='store_true',
-   help='Compute intervals for model saved in dataFolder')
-args = parser.parse_args()
-
-dataFolder = os.path.join(os.path.abspath('.'), args.dataFolder) + '/'
-statefile = os.path.join(dataFolder, 'state.pickle')
-
-from model import Model
-
-os.makedirs(dataFolder, exist_ok=True)
-
-if not any([args.configure, args.sample, args.propagate, args.intervals]):
-    args.configure = True
-    args.sample = True
-    args.propagate = True
-    args.intervals = True
-
-if args.configure:
+def make_parser():
+    parser = argparse.ArgumentParser()
+    aa = parser.add_argument
+    aa('--dataFolder', default='data', help='Save all results in this folder')
+    aa('--data', nargs='+', type=float, help='Total infected.')
+    aa('--dataDays',
+       nargs='+',
+       type=float,
+       help='Days at which `data` is defined, defaults to range(len(data)).')
+    aa('--populationSize', type=int, help='Total population.')
+    aa('--nSamples', type=int, default=2000, help='Number of samples for TMCMC.')
+    aa('--nThreads', type=int, default=1, help='Number of threads.')
+    aa('--nPropagate',
+       type=int,
+       default=100,
+       help='Number of points to evaluate the solution in the propagation phase.')
+    aa('--nIntervals',
+       type=int,
+       default=100,
+       help='Number of points for computing '
+       'means and credible intervals.')
+    aa('--futureDays',
+       '-fd',
+       type=int,
+       default=2,
+       help=
+       'Propagate that many days in future, after the time of observation of the last data.'
+       )
+    aa('--percentages',
+       nargs='+',
+       type=float,
+       default=[0.5, 0.9],
+       help='Percentages for confidence intervals.')
+    aa('--duration',
+       type=float,
+       default=10,
+       help='Duration of applying the  intervention.')
+    aa('--silent', action='store_true', help='No output on screen.')
+    aa('--moving_average',
+       type=int,
+       default=0,
+       help='Half-width of moving average window applied to data.')
+    aa('--infer_duration',
+       action='store_true',
+       help='Infer the duration of intervention from the data.')
+    aa('--configure',
+       action='store_true',
+       help='Configure the model and save in dataFolder.')
+    aa('--sample', action='store_true', help='Sample model saved in dataFolder')
+    aa('--propagate',
+       action='store_true',
+       help='Propagate model saved in dataFolder')
+    aa('--intervals',
+       action='store_true',
+       help='Compute intervals for model saved in dataFolder')
+    return parser
+
+
+def configure(args, dataFolder):
+    """Create the model from the command line arguments."""
+    from model import Model
+
     params_to_infer = ['R0', 'tint', 'kint']
     if args.infer_duration:
         params_to_infer.append('dint')
@@ -127,26 +120,15 @@ if args.configure:
         'params_to_infer': params_to_infer,
         'params_prior': params_prior,
         'params_fixed': params_fixed,
+        'nThreads': args.nThreads,
+        'silent': args.silent,
     }
 
-    model = Model(**kwargs)
-    model.save(statefile)
-else:
-    model = Model.load(statefile)
-
-if args.sample:
-    model.sample(args.nSamples)
-    model.save(statefile)
-else:
-    model = Model.load(statefile)
+    return Model(**kwargs)
 
-if args.propagate:
-    model.propagate(min(model.nSamples, args.nPropagate), args.futureDays)
-    model.save(statefile)
-else:
-    model = Model.load(statefile)
 
-if args.intervals:
+def compute_intervals_json(model, args, dataFolder):
+    """Returns the content of `intervals.json`."""
     from epidemics.epidemics import load_param_samples
     percentages = args.percentages
     vv = dict()
@@ -159,8 +141,8 @@ if args.intervals:
                                                    cumsum=True)
 
     js = dict()
-    js['x-data'] = list(model.data['Model']['x-data'])
-    js['y-data'] = list(np.cumsum(model.data['Model']['y-data']))
+    js['x-data'] = np.asarray(model.data['Model']['x-data']).tolist()
+    js['y-data'] = np.cumsum(model.data['Model']['y-data']).tolist()
     js['Population Size'] = model.populationSize
     js['nSamples'] = model.nSamples
     js['percentages'] = percentages
@@ -173,31 +155,72 @@ if args.intervals:
         k: [(p, m, m) for p in percentages]
         for k, m in mean_params.items()
     }
-    js['intervals_params'].update({
-        k: [
-            (
-                p,  #
-                np.quantile(samples[k], 0.5 - p / 2),  #
-                np.quantile(samples[k], 0.5 + p / 2),  #
-            ) for p in percentages
+    # All quantiles of a parameter in one pass.
+    q = np.array([(0.5 - p / 2, 0.5 + p / 2) for p in percentages])
+    for k in samples.dtype.names:
+        low, high = np.quantile(samples[k], q.T)
+        js['intervals_params'][k] = [
+            (p, l, h) for p, l, h in zip(percentages, low.tolist(), high.tolist())
         ]
-        for k in samples.dtype.names
-    })
 
     for k, v in vv.items():
         t, mean, median, intervals = v
-        js['x-axis'] = list(t)
+        js['x-axis'] = np.asarray(t).tolist()
         r = dict()
         r['Intervals'] = [{
-            "Percentage": float(q[0]),
-            "Low Interval": list(q[1]),
-            "High Interval": list(q[2]),
-        } for q in intervals]
-        r['Mean'] = list(mean)
-        r['Median'] = list(median)
+            "Percentage": float(p),
+            "Low Interval": low.tolist(),
+            "High Interval": high.tolist(),
+        } for p, low, high in intervals]
+        r['Mean'] = mean.tolist()
+        r['Median'] = median.tolist()
         js[k] = r
+    return js
+
+
+def run(args):
+    """Run the stages selected in `args` and return the intervals if computed.
+
+    The model is loaded from `state.pickle` only if the first selected stage
+    is not `configure`, and is passed in memory between the stages.
+    """
+    from model import Model
+
+    dataFolder = os.path.join(os.path.abspath('.'), args.dataFolder) + '/'
+    statefile = os.path.join(dataFolder, 'state.pickle')
+
+    os.makedirs(dataFolder, exist_ok=True)
+
+    if not any([args.configure, args.sample, args.propagate, args.intervals]):
+        args.configure = True
+        args.sample = True
+        args.propagate = True
+        args.intervals = True
+
+    if args.configure:
+        model = configure(args, dataFolder)
+        model.save(statefile)
+    else:
+        model = Model.load(statefile)
+
+    if args.sample:
+        model.sample(args.nSamples)
+        model.save(statefile)
+
+    if args.propagate:
+        model.propagate(min(model.nSamples, args.nPropagate), args.futureDays)
+        model.save(statefile)
+
+    if args.intervals:
+        js = compute_intervals_json(model, args, dataFolder)
+        fn = os.path.join(dataFolder, 'intervals.json')
+        printlog(f'Save intervals in: {fn}')
+        # Written atomically, the file may be read concurrently by `server.py`.
+        with open(fn + '.tmp', 'w') as f:
+            json.dump(js, f, indent=2, sort_keys=True)
+        os.replace(fn + '.tmp', fn)
+        return js
+
 
-    fn = os.path.join(dataFolder, 'intervals.json')
-    printlog(f'Save intervals in: {fn}')
-    with open(fn, 'w') as f:
-        json.dump(js, f, indent=2, sort_keys=True)
+if __name__ == '__main__':
+    run(make_parser().parse_args())
@@ -25,6 +25,10 @@ class Model(EpidemicsBase):
                  params_prior=None,
                  params_fixed=None,
                  **kwargs):
+        # The data is given directly, infections only.
+        kwargs.setdefault('observations', ['infections'])
+        kwargs.setdefault('synthetic', True)
+        kwargs.setdefault('dataFile', None)
         super().__init__(**kwargs)
         self.dataTotalInfected = dataTotalInfected
         self.dataDays = dataDays if dataDays else np.arange(
@@ -111,6 +115,45 @@ class Model(EpidemicsBase):
         self.data['Propagation']['x-data'] = np.linspace(0., T, int(T + 1))
         super().propagate(nPropagate)
 
+    def compute_intervals(self, varName, nIntervals, percentages, cumsum=False):
+        """
+        Credible intervals of the negative binomial predictive of a propagated variable.
+
+        varName: `str`
+            Name of the propagated variable.
+        nIntervals: `int`
+            Number of draws per propagated trajectory.
+        percentages: `list(float)`
+            Percentages of the credible intervals.
+        cumsum: `bool`
+            Intervals of the cumulative sum over time.
+        Returns:
+        `tuple(t, mean, median, intervals)`
+            Arrays over time `t`, with `intervals` a list of
+            `(percentage, low, high)`.
+        """
+        m = np.asarray(self.propagatedVariables[varName])
+        r = np.asarray(self.propagatedVariables['Dispersion ' + varName])
+        r = np.maximum(r, 1e-12)
+
+        # All trajectories and draws at once, shape (nIntervals * Np, Nt).
+        samples = np.random.negative_binomial(
+            np.broadcast_to(r, (nIntervals, ) + r.shape),
+            np.broadcast_to(r / (m + r), (nIntervals, ) + r.shape))
+        samples = samples.reshape(-1, m.shape[1]).astype(float)
+        if cumsum:
+            samples = np.cumsum(samples, axis=1)
+
+        q = [0.5]
+        for p in percentages:
+            q += [0.5 - p / 2, 0.5 + p / 2]
+        quantiles = np.quantile(samples, q, axis=0)
+
+        intervals = [(p, quantiles[1 + 2 * i], quantiles[2 + 2 * i])
+                     for i, p in enumerate(percentages)]
+        t = self.data['Propagation']['x-data']
+        return t, samples.mean(axis=0), quantiles[0], intervals
+
     def substitute_inferred(self, p):
         """
         p: `list(float)`
@@ -220,6 +263,6 @@ class Model(EpidemicsBase):
         js['Number of Variables'] = len(js['Variables'])
         js['Length of Variables'] = len(t)
 
-        js['Dispersion'] = [p[-1]] * len(y)
+        js['Dispersion Daily Incidence'] = [p[-1]] * len(y)
 
         s['Saved Results'] = js
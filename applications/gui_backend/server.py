@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+"""
+Persistent backend service for the GUI.
+
+Usage:
+    ./server.py [--port 8000] [--workers 2] [--cacheFolder cache]
+
+Same stages as `main.py`, but without starting a new process per request.
+Requests are run in a pool of worker processes, which import `libepidemics`
+and `numpy` only once. Results are cached in `cacheFolder/<key>/`, where the
+key is a hash of the data and of all options affecting `intervals.json`.
+
+API (JSON over HTTP, localhost only):
+
+    POST /intervals    body: {"data": [...], "populationSize": N, ...}
+        Options are the long options of `main.py` without dashes (e.g.
+        "dataDays", "duration", "nSamples", "percentages"). Returns the
+        content of `intervals.json`, from the cache if available. Identical
+        requests arriving while the first one runs wait for its result.
+
+    GET /status
+        Number of cached, running and completed requests.
+"""
+
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import main
+
+# Options which do not change the result.
+IGNORED_OPTIONS = {'dataFolder', 'nThreads', 'silent', 'configure', 'sample', 'propagate', 'intervals'}
+
+
+def get_args(options):
+    """Returns the arguments of `main.py` with the given options, a dict."""
+    args = main.make_parser().parse_args([])
+    for k, v in options.items():
+        if not hasattr(args, k):
+            raise ValueError(f"Unknown option '{k}'.")
+        setattr(args, k, v)
+    if not args.data or args.populationSize is None:
+        raise ValueError("Options 'data' and 'populationSize' are required.")
+    return args
+
+
+def cache_key(args):
+    """Hash of all options affecting the result."""
+    options = {k: v for k, v in sorted(vars(args).items()) if k not in IGNORED_OPTIONS}
+    return hashlib.sha256(json.dumps(options, sort_keys=True).encode()).hexdigest()[:32]
+
+
+def run_request(args):
+    """Run all stages in `args.dataFolder`. Executed in a worker process."""
+    for stage in ['configure', 'sample', 'propagate', 'intervals']:
+        setattr(args, stage, True)
+    return main.run(args)
+
+
+class Service:
+    """Runs requests in a process pool and caches their results.
+
+    Arguments:
+        cacheFolder: Folder of the results, one subfolder per request.
+        workers: Number of worker processes.
+        nThreads: Number of threads of each request.
+    """
+    def __init__(self, cacheFolder, workers=1, nThreads=1):
+        self.cacheFolder = os.path.abspath(cacheFolder)
+        self.nThreads = nThreads
+        self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        self.lock = threading.Lock()
+        self.running = {}
+        self.stats = {'cached': 0, 'completed': 0, 'failed': 0}
+
+    def intervals(self, options):
+        args = get_args(options)
+        key = cache_key(args)
+        folder = os.path.join(self.cacheFolder, key)
+        fn = os.path.join(folder, 'intervals.json')
+
+        submitted = False
+        with self.lock:
+            if os.path.isfile(fn):
+                self.stats['cached'] += 1
+                with open(fn) as f:
+                    return json.load(f)
+            future = self.running.get(key)
+            if future is None:
+                args.dataFolder = folder
+                args.nThreads = self.nThreads
+                args.silent = True
+                future = self.pool.submit(run_request, args)
+                self.running[key] = future
+                submitted = True
+        # Outside of the lock, the callback runs immediately if already done.
+        if submitted:
+            future.add_done_callback(lambda f: self._done(key, f))
+        return future.result()
+
+    def _done(self, key, future):
+        with self.lock:
+            del self.running[key]
+            self.stats['failed' if future.exception() else 'completed'] += 1
+
+    def status(self):
+        with self.lock:
+            return dict(self.stats, running=len(self.running))
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code, js):
+            body = json.dumps(js).encode()
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/status':
+                self._reply(200, service.status())
+            else:
+                self._reply(404, {'error': f'Unknown path {self.path}'})
+
+        def do_POST(self):
+            if self.path != '/intervals':
+                self._reply(404, {'error': f'Unknown path {self.path}'})
+                return
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                options = json.loads(self.rfile.read(length) or b'{}')
+                self._reply(200, service.intervals(options))
+            except ValueError as e:
+                self._reply(400, {'error': str(e)})
+            except Exception as e:
+                self._reply(500, {'error': repr(e)})
+
+        def log_message(self, format, *args):
+            main.printlog(format % args)
+
+    return Handler
+
+
+def main_server(argv=None):
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--port', type=int, default=8000, help='Port on localhost.')
+    parser.add_argument('--workers', type=int, default=1, help='Number of requests run in parallel.')
+    parser.add_argument('--nThreads', type=int, default=1, help='Number of threads of each request.')
+    parser.add_argument('--cacheFolder', default='cache', help='Folder of the cached results.')
+    args = parser.parse_args(argv)
+
+    service = Service(args.cacheFolder, workers=args.workers, nThreads=args.nThreads)
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), make_handler(service))
+    main.printlog(f'Serving on http://127.0.0.1:{args.port}/, results in {service.cacheFolder}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == '__main__':
+    main_server()
@@ -3,13 +3,19 @@
 # Date:   21/04/2020
 # Email:  mboden@ethz.ch
 
+import os
 import sys
 sys.path.append('../../')
 sys.path.append('../../build')
-from epidemics.utils.misc import import_from
-from epidemics.cantons.data.canton_population import CANTON_LIST
+from epidemics.utils.misc import import_from, load_model
+from epidemics.cantons.data.canton_population import CANTON_LIST, CANTON_LIST_SHORT
+from epidemics.utils.hierarchical import COMPACT_FILE, export_compact, load_korali_samples
+from scheduler import add_scheduler_arguments, run_regions, save_paths
 import argparse
-def run_phase_1(model,region,n_samples,params):
+
+PATHS_FILE = 'phase_1_paths.json'
+
+def run_phase_1(model,region,n_samples,params,plot=True):
 
     model_class = import_from( 'epidemics.' + model, 'Model')
     params['country'] = region
@@ -19,14 +25,35 @@ def run_phase_1(model,region,n_samples,params):
     a.sample(n_samples)
     a.propagate()
     a.save()
+    if plot:
+        a.plot_intervals(ns=20)
+
+def plot_phase_1(model,region,params):
+    a = load_model(os.path.join(params['dataFolder'],region,model,'state.pickle'))
     a.plot_intervals(ns=20)
 
+def phase_1_samples_path(model,region,params):
+    return os.path.abspath(os.path.join(params['dataFolder'],region,model,'_korali_samples','latest'))
+
+def phase_1_compact_path(model,region,params):
+    return os.path.abspath(os.path.join(params['dataFolder'],region,model,COMPACT_FILE))
+
+def export_phase_1(model,region,params,target_ess):
+    ''' Write the compact posterior of the region, read by phases 2 and 3 instead of the Korali state '''
+    names, samples, log_prior, log_likelihood = load_korali_samples(phase_1_samples_path(model,region,params))
+    ess = export_compact(phase_1_compact_path(model,region,params),names,samples,log_prior,log_likelihood,targetESS=target_ess)
+    print('[Phase 1] Exported {}: {} samples, effective sample size {:.1f}'.format(region,len(samples),ess))
+
 if __name__ == "__main__": 
 
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument('--model', '-m', default='country.reparam.sir_int.tnrm', help='Model type')
     parser.add_argument('--regions', '-r', default='cantons', help='Model type')
     parser.add_argument('--dir', '-dir', default='./data/', help='Model type')
+    parser.add_argument('--nSamples', '-ns', type=int, default=2000, help='Number of samples per region.')
+    parser.add_argument('--targetESS', type=int, default=1000, help='Effective sample size of the exported posteriors.')
+    parser.add_argument('--exportOnly', action='store_true', help='Only export the posteriors of existing results.')
+    add_scheduler_arguments(parser, nThreads=12)
 
     args = parser.parse_args()
 
@@ -37,16 +64,38 @@ if __name__ == "__main__":
     elif args.regions == 'cantons_short':
         regions = CANTON_LIST_SHORT
 
-    n_samples = 2000
     params = {'dataFolder': args.dir+model+'/phase_1_results/',
               'preprocess':True,
-              'nThreads': 12,
+              'nThreads': args.nThreads,
               'nPropagation': 30,
               'futureDays': 2,
               'nValidation': 0,
               'percentages': [0.5, 0.95, 0.99],
               'silent': False}
 
-    for region in regions:
-        run_phase_1(model,region,n_samples,params)
+    if args.region and args.plotOnly:
+        plot_phase_1(model,args.region,params)
+    elif args.region:
+        run_phase_1(model,args.region,args.nSamples,params,plot=False)
+        export_phase_1(model,args.region,params,args.targetESS)
+    else:
+        if args.exportOnly:
+            done = []
+            for region in regions:
+                if os.path.isfile(phase_1_samples_path(model,region,params)):
+                    export_phase_1(model,region,params,args.targetESS)
+                    done.append(region)
+        else:
+            done = run_regions(__file__, regions,
+                               ['-m', model, '-dir', os.path.abspath(args.dir)+'/', '-ns', args.nSamples,
+                                '--targetESS', args.targetESS],
+                               logFolder=os.path.join(params['dataFolder'],'_logs'),
+                               nThreads=args.nThreads, cores=args.cores, plot=not args.noPlot)
+
+        # Output of each region, input of phases 2 and 3.
+        save_paths(os.path.join(params['dataFolder'],PATHS_FILE),
+                   {region: {'korali': phase_1_samples_path(model,region,params),
+                             'compact': phase_1_compact_path(model,region,params)} for region in done})
+        if len(done) < len(regions):
+            sys.exit(1)
 
@@ -4,8 +4,11 @@
 import sys
 import os
 import korali
+import numpy as np
 
 sys.path.append('../../')
+from scheduler import load_paths
+from epidemics.utils.hierarchical import COMPACT_FILE, CONDITIONAL_TYPES, PsiLikelihood, load_compact, load_korali_samples
 from epidemics.cantons.data.canton_population import CANTON_LIST, CANTON_LIST_SHORT
 import argparse
 
@@ -20,7 +23,8 @@ def create_folder(name):
 def get_regions(regions):
     ## Select regions
     if args.regions == 'all':
-        regions = [region for region in os.listdir(args.phase_1_path) if not region.startswith('_')]
+        regions = [region for region in os.listdir(args.phase_1_path)
+                   if not region.startswith('_') and os.path.isdir(os.path.join(args.phase_1_path, region))]
         print(regions)
         folder_name = '/all_countries'
     elif args.regions == '/cantons':
@@ -97,10 +101,72 @@ def run_phase_2(phase_1_paths,phase_2_path,variables):
             e["Distributions"][i]["Mean"] = var['name'] + ' Mean'
             e["Distributions"][i]["Standard Deviation"] = var['name'] + ' Std'
         else:
-            print('not implemented yet')
+            raise ValueError("Conditional prior {} of {} is not supported by run_phase_2, "
+                             "use the vectorized evaluator".format(var['cond_type'], var['name']))
 
+    set_hyperparameters(e,variables,distrib_counter=len(variables))
+    set_solver(e,phase_2_path)
+
+    # Starting Korali's Engine and running experiment
+    k = korali.Engine()
+    # k["Conduit"]["Type"] = "Concurrent"
+    # k["Conduit"]["Concurrent Jobs"] = batch
+    # print('Launching Korali')
+    k.run(e)
+
+def get_conditionals(variables):
+    ''' Conditional priors of PsiLikelihood, hyperparameters are numbered in the order of set_hyperparameters '''
+    conditionals = []
+    i = 0
+    for var in variables:
+        cond_params = [ele for ele in list(var.keys()) if ele not in ['name','cond_type']]
+        if var['cond_type'] not in CONDITIONAL_TYPES or len(cond_params) != 2:
+            raise ValueError("Unsupported conditional prior {} of {} with hyperparameters {}".format(
+                var['cond_type'], var['name'], cond_params))
+        conditionals.append((var['cond_type'], i, i+1))
+        i += len(cond_params)
+    return conditionals
+
+def run_phase_2_vectorized(phase_1_paths,phase_2_path,variables,compact_paths=None):
+    ''' Same as run_phase_2, with the Psi likelihood evaluated by PsiLikelihood '''
+
+    names = [var['name'] for var in variables]
+    samples = []
+    log_priors = []
+    log_weights = []
+    for i, path in enumerate(phase_1_paths):
+        # Compact posteriors written by phase_1.py are preferred over full Korali states.
+        if compact_paths and os.path.isfile(compact_paths[i]):
+            print(compact_paths[i])
+            compact = load_compact(compact_paths[i],names)
+            samples.append(compact['values'])
+            log_priors.append(compact['logPrior'])
+            log_weights.append(compact['logWeights'])
+        else:
+            print(path)
+            region_names, region_samples, log_prior, _ = load_korali_samples(path)
+            samples.append(region_samples[:,[region_names.index(name) for name in names]])
+            log_priors.append(log_prior)
+            log_weights.append(np.zeros(len(log_prior)))
+
+    conditionals = get_conditionals(variables)
+    psi_likelihood = PsiLikelihood(samples,log_priors,conditionals,logWeights=log_weights)
+
+    def model(s):
+        s["logLikelihood"] = float(psi_likelihood(np.array(s["Parameters"]))[0])
+
+    e = korali.Experiment()
+    e["Problem"]["Type"] = "Bayesian/Custom"
+    e["Problem"]["Likelihood Model"] = model
+
+    set_hyperparameters(e,variables,distrib_counter=0)
+    set_solver(e,phase_2_path)
+
+    k = korali.Engine()
+    k.run(e)
+
+def set_hyperparameters(e,variables,distrib_counter):
     # Define hyperparameters
-    distrib_counter = len(variables)
     i = 0
     for var in variables:
         cond_params = [ele for ele in list(var.keys()) if ele not in ['name','cond_type']] 
@@ -117,6 +183,9 @@ def run_phase_2(phase_1_paths,phase_2_path,variables):
             e["Distributions"][j]["Maximum"] = var[cond_param][1]
             i += 1
 
+
+def set_solver(e,phase_2_path):
+
     #Solver
     # e["Solver"]["Type"] = "Sampler/TMCMC"
     # e["Solver"]["Population Size"] = 2000
@@ -139,14 +208,7 @@ def run_phase_2(phase_1_paths,phase_2_path,variables):
     e["Console Output"]["Verbosity"] = "Detailed"
     e["File Output"]["Path"] = phase_2_path
     e["File Output"]["Frequency"] = 5000
-    create_folder(phase_2_path)    
-
-    # Starting Korali's Engine and running experiment
-    k = korali.Engine()
-    # k["Conduit"]["Type"] = "Concurrent"
-    # k["Conduit"]["Concurrent Jobs"] = batch
-    # print('Launching Korali')
-    k.run(e)
+    create_folder(phase_2_path)
 
 if __name__ == "__main__":  
 
@@ -155,6 +217,8 @@ if __name__ == "__main__":
     parser.add_argument('--phase_1_path', '-p', default='./data/country.reparam.sir_int.tnrm/phase_1_results', help='Model type')
     parser.add_argument('--regions', '-r', default='all', help='Model type')
     parser.add_argument('--output', '-o', default='same', help='output path')
+    parser.add_argument('--evaluator', '-e', default='vectorized', choices=['vectorized','korali'], help='Evaluator of the Psi likelihood')
+    parser.add_argument('--paths', default=None, help='phase_1_paths.json written by phase_1.py, defaults to the one in phase_1_path if present')
 
     args = parser.parse_args()
     model = args.model
@@ -170,8 +234,21 @@ if __name__ == "__main__":
 
 
     ## Paths
-    phase_1_data = [args.phase_1_path+'/'+region+'/'+model+'/_korali_samples/latest' for region in regions]
+    paths_file = args.paths or os.path.join(args.phase_1_path, 'phase_1_paths.json')
+    if os.path.isfile(paths_file):
+        paths = load_paths(paths_file)
+        missing = [region for region in regions if region not in paths]
+        if missing:
+            print('Skipping regions without phase 1 results: {}'.format(missing))
+        phase_1_data = [paths[region]['korali'] for region in regions if region in paths]
+        compact_data = [paths[region]['compact'] for region in regions if region in paths]
+    else:
+        phase_1_data = [args.phase_1_path+'/'+region+'/'+model+'/_korali_samples/latest' for region in regions]
+        compact_data = [args.phase_1_path+'/'+region+'/'+model+'/'+COMPACT_FILE for region in regions]
     phase_2_path = output_path + '/_hierarchical/'+model+'/'+folder_name+'/phase_2_results/_korali_samples'
     print(phase_2_path)
 
-    run_phase_2(phase_1_data,phase_2_path,variables)
+    if args.evaluator == 'vectorized':
+        run_phase_2_vectorized(phase_1_data,phase_2_path,variables,compact_data)
+    else:
+        run_phase_2(phase_1_data,phase_2_path,variables)
@@ -10,16 +10,24 @@ import os
 sys.path.append('../../')
 sys.path.append('../../build')
 
-from epidemics.utils.misc import import_from
+from epidemics.utils.misc import import_from, load_model
 from epidemics.cantons.data.canton_population import CANTON_LIST, CANTON_LIST_SHORT
+from epidemics.utils.hierarchical import COMPACT_FILE, export_compact, load_compact, load_korali_samples, theta_log_weights
+from epidemics.utils.warm_start import importance_resample
+from scheduler import add_scheduler_arguments, run_regions
+from phase_2 import get_conditionals, get_variables
 
 def create_folder(name):
     if not os.path.exists(name):
         os.makedirs(name)
 
-def get_regions(regions):
-    ## Select regions
-    if regions == '/cantons':
+def get_regions(regions, phase_1_path):
+    ## Select regions, as in phase_2.py
+    if regions == 'all':
+        regions = [region for region in os.listdir(phase_1_path)
+                   if not region.startswith('_') and os.path.isdir(os.path.join(phase_1_path, region))]
+        folder_name = '/all_countries'
+    elif regions == '/cantons':
         regions = CANTON_LIST
         folder_name = 'cantons'
     elif regions == '/cantons_short':
@@ -65,13 +73,28 @@ def sampling(phase_1_path,phase_2_path,phase_3_path):
     # k["Conduit"]["Concurrent Jobs"] = 12
     k.run(e)
 
-def propagation(model,region,phase_3_path):
+def sampling_compact(compact_path,phase_2_path,phase_3_path,variables,target_ess):
+    ''' Phase 3 posterior by reweighting the compact phase 1 posterior with the phase 2 samples '''
+
+    names = [var['name'] for var in variables]
+    compact = load_compact(compact_path,names)
+    _, psi_samples, _, _ = load_korali_samples(phase_2_path)
+
+    log_weights = theta_log_weights(compact['values'],compact['logPrior'],psi_samples,
+                                    get_conditionals(variables),logWeights=compact['logWeights'])
+
+    create_folder(phase_3_path)
+    ess = export_compact(os.path.join(phase_3_path,COMPACT_FILE),names,compact['values'],
+                         compact['logPrior'],compact['logLikelihood'],log_weights,targetESS=target_ess)
+    print('Effective sample size: {:.1f}'.format(ess))
+
+def propagation(model,region,phase_3_path,nThreads=12,plot=True):
     n_samples = 1
 
     dataFolder = phase_3_path
     params = {'dataFolder': dataFolder,
               'preprocess':True,
-              'nThreads': 12,
+              'nThreads': nThreads,
               'nPropagation': 100,
               'futureDays': 2,
               'nValidation': 0,
@@ -82,9 +105,24 @@ def propagation(model,region,phase_3_path):
     params['country'] = region
     a = model_class(**params)
 
-    a.load_parameters(phase_3_path+'/_korali_samples/')
-    a.propagate()
+    compact_path = os.path.join(phase_3_path,COMPACT_FILE)
+    if os.path.isfile(compact_path):
+        compact = load_compact(compact_path)
+        idx, _, _ = importance_resample(compact['logWeights'],len(compact['logWeights']))
+        a.parameters = [{'Name': name, 'Values': compact['values'][idx,j]} for j, name in enumerate(compact['names'])]
+        a.nParameters = len(a.parameters)
+        a.nSamples = len(idx)
+        a.has_been_called['sample'] = True
+    else:
+        a.load_parameters(phase_3_path+'/_korali_samples/')
+    # Compact posteriors may have fewer samples than the default of propagate.
+    a.propagate(min(a.nSamples, 1000))
     a.save()
+    if plot:
+        a.plot_intervals(ns=20)
+
+def plot_propagation(model,region,phase_3_path):
+    a = load_model(os.path.join(phase_3_path,region,model,'state.pickle'))
     a.plot_intervals(ns=20)
 
 if __name__ == "__main__":  
@@ -94,39 +132,66 @@ if __name__ == "__main__":
     parser.add_argument('--regions', '-r', default='all', help='Model type')
     parser.add_argument('--phase_1_path', '-p', default='./data/country.reparam.sir_int.tnrm/phase_1_results', help='Model type')
     parser.add_argument('--output', '-o', default='same', help='output path')
+    parser.add_argument('--propagate', action='store_true', help='Propagate the phase 3 samples of each region.')
+    parser.add_argument('--theta', default='compact', choices=['compact','korali'], help='Reweight the compact phase 1 posteriors or run Korali Hierarchical/Theta')
+    parser.add_argument('--targetESS', type=int, default=1000, help='Effective sample size of the exported posteriors.')
+    add_scheduler_arguments(parser, nThreads=1)
 
     args = parser.parse_args()
     model = args.model
 
-    regions,folder_name = get_regions(args.regions)
+    regions,folder_name = get_regions(args.regions,args.phase_1_path)
 
     if args.output == 'same':
         output_path = args.phase_1_path
     else:
         output_path = args.output
 
-    phase_2_path = args.phase_1_path + '/_hierarchical/'+model+folder_name+'/phase_2_results/_korali_samples_tmcmc/latest'
+    if args.theta == 'compact':
+        # Output of phase_2.py with the same phase_1_path.
+        phase_2_path = args.phase_1_path + '/_hierarchical/'+model+'/'+folder_name+'/phase_2_results/_korali_samples/latest'
+    else:
+        phase_2_path = args.phase_1_path + '/_hierarchical/'+model+folder_name+'/phase_2_results/_korali_samples_tmcmc/latest'
     # phase_2_path = 'test_daniel' + '/_hierarchical/'+model+'/'+folder_name+'/phase_2_results/_korali_samples/latest'
 
 
-    for region in regions:
-        print('Processing {}'.format(region))
-
+    def get_paths(region):
         phase_1_path = args.phase_1_path+'/'+region+'/'+model+'/_korali_samples/latest'
         phase_3_path = output_path + '/_hierarchical/'+model+'/'+folder_name+'/phase_3_results/'+region
         # phase_3_path = 'test_daniel' + '/_hierarchical/'+model+'/'+folder_name+'/phase_3_results/'+region
+        return phase_1_path, phase_3_path
 
-        print('Phase 1: {}'.format(phase_1_path))
-        print('Phase 2: {}'.format(phase_2_path))
-        print('Phase 3: {}'.format(phase_3_path))
-
-        sampling(phase_1_path,phase_2_path,phase_3_path)
-
-        # propagation(model,region,phase_3_path)
-
+    if args.region and args.plotOnly:
+        plot_propagation(model,args.region,get_paths(args.region)[1])
 
+    elif args.region:
+        region = args.region
+        print('Processing {}'.format(region))
 
+        phase_1_path, phase_3_path = get_paths(region)
 
+        print('Phase 1: {}'.format(phase_1_path))
+        print('Phase 2: {}'.format(phase_2_path))
+        print('Phase 3: {}'.format(phase_3_path))
 
+        if args.theta == 'compact':
+            compact_path = args.phase_1_path+'/'+region+'/'+model+'/'+COMPACT_FILE
+            sampling_compact(compact_path,phase_2_path,phase_3_path,get_variables(model),args.targetESS)
+        else:
+            sampling(phase_1_path,phase_2_path,phase_3_path)
 
+        if args.propagate:
+            propagation(model,region,phase_3_path,nThreads=args.nThreads,plot=False)
 
+    else:
+        # The regions are passed one by one, the paths must not depend on the working directory.
+        forward = ['-m', model, '-r', args.regions, '-p', os.path.abspath(args.phase_1_path),
+                   '-o', os.path.abspath(output_path), '--theta', args.theta, '--targetESS', args.targetESS]
+        if args.propagate:
+            forward.append('--propagate')
+        done = run_regions(__file__, regions, forward,
+                           logFolder=output_path + '/_hierarchical/'+model+'/'+folder_name+'/phase_3_results/_logs',
+                           nThreads=args.nThreads, cores=args.cores,
+                           plot=args.propagate and not args.noPlot)
+        if len(done) < len(regions):
+            sys.exit(1)
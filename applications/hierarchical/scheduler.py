@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+"""
+Run the per-region work of a hierarchical phase concurrently.
+
+Each region is a separate process (`script ... --region REGION`) using
+`nThreads` cores, and as many regions as fit into `cores` run at the same
+time. Plotting is deferred to a second stage, run after all regions have
+been sampled, at a lower priority.
+"""
+
+import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from epidemics.campaign import Task, run_tasks
+
+PLOT_NICENESS = 10
+
+
+def add_scheduler_arguments(parser, nThreads):
+    parser.add_argument('--nThreads', '-nt', type=int, default=nThreads, help='Number of threads per region.')
+    parser.add_argument('--cores', type=int, default=None, help='Number of available cores, defaults to all.')
+    parser.add_argument('--noPlot', action='store_true', help='Skip the plotting stage.')
+    parser.add_argument('--region', default=None, help='Run a single region in this process.')
+    parser.add_argument('--plotOnly', action='store_true', help='Only plot the results of --region.')
+
+
+def run_regions(script, regions, args, logFolder, nThreads, cores=None, plot=True):
+    """Run `script` once per region and return the list of regions which succeeded.
+
+    Arguments:
+        script: Path of the phase script.
+        regions: List of regions.
+        args: Command line arguments passed to every region.
+        logFolder: Folder of the output files `<region>.out` and `<region>.plot.out`.
+        nThreads: Number of threads of each region.
+        cores: (optional) Number of available cores, defaults to all.
+        plot: (optional) Run the plotting stage.
+    """
+    script = os.path.abspath(script)
+    command = [sys.executable, script] + [str(arg) for arg in args] + ['--nThreads', str(nThreads)]
+
+    def report(task, returncode, wallTime):
+        print(f'[Epidemics] Finished {task.name} in {wallTime:.1f}s (return code {returncode}).', flush=True)
+
+    tasks = [Task(region, [command + ['--region', region]], nThreads=nThreads,
+                  log=os.path.join(logFolder, region + '.out'), cwd=os.path.dirname(script))
+             for region in regions]
+    print(f'[Epidemics] Running {len(tasks)} regions with {nThreads} threads each.', flush=True)
+    returncodes = run_tasks(tasks, cores=cores, onFinish=report)
+    done = [region for region in regions if returncodes.get(region) == 0]
+
+    if plot and done:
+        tasks = [Task(region + ' (plot)', [command + ['--region', region, '--plotOnly']],
+                      log=os.path.join(logFolder, region + '.plot.out'),
+                      cwd=os.path.dirname(script), nice=PLOT_NICENESS)
+                 for region in done]
+        print(f'[Epidemics] Plotting {len(tasks)} regions.', flush=True)
+        run_tasks(tasks, cores=cores, onFinish=report)
+
+    failed = [region for region in regions if region not in done]
+    if failed:
+        print(f'[Epidemics] Failed regions: {failed}, see the logs in {logFolder}.', flush=True)
+    return done
+
+
+def save_paths(fileName, paths):
+    """Store the dict {region: output files} consumed by the next phases."""
+    os.makedirs(os.path.dirname(os.path.abspath(fileName)), exist_ok=True)
+    with open(fileName, 'w') as f:
+        json.dump(paths, f, indent=2)
+    print(f'[Epidemics] Paths of {len(paths)} regions saved to {fileName}.', flush=True)
+
+
+def load_paths(fileName):
+    with open(fileName) as f:
+        return json.load(f)
@@ -24,6 +24,15 @@ class Data:
     """
     beta_corr_regions = dict()
 
+    """
+    Aggregation of model regions to observed regions.
+    `numpy.ndarray` or `scipy.sparse` matrix, (n_observed, n_regions)
+    If set, `total_infected`, `name` and `fit_importance` refer to the
+    observed regions and all other fields to the model regions,
+    e.g. municipalities observed as cantons.
+    """
+    aggregation = None
+
 def moving_average(x, w):
     """
     x: `numpy.ndarray`, (N)
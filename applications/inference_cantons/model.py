@@ -1,4 +1,5 @@
 import numpy as np
+import scipy.sparse
 from epidemics.utils.misc import save_file
 from epidemics.epidemics import EpidemicsBase
 
@@ -8,6 +9,59 @@ from ode import Ode
 def repeat(v, numRegions):
     return list(np.array([v] * numRegions).T.flatten())
 
+
+def _frozen(a, dtype=float):
+    """Returns a read-only copy of `a`."""
+    a = np.array(a, dtype=dtype)
+    a.flags.writeable = False
+    return a
+
+
+class Design:
+    """
+    Immutable data of `Model`, built once from `Model.data` such that
+    evaluations only need to fill in the parameters being inferred.
+    """
+    aggregation = None
+
+    def __init__(self, data, n_regions):
+        m = data['Model']
+        K = n_regions
+        self.y0 = _frozen(m['Initial Condition'])
+        # Design entries of the `params` dict passed to `Ode`.
+        self.params = {
+            'N': _frozen(m['Population Size']),
+            'C': _frozen(m['Commute Matrix']),
+            'Qa': _frozen(m['Infected Commuters Airports']),
+            'Qb': _frozen(m['Infected Commuters Borders']),
+            'beta_corr_regions': {
+                var: _frozen(regions, dtype=int)
+                for var, regions in m['beta_corr_regions'].items()
+            },
+        }
+        # Aggregation of the model regions to the K observed regions.
+        P = m.get('Aggregation')
+        self.aggregation = None if P is None else scipy.sparse.csr_matrix(P, dtype=float)
+        F = np.asarray(m['Fit Importance'], dtype=float)
+
+        # Times of the model output, including the time before the first
+        # data point needed to compute daily increments.
+        t = np.asarray(m['x-data'])[::K]
+        assert min(t) - 1 >= 0
+        self.t_eval = _frozen(np.concatenate(([min(t) - 1], t)))
+        self.t_span = [0, max(t)]
+        # Dispersion per unit [r], layout [day][region] as 'y-data'.
+        self.dispersion = _frozen(np.tile(F, len(t)))
+
+        t = np.asarray(data['Propagation']['x-data'])[::K]
+        assert min(t) >= 0
+        self.t_eval_propagation = _frozen(t)
+        self.t_span_propagation = [0, max(t)]
+        dispersion = np.ones(len(t))
+        for i in range(K):
+            dispersion[i::K] *= F[i]
+        self.dispersion_propagation = _frozen(dispersion)
+
 class Model(EpidemicsBase):
     def __init__(self,
                  data: Data,
@@ -30,6 +84,15 @@ class Model(EpidemicsBase):
 
         super().__init__(**kwargs)
 
+        if self.sampler in ('mTMCMC', 'HMC'):
+            if type(ode).solve_S_I_Icum_grad is Ode.solve_S_I_Icum_grad:
+                raise ValueError("Sampler {:} needs derivatives, not implemented by {:}.".format(
+                    self.sampler, type(ode).__name__))
+            no_grad = set(getattr(ode, 'params_no_grad', ())) & set(params_to_infer)
+            if no_grad:
+                raise ValueError("Sampler {:} needs derivatives, not available for {:}.".format(
+                    self.sampler, sorted(no_grad)))
+
         self.process_data(data)
 
     def save_data_path(self):
@@ -39,7 +102,7 @@ class Model(EpidemicsBase):
         Itotal = np.array(data.total_infected)  # shape (n_regions, nt)
         t = np.array(data.time)
         N = np.array(data.population)
-        I0 = Itotal[:, 0] * 0  # XXX
+        I0 = N * 0  # XXX
         #I0 = Itotal[:, 0] * 0 + 1 # XXX
         S0 = N - I0
         y0 = S0, I0
@@ -86,6 +149,10 @@ class Model(EpidemicsBase):
 
         self.data['Model']['beta_corr_regions'] = data.beta_corr_regions
 
+        if data.aggregation is not None:
+            assert data.aggregation.shape == (self.n_regions, len(N))
+        self.data['Model']['Aggregation'] = data.aggregation
+
         T = np.ceil(t[-1])
         self.data['Propagation']['x-data'] = repeat(
             np.linspace(1, T, int(T + 1)), self.n_regions)
@@ -93,6 +160,15 @@ class Model(EpidemicsBase):
         save_file(self.data, self.saveInfo['inference data'],
                   'Data for Inference', 'pickle')
 
+        self._design = Design(self.data, self.n_regions)
+
+    @property
+    def design(self):
+        """The frozen `Design`, rebuilt if missing (e.g. in old pickles)."""
+        if getattr(self, '_design', None) is None:
+            self._design = Design(self.data, self.n_regions)
+        return self._design
+
     def get_variables_and_distributions(self):
         p = self.params_to_infer + ['[r]']
         js = {}
@@ -124,66 +200,67 @@ class Model(EpidemicsBase):
         k += 1
         return js
 
-    def get_params(self, korali_p, N, C, Qa, Qb, beta_corr_regions):
+    def get_params(self, korali_p):
         """
-        N: `array_like`, (n_regions)
-        Population of regions.
-        C: `array_like`, (n_regions,n_regions)
-        Commute matrix.
+        Returns the `params` dict for `Ode` with the fixed parameters,
+        the design data and the inferred parameters `korali_p`.
         """
-        params = dict(self.ode.params_fixed.items())
-        for i, name in enumerate(self.params_to_infer):
-            params[name] = korali_p[i]
-        params['N'] = np.array(N)
-        params['C'] = np.array(C)
-        params['Qa'] = np.array(Qa)
-        params['Qb'] = np.array(Qb)
-        params['beta_corr_regions'] = beta_corr_regions
+        params = dict(self.ode.params_fixed)
+        params.update(self.design.params)
+        params.update(zip(self.params_to_infer, korali_p))
         return params
 
+    def _solve_Icum(self, params, t_span, t_eval):
+        """
+        Returns the cumulative infected of the observed regions,
+        aggregated inside the solver if the model regions differ.
+        """
+        d = self.design
+        if d.aggregation is not None:
+            return self.ode.solve_Icum_aggregated(params, t_span, d.y0, t_eval, d.aggregation)
+        _, _, Icum = self.ode.solve_S_I_Icum(params, t_span, d.y0, t_eval)
+        return Icum
+
     def computational_model(self, s):
         p = s['Parameters']
-        t = self.data['Model']['x-data']
-        y0 = self.data['Model']['Initial Condition']
-        N = self.data['Model']['Population Size']
-        C = self.data['Model']['Commute Matrix']
-        Qa = self.data['Model']['Infected Commuters Airports']
-        Qb = self.data['Model']['Infected Commuters Borders']
-        beta_corr_regions = self.data['Model']['beta_corr_regions']
-        F = self.data['Model']['Fit Importance']
-
-        tt1 = [min(t) - 1] + list(t[0::self.n_regions])
-        assert min(tt1) >= 0
-
-        params = self.get_params(p, N, C, Qa, Qb, beta_corr_regions)
-        _, _, Icum = self.ode.solve_S_I_Icum(params, [0, max(t)], y0, tt1)
-        # S: shape (n_regions, nt)
+        d = self.design
+
+        params = self.get_params(p)
+        if self.sampler in ('mTMCMC', 'HMC'):
+            (_, _, Icum), (_, _, dIcum) = self.ode.solve_S_I_Icum_grad(
+                params, d.t_span, d.y0, d.t_eval, self.params_to_infer)
+            if d.aggregation is not None:
+                Icum = d.aggregation @ Icum
+                dIcum = (d.aggregation @ dIcum.reshape(dIcum.shape[0], -1)).reshape(
+                    (self.n_regions,) + dIcum.shape[1:])
+        else:
+            Icum = self._solve_Icum(params, d.t_span, d.t_eval)
+        # Icum: shape (n_regions, nt)
         Idaily = np.diff(Icum, axis=1)  # shape (n_regions, nt-1)
         Idaily = Idaily.T  # shape (nt-1, n_regions)
-        Idaily = list(Idaily.flatten())
 
-        s['Reference Evaluations'] = Idaily
-        dispersion = np.ones(len(Idaily)) * p[-1]
-        for i in range(self.n_regions):
-            dispersion[i::self.n_regions] *= F[i]
-        s['Dispersion'] = list(dispersion)
+        s['Reference Evaluations'] = Idaily.flatten().tolist()
+        s['Dispersion'] = (d.dispersion * p[-1]).tolist()
+
+        if self.sampler in ('mTMCMC', 'HMC'):
+            # Derivatives with respect to all variables, the last is [r].
+            n = Idaily.size
+            # dIcum: shape (n_regions, nt, n_params), layout [day][region] as 'y-data'
+            dIdaily = np.diff(dIcum, axis=1).transpose(1, 0, 2)
+            grad_mean = np.zeros((n, len(p)))
+            grad_mean[:, :-1] = dIdaily.reshape(n, -1)
+            grad_dispersion = np.zeros((n, len(p)))
+            grad_dispersion[:, -1] = d.dispersion
+            s['Gradient Mean'] = grad_mean.tolist()
+            s['Gradient Dispersion'] = grad_dispersion.tolist()
 
     def computational_model_propagate(self, s):
         p = s['Parameters']
-        t = self.data['Propagation']['x-data']
-        y0 = self.data['Model']['Initial Condition']
-        N = self.data['Model']['Population Size']
-        C = self.data['Model']['Commute Matrix']
-        Qa = self.data['Model']['Infected Commuters Airports']
-        Qb = self.data['Model']['Infected Commuters Borders']
-        beta_corr_regions = self.data['Model']['beta_corr_regions']
-        F = self.data['Model']['Fit Importance']
-
-        t1 = list(t[0::self.n_regions])
-        assert min(t1) >= 0
-
-        params = self.get_params(p, N, C, Qa, Qb, beta_corr_regions)
-        _, _, Icum = self.ode.solve_S_I_Icum(params, [0, max(t)], y0, t1)
+        d = self.design
+        t1 = d.t_eval_propagation
+
+        params = self.get_params(p)
+        Icum = self._solve_Icum(params, d.t_span_propagation, t1)
         # S: shape (n_regions, nt)
         # shape (n_regions, nt-1)
         Idaily = np.diff(Icum, axis=1)
@@ -203,10 +280,7 @@ class Model(EpidemicsBase):
         js['Number of Variables'] = len(js['Variables'])
         js['Length of Variables'] = len(t1)
 
-        dispersion = np.ones(len(t1)) * p[-1]
-        for i in range(self.n_regions):
-            dispersion[i::self.n_regions] *= F[i]
-        js['Dispersion'] = list(dispersion)
+        js['Dispersion'] = list(d.dispersion_propagation * p[-1])
 
         s['Saved Results'] = js
 
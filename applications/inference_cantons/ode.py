@@ -2,7 +2,8 @@ from scipy.integrate import solve_ivp
 import numpy as np
 
 # also appends `sys.path` by `build/`
-from epidemics.cantons.py.model import PyDesignParameters
+from epidemics.cantons.py.model import PyDesignParameters, make_cpp_aggregation
+from epidemics.utils.autodiff import cantons_custom_derivatives
 import libepidemics.cantons.sei_c as sei_c
 
 
@@ -57,6 +58,35 @@ class Ode:
         """
         raise NotImplementedError()
 
+    def solve_Icum_aggregated(self, params, t_span, si0, t_eval, P):
+        """
+        Same as `solve_S_I_Icum` but returns only the cumulative infected
+        aggregated to groups of regions.
+
+        P: `scipy.sparse.csr_matrix`, (n_groups, n_regions)
+            Aggregation matrix.
+        Returns:
+        Icum: `array_like`, (n_groups, nt)
+            Aggregated cumulative infected.
+        """
+        _, _, Icum = self.solve_S_I_Icum(params, t_span, si0, t_eval)
+        return P @ Icum
+
+    def solve_S_I_Icum_grad(self, params, t_span, si0, t_eval, names):
+        """
+        Same as `solve_S_I_Icum` but also returns the derivatives
+        of the solution with respect to parameters `names`.
+
+        names: `list` of `str`
+            Parameters to differentiate with respect to.
+        Returns:
+        s_i_icum: `array_like`, (3, n_regions, nt)
+            Solution.
+        grad: `array_like`, (3, n_regions, nt, len(names))
+            Derivatives of the solution.
+        """
+        raise NotImplementedError()
+
 
 class Sir(Ode):
     params_fixed = {'R0': 1.002, 'gamma': 60.}
@@ -161,46 +191,187 @@ class Seir(Ode):
 
 
 class SeirCpp(Seir):
-    def solve(self, params, t_span, y0, t_eval):
-        beta = params['R0'] / params['D']
-        N = params['N']
-        keys = list(map(str, range(len(N))))
-        Cij = np.array(params['C'])
-        Mij = np.zeros_like(Cij)
+    # Order of `sei_c.Parameters`.
+    cpp_param_names = ['beta', 'nu', 'Z', 'D', 'tact', 'kbeta']
+    # Parameters without derivatives in `solve_grad`. `tact` switches
+    # beta by a step in time, its derivative is zero almost everywhere.
+    params_no_grad = ('tact',)
 
-        y0 = np.array(y0).astype(float)
-        n_vars = 3
-        assert y0.shape[0] == n_vars
-        n_regions = y0.shape[1]
-        n_days = int(max(t_span)) + 1
+    def __init__(self):
+        super().__init__()
+        # Solver with resident design data, see `get_solver`.
+        self._solver = None
+        self._solver_N = None
+        self._solver_C = None
+        # Aggregation for `solve_Icum_aggregated`, see `get_aggregation`.
+        self._aggregation = None
+        self._aggregation_P = None
 
-        dp = PyDesignParameters(keys, N, Mij, Cij)
-        src = np.zeros(n_regions)
-        src += params['theta_a'] * np.array(params['Qa'])
-        src += params['theta_b'] * np.array(params['Qb'])
-        dp.ext_com_Iu = [src] * n_days
-        dp.Ui = [0] * n_regions
-        for var in ['beta_corr' + str(i) for i in range(26)]:
-            for i in params["beta_corr_regions"].get(var, []):
-                dp.Ui[i] = params[var]
+    def __getstate__(self):
+        # The C++ objects cannot be pickled, they are recreated on demand.
+        state = self.__dict__.copy()
+        state['_solver'] = None
+        state['_aggregation'] = None
+        state['_aggregation_P'] = None
+        return state
 
-        solver = sei_c.Solver(dp.to_cpp())
+    def get_solver(self, N, C):
+        """
+        Returns a `sei_c.Solver` for the given population and commute matrix.
+        The solver is reused while `N` and `C` are unchanged, only the
+        source terms and `Ui` are updated on every evaluation.
+        N: `array_like`, (n_regions)
+            Population of regions.
+        C: `array_like`, (n_regions, n_regions)
+            Commute matrix.
+        """
+        if self._solver is None or \
+                not np.array_equal(self._solver_N, N) or \
+                not np.array_equal(self._solver_C, C):
+            N = np.array(N, dtype=float)
+            C = np.array(C, dtype=float)
+            keys = list(map(str, range(len(N))))
+            dp = PyDesignParameters(keys, N, np.zeros_like(C), C)
+            self._solver = sei_c.Solver(dp.to_cpp())
+            self._solver_N = N
+            self._solver_C = C
+        return self._solver
+
+    def get_aggregation(self, P):
+        """
+        Returns the `libepidemics.cantons.Aggregation` of the matrix `P`,
+        reused while the same matrix object is passed.
+        """
+        if self._aggregation is None or self._aggregation_P is not P:
+            self._aggregation = make_cpp_aggregation(P)
+            self._aggregation_P = P
+        return self._aggregation
+
+    def _prepare(self, params, t_span, t_eval, n_regions):
+        """
+        Updates the solver with the design data and the regional parameters
+        and returns the solver, the model parameters and the shifted times.
+        """
+        n_days = int(max(t_span)) + 1
+        solver = self.get_solver(params['N'], params['C'])
+        src = params['theta_a'] * np.asarray(params['Qa'], dtype=float) + \
+              params['theta_b'] * np.asarray(params['Qb'], dtype=float)
+        solver.set_ext_com_iu(np.broadcast_to(src, (n_days, n_regions)))
+        Ui = np.zeros(n_regions)
+        for var, regions in params["beta_corr_regions"].items():
+            Ui[regions] = params[var]
+        solver.set_Ui(Ui)
 
         p = sei_c.Parameters(
-                beta=beta,
+                beta=params['R0'] / params['D'],
                 nu=params['nu'],
                 Z=params['Z'],
                 D=params['D'],
                 tact=params['tact'],
                 kbeta=params['kbeta'])
-        sol = solver.solve(p, sei_c.State(y0.flatten()), range(1, n_days + 1))
+        # The C++ model time is shifted by one day with respect to `t`,
+        # the initial state `y0` is given at `t_span[0]`.
+        t_cpp = [t_span[0] + 1] + [t + 1 for t in t_eval]
+        return solver, p, t_cpp
 
-        y = np.zeros((n_vars, n_regions, len(t_eval)))
+    def solve(self, params, t_span, y0, t_eval):
+        y0 = np.array(y0).astype(float)
+        n_vars = 3
+        assert y0.shape[0] == n_vars
+        n_regions = y0.shape[1]
 
-        for i, t in enumerate(t_eval):
-            q = min(len(sol) - 1, int(len(sol) * t / n_days))
-            y[0, :, i] = sol[q].S()
-            y[1, :, i] = sol[q].E()
-            y[2, :, i] = sol[q].I()
+        solver, p, t_cpp = self._prepare(params, t_span, t_eval, n_regions)
+        y = solver.solve_array(p, sei_c.State(y0.flatten()), t_cpp,
+                               dense_output=True)
+        return y[:, :, 1:]
 
-        return y
+    def solve_Icum_aggregated(self, params, t_span, si0, t_eval, P):
+        """
+        Aggregates S and E inside the C++ solve, only the group-level
+        series are returned to Python.
+        """
+        S0, I0 = np.array(si0).astype(float)
+        y0 = np.concatenate((S0, np.zeros_like(S0), I0))
+        solver, p, t_cpp = self._prepare(params, t_span, t_eval, len(S0))
+        S, E = solver.solve_aggregated(p, sei_c.State(y0), t_cpp,
+                                       self.get_aggregation(P), [0, 1],
+                                       dense_output=True)[:, :, 1:]
+        N = P @ np.asarray(params['N'], dtype=float)
+        return N[:, None] - S - E
+
+    def solve_grad(self, params, t_span, y0, t_eval, names):
+        """
+        Same as `solve` but also returns the derivatives of the solution
+        with respect to parameters `names`, computed with forward-mode
+        automatic differentiation. Parameters `beta_corr*` enter through
+        the per-region `Ui`, `theta_a` and `theta_b` through the external
+        infected commuters. Raises `ValueError` for `params_no_grad`.
+
+        Returns:
+        y: `array_like`, (n_vars, n_regions, nt)
+            Solution.
+        grad: `array_like`, (n_vars, n_regions, nt, len(names))
+            Derivatives of the solution.
+        """
+        no_grad = [name for name in names if name in self.params_no_grad]
+        if no_grad:
+            raise ValueError("No derivatives with respect to {:}, use a "
+                             "sampler without gradients.".format(no_grad))
+        y0 = np.array(y0).astype(float)
+        n_vars = 3
+        assert y0.shape[0] == n_vars
+        n_regions = y0.shape[1]
+        n_days = int(max(t_span)) + 1
+
+        solver, p, t_cpp = self._prepare(params, t_span, t_eval, n_regions)
+
+        # Variable which sets `Ui` of each region, the last one as in
+        # `_prepare` if groups of regions overlap.
+        Ui_owner = np.full(n_regions, None, dtype=object)
+        for var, regions in params["beta_corr_regions"].items():
+            Ui_owner[regions] = var
+
+        # Derivatives of the model parameters, `Ui` and the source terms
+        # with respect to `names`.
+        R0 = params['R0']
+        D = params['D']
+        params_der = np.zeros((len(self.cpp_param_names), len(names)))
+        Ui_der = np.zeros((n_regions, len(names)))
+        src_der = np.zeros((n_regions, len(names)))
+        for k, name in enumerate(names):
+            if name == 'R0':
+                params_der[0, k] = 1 / D
+            elif name == 'D':
+                params_der[0, k] = -R0 / D ** 2
+                params_der[3, k] = 1
+            elif name in ('nu', 'Z', 'kbeta'):
+                params_der[self.cpp_param_names.index(name), k] = 1
+            elif name == 'theta_a':
+                src_der[:, k] = params['Qa']
+            elif name == 'theta_b':
+                src_der[:, k] = params['Qb']
+            elif name in params['beta_corr_regions']:
+                Ui_der[Ui_owner == name, k] = 1
+            else:
+                raise ValueError("Unknown parameter '{:}'.".format(name))
+        solver.set_design_derivatives(
+                Ui_der, np.broadcast_to(src_der, (n_days, n_regions, len(names))))
+
+        y0_der = np.zeros((y0.size, len(names)))
+        params_cpp = [getattr(p, name) for name in self.cpp_param_names]
+        y, grad = cantons_custom_derivatives(
+                solver, params_cpp, sei_c.State(y0.flatten()), params_der.tolist(),
+                y0_der.tolist(), t_cpp, dense_output=True)
+        # [day, var, region(, derivative)] -> [var, region, day(, derivative)]
+        y = y.transpose(1, 2, 0)[:, :, 1:]
+        grad = grad.transpose(1, 2, 0, 3)[:, :, 1:]
+        return y, grad
+
+    def solve_S_I_Icum_grad(self, params, t_span, si0, t_eval, names):
+        S0, I0 = np.array(si0)
+        E0 = np.zeros_like(S0)
+        (S, E, I), (dS, dE, dI) = self.solve_grad(
+                params, t_span, [S0, E0, I0], t_eval, names)
+        N = params['N']
+        Icum = N[:, None] - S - E
+        return np.array((S, I, Icum)), np.array((dS, dI, -dS - dE))
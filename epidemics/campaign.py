@@ -0,0 +1,312 @@
+"""
+Runner of `sample_knested.py` sweeps over models, countries and cutoff days.
+
+Usage:
+    python3 -m epidemics.campaign spec.json [--cores N] [--force] [--dry-run]
+
+The sweep is described by a JSON spec:
+
+    {
+        "base": "./data/init1/",
+        "models": ["country.reparam.sird_int.nbin", ...],
+        "countries": ["france", "switzerland", ...],
+        "lastDays": ["2020-05-15", "2020-06-15"],
+        "nThreads": 8,
+        "args": ["--silentPlot", "-ns", "1500", "-dlz", "0.1", "-ui", "-ud"],
+        "message": "test initialization",
+        "plot": true,
+        "cleanup": true
+    }
+
+Each (model, country, lastDay) combination is one job, stored in
+`base/lastDay/country/model/` (`base/country/model/` if `lastDays` is not
+given). `nThreads` is either a number or a dict {model: number}, with the
+optional key "default". Jobs are packed onto the available cores according to
+their number of threads, the largest jobs first.
+
+The state of the campaign (command, status and wall time of each job) is stored
+in `base/campaign.json`. A job is skipped if its outputs exist and the state
+records it as finished with the same command. Jobs interrupted while running
+are run again, such that an interrupted campaign is resumed by rerunning it.
+
+The scheduling itself (`Task`, `run_tasks`) is independent of the sweep and
+is reused by other drivers, e.g. `applications/hierarchical/phase_1.py`.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+_REPO_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..'))
+
+DEFAULT_SCRIPT = os.path.join(_REPO_DIR, 'applications', 'evidence', 'sample_knested.py')
+STATE_FILE = 'campaign.json'
+
+
+class Task:
+    """A sequence of commands run one after another, using `nThreads` cores.
+
+    Arguments:
+        name: Name used in the log messages.
+        steps: List of commands, each a list of arguments.
+        nThreads: (optional) Number of cores used by the commands.
+        log: (optional) File the output of the commands is written to.
+        cwd: (optional) Working directory of the commands.
+        nice: (optional) Niceness increment, to run the task at a lower priority.
+    """
+    def __init__(self, name, steps, nThreads=1, log=os.devnull, cwd=None, nice=0):
+        self.name = name
+        self.steps = steps
+        self.nThreads = nThreads
+        self.log = log
+        self.cwd = cwd
+        self.nice = nice
+
+
+def run_tasks(tasks, cores=None, pollInterval=1.0, onStart=None, onFinish=None):
+    """Run tasks in parallel, at most `cores` threads at a time.
+
+    Tasks are started in the given order, skipping those which do not fit
+    into the free cores. A task larger than the machine is run alone.
+
+    Arguments:
+        tasks: List of `Task`s.
+        cores: (optional) Number of available cores, defaults to `os.cpu_count()`.
+        pollInterval: (optional) Time in seconds between checks of running tasks.
+        onStart: (optional) Function called with the task before it is started.
+        onFinish: (optional) Function called with the task, its return code and
+                  its wall time after it finished.
+
+    Returns:
+        A dict {task name: return code}.
+    """
+    cores = cores or os.cpu_count() or 1
+    pending = list(tasks)
+    running = []
+    returncodes = {}
+    try:
+        while pending or running:
+            free = cores - sum(r['task'].nThreads for r in running)
+            for task in list(pending):
+                if task.nThreads <= free or not running:
+                    pending.remove(task)
+                    if onStart:
+                        onStart(task)
+                    running.append(_start_task(task))
+                    free -= task.nThreads
+
+            time.sleep(pollInterval)
+            for r in list(running):
+                returncode = r['process'].poll()
+                if returncode is None:
+                    continue
+                if returncode == 0 and r['steps']:
+                    _start_step(r)
+                    continue
+                running.remove(r)
+                r['log'].close()
+                returncodes[r['task'].name] = returncode
+                if onFinish:
+                    onFinish(r['task'], returncode, time.time() - r['start'])
+    except KeyboardInterrupt:
+        for r in running:
+            r['process'].terminate()
+        raise
+    finally:
+        for r in running:
+            r['process'].wait()
+            r['log'].close()
+    return returncodes
+
+
+def _start_task(task):
+    if task.log != os.devnull:
+        os.makedirs(os.path.dirname(os.path.abspath(task.log)), exist_ok=True)
+    r = {'task': task, 'steps': list(task.steps), 'start': time.time(),
+         'log': open(task.log, 'w')}
+    _start_step(r)
+    return r
+
+
+def _start_step(r):
+    task = r['task']
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+            [_REPO_DIR, os.path.join(_REPO_DIR, 'build'), env.get('PYTHONPATH', '')])
+    command = r['steps'].pop(0)
+    r['process'] = subprocess.Popen(
+            command, cwd=task.cwd, env=env, stdout=r['log'], stderr=subprocess.STDOUT,
+            preexec_fn=(lambda: os.nice(task.nice)) if task.nice else None)
+
+
+class Job:
+    def __init__(self, spec, model, country, lastDay):
+        self.model = model
+        self.country = country
+        self.lastDay = lastDay
+
+        if lastDay is None:
+            self.dataFolder = os.path.abspath(spec['base'])
+            self.name = f"{country}/{model}"
+        else:
+            self.dataFolder = os.path.abspath(os.path.join(spec['base'], lastDay))
+            self.name = f"{lastDay}/{country}/{model}"
+        self.folder = os.path.join(self.dataFolder, country, model)
+
+        nThreads = spec.get('nThreads', 1)
+        if isinstance(nThreads, dict):
+            nThreads = nThreads.get(model, nThreads.get('default', 1))
+        self.nThreads = int(nThreads)
+
+        self.plot = spec.get('plot', True)
+        self.cleanup = spec.get('cleanup', True)
+
+        self.command = [sys.executable, os.path.abspath(spec.get('script', DEFAULT_SCRIPT)),
+                        '-cm', model, '-c', country, '-df', self.dataFolder,
+                        '-nt', str(self.nThreads), '-bs', str(self.nThreads),
+                        '-m', spec.get('message', 'campaign')]
+        if lastDay is not None:
+            self.command += ['-ld', lastDay]
+        self.command += [str(arg) for arg in spec.get('args', [])]
+
+    def outputs(self):
+        """List of files and folders which exist after a successful run."""
+        out = [os.path.join(self.folder, 'evidence.json')]
+        if self.plot:
+            out.append(os.path.join(self.folder, 'figures', 'samples.png'))
+        elif not self.cleanup:
+            out.append(os.path.join(self.folder, '_korali_samples'))
+        return out
+
+    def steps(self):
+        """List of commands run one after another."""
+        steps = [self.command]
+        if self.plot:
+            steps.append([sys.executable, '-m', 'korali.plotter',
+                          '--dir', os.path.join(self.folder, '_korali_samples'),
+                          '--output', os.path.join(self.folder, 'figures', 'samples.png')])
+        return steps
+
+    def task(self):
+        return Task(self.name, self.steps(), nThreads=self.nThreads,
+                    log=os.path.join(self.folder, 'knested.out'),
+                    cwd=os.path.dirname(self.command[1]))
+
+    def is_up_to_date(self, record):
+        if record is None or record.get('status') != 'done':
+            return False
+        if record.get('command') != self.command:
+            return False
+        return all(os.path.exists(path) for path in self.outputs())
+
+    def remove_samples(self):
+        for folder in ['_korali_samples', '_korali_propagation']:
+            shutil.rmtree(os.path.join(self.folder, folder), ignore_errors=True)
+
+
+def expand_jobs(spec):
+    """Create the list of jobs of the sweep `spec`, a dict described in the module docstring."""
+    lastDays = spec.get('lastDays') or [None]
+    return [Job(spec, model, country, lastDay)
+            for lastDay in lastDays
+            for model in spec['models']
+            for country in spec['countries']]
+
+
+class Campaign:
+    """Run jobs in parallel, at most `cores` threads at a time.
+
+    Arguments:
+        spec: The sweep specification, see the module docstring.
+        cores: (optional) Number of available cores, defaults to `os.cpu_count()`.
+        force: (optional) Rerun jobs even if they are up to date.
+        pollInterval: (optional) Time in seconds between checks of running jobs.
+    """
+    def __init__(self, spec, cores=None, force=False, pollInterval=1.0):
+        self.spec = spec
+        self.cores = cores or os.cpu_count() or 1
+        self.force = force
+        self.pollInterval = pollInterval
+        self.jobs = expand_jobs(spec)
+        self.stateFile = os.path.join(os.path.abspath(spec['base']), STATE_FILE)
+        self.state = self._load_state()
+
+    def _load_state(self):
+        if not os.path.isfile(self.stateFile):
+            return {}
+        with open(self.stateFile) as f:
+            return json.load(f)
+
+    def _save_state(self):
+        tmp = self.stateFile + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp, self.stateFile)
+
+    def pending(self):
+        """Jobs which are not up to date, the largest first."""
+        jobs = [job for job in self.jobs
+                if self.force or not job.is_up_to_date(self.state.get(job.name))]
+        return sorted(jobs, key=lambda job: -job.nThreads)
+
+    def run(self, dryRun=False):
+        """Run all pending jobs and return the number of failed jobs."""
+        pending = self.pending()
+        print(f"[Epidemics] Campaign: {len(pending)} of {len(self.jobs)} jobs to run "
+              f"on {self.cores} cores.", flush=True)
+        if dryRun:
+            for job in pending:
+                print(f"[Epidemics]   {job.name} ({job.nThreads} threads)", flush=True)
+            return 0
+
+        os.makedirs(os.path.dirname(self.stateFile), exist_ok=True)
+        jobs = {job.name: job for job in pending}
+        returncodes = run_tasks([job.task() for job in pending], cores=self.cores,
+                                pollInterval=self.pollInterval,
+                                onStart=lambda task: self._start(jobs[task.name]),
+                                onFinish=lambda task, *args: self._finish(jobs[task.name], *args))
+        failed = sum(returncode != 0 for returncode in returncodes.values())
+
+        print(f"[Epidemics] Campaign done, {failed} jobs failed.", flush=True)
+        return failed
+
+    def _start(self, job):
+        os.makedirs(job.folder, exist_ok=True)
+        self.state[job.name] = {'command': job.command, 'status': 'running',
+                                'nThreads': job.nThreads}
+        self._save_state()
+        print(f"[Epidemics] Starting {job.name}.", flush=True)
+
+    def _finish(self, job, returncode, wallTime):
+        if returncode == 0 and job.cleanup:
+            job.remove_samples()
+        self.state[job.name].update({
+            'status': 'done' if returncode == 0 else 'failed',
+            'returncode': returncode,
+            'wallTime': wallTime,
+        })
+        self._save_state()
+        print(f"[Epidemics] Finished {job.name} in {wallTime:.1f}s "
+              f"(return code {returncode}).", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('spec', help="JSON file with the sweep specification.")
+    parser.add_argument('--cores', type=int, default=None, help="Number of available cores, defaults to all.")
+    parser.add_argument('--force', action='store_true', help="Rerun jobs which are up to date.")
+    parser.add_argument('--dry-run', action='store_true', help="Only list the jobs to run.")
+    args = parser.parse_args(argv)
+
+    with open(args.spec) as f:
+        spec = json.load(f)
+    failed = Campaign(spec, cores=args.cores, force=args.force).run(dryRun=args.dry_run)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,8 +7,9 @@ This file provides access to all relevant data aobut Swiss cantons and COVID-19:
 """
 
 from epidemics.data import DATA_CACHE_DIR, DATA_DOWNLOADS_DIR
-from epidemics.data.cases import RegionalDataBase, get_country_cases
-from epidemics.data.population import get_country_population
+from epidemics.data.cases import RegionalDataBase
+from epidemics.country.data.cases import get_country_cases
+from epidemics.country.data.population import get_country_population
 from epidemics.cantons.data import CANTONS_DATA_DIR
 from epidemics.utils.cache import cache, cache_to_file
 from epidemics.utils.date import date_fromisoformat
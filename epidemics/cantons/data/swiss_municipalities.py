@@ -49,7 +49,7 @@ def bfs_population_xls(usecols=None):
 
 
 @cache
-@cache_to_file(DATA_CACHE_DIR / 'bfs_residence_work_cols12568.df.csv')
+@cache_to_file(DATA_CACHE_DIR / 'bfs_residence_work_cols12568.df.npz')
 def get_residence_work_cols12568():
     # (residence canton initial,
     #  residence commune number,
@@ -70,7 +70,14 @@ def _number_to_key(number):
     return 'MUN-{:04}'.format(int(number))
 
 
-@cache_to_file(DATA_CACHE_DIR / 'bfs_municipality_namepop.df.csv')
+def _numbers_to_keys(numbers):
+    """Vectorized `_number_to_key`, returns a categorical pandas.Series."""
+    numbers = pd.Series(np.asarray(numbers, dtype=np.int64))
+    return ('MUN-' + numbers.astype(str).str.zfill(4)).astype('category')
+
+
+@cache
+@cache_to_file(DATA_CACHE_DIR / 'bfs_municipality_namepop.df.npz')
 def get_name_and_population():
     """Returns a pandas DataFrame with municipality names and population.
 
@@ -95,7 +102,9 @@ def get_name_and_population():
         name = match.group(2)
         rows.append((key, name, total))
 
-    return pd.DataFrame(rows, columns=('key', 'name', 'population'))
+    df = pd.DataFrame(rows, columns=('key', 'name', 'population'))
+    df['population'] = df['population'].astype(np.int32)
+    return df
 
 
 def get_cantons():
@@ -108,13 +117,14 @@ def get_cantons():
     ...        ...    ...
     """
     commute = get_residence_work_cols12568()
-    print(commute)
     return pd.DataFrame({
-        'key': list(map(_number_to_key, commute['number_home'])),
+        'key': _numbers_to_keys(commute['number_home']),
         'canton': commute['canton_home'],
     })
 
 
+@cache
+@cache_to_file(DATA_CACHE_DIR / 'bfs_municipality_commute.df.npz')
 def get_commute():
     """Returns a DataFrame with data on commute between municipality.
 
@@ -126,9 +136,9 @@ def get_commute():
     """
     commute = get_residence_work_cols12568()
     return pd.DataFrame({
-        'key_home': list(map(_number_to_key, commute['number_home'])),
-        'key_work': list(map(_number_to_key, commute['number_work'])),
-        'num_people': commute['num_people']
+        'key_home': _numbers_to_keys(commute['number_home']),
+        'key_work': _numbers_to_keys(commute['number_work']),
+        'num_people': commute['num_people'].astype(np.int32),
     })
 
 def get_shape_file():
@@ -1,10 +1,11 @@
 #!/usr/bin/env python3
 
 import numpy as np
+import pandas as pd
+import scipy.sparse
 
 from datetime import datetime
 import json
-import math
 import os
 import sys
 import urllib.request
@@ -18,8 +19,8 @@ except ModuleNotFoundError:
     sys.exit("libepidemics not found. Did you forget to compile the C++ code?")
 
 from epidemics.data import DATA_CACHE_DIR
-from epidemics.data.cases import get_region_cases
-from epidemics.utils.misc import flatten
+import epidemics.utils.binary as binary
+from epidemics.country.data.cases import get_country_cases
 import epidemics.cantons.data.swiss_cantons as swiss_cantons
 import epidemics.cantons.data.swiss_municipalities as swiss_municipalities
 
@@ -33,7 +34,8 @@ class PyDesignParameters:
     Arguments:
         region_keys: List of region names.
         region_population: List of population size of corresponding regions.
-        Mij: A numpy matrix of region-region number of commuters.
+        Mij: A numpy matrix or a scipy.sparse matrix of region-region number of commuters.
+        Cij: Same as Mij.
         ext_com_Iu: A matrix [day][region] of estimated number of foreign
                     infected people visiting given region at given day.
         Ui: User-defined, shape (K)
@@ -62,45 +64,90 @@ class PyDesignParameters:
     def to_cpp(self):
         """Return the libepidemics.DesignParameters instance.
 
-        Needed when running the model from Python using the C++ implementation."""
+        Needed when running the model from Python using the C++ implementation.
+        The matrices are passed to C++ as contiguous float64 arrays, without
+        per-element conversion."""
         return libepidemics.cantons.DesignParameters(
-                self.region_keys, self.region_population,
-                flatten(self.Mij), flatten(self.Cij),
-                flatten(self.ext_com_Iu), self.Ui)
-
-    def save_cpp_dat(self, path=DATA_CACHE_DIR / 'cpp_design_parameters.dat'):
+                list(self.region_keys),
+                _as_float64(self.region_population),
+                _as_float64(_dense(self.Mij)),
+                _as_float64(_dense(self.Cij)),
+                _as_float64(self.ext_com_Iu),
+                _as_float64(self.Ui))
+
+    def save_cpp_dat(self, path=DATA_CACHE_DIR / 'cpp_design_parameters.dat', *, sparse=None):
         """Generate cpp_design_parameters.dat, the data for the C++ DesignParameters class.
 
         Needed when running Korali from C++, when `to_cpp` is not available.
+        Read with `readDesignParameters` (C++) or `load_cpp_dat` (Python).
+
+        The file is a binary container (see epidemics/utils/binary.py) of
+        kind 'design' with the following arrays:
+            region_keys: '\\n'-separated region keys, uint8
+            Ni: region population, float64 (N)
+            Mij, Cij: dense row-major matrices, float64 (N * N), or in the CSR
+                      format as Mij.indptr (int64), Mij.indices (int32) and
+                      Mij.data (float64), and analogously for Cij
+            extComIu: external cases, row-major float64 (D * N)
+            Ui: user-defined, float64 (N)
+
+        Arguments:
+            path: Output file path.
+            sparse: (optional) Whether to store Mij and Cij in the CSR
+                    format. Defaults to True if Mij is a scipy.sparse matrix.
+        """
+        if sparse is None:
+            sparse = scipy.sparse.issparse(self.Mij)
+        arrays = {
+            'region_keys': np.frombuffer('\n'.join(self.region_keys).encode('utf8'), dtype=np.uint8),
+            'Ni': _as_float64(self.region_population),
+        }
+        for name, M in [('Mij', self.Mij), ('Cij', self.Cij)]:
+            if sparse:
+                M = scipy.sparse.csr_matrix(M)
+                M.sum_duplicates()
+                arrays[name + '.indptr'] = M.indptr.astype(np.int64)
+                arrays[name + '.indices'] = M.indices.astype(np.int32)
+                arrays[name + '.data'] = _as_float64(M.data)
+            else:
+                arrays[name] = _as_float64(_dense(M))
+        arrays['extComIu'] = _as_float64(self.ext_com_Iu)
+        arrays['Ui'] = _as_float64(self.Ui)
+        binary.save_arrays(path, 'design', arrays)
+        print(f"Stored design parameters to {path}.")
 
-        File format:
-            <number of regions N>
-            abbreviation1 ... abbreviationN
-            population1 ... populationN
-
-            M_11 ... M_1N
-            ...
-            M_N1 ... M_NN
+    @classmethod
+    def load_cpp_dat(cls, path=DATA_CACHE_DIR / 'cpp_design_parameters.dat'):
+        """Load design parameters stored with `save_cpp_dat`.
 
-            <number of days D for external cases>
-            <external cases for day 1 for region 1> ... <external cases for day 1 for region N>
-            ...
-            <external cases for day D for region 1> ... <external cases for day D for region N>
+        The file is memory-mapped, the arrays are read-only views. Sparse
+        matrices are returned as scipy.sparse.csr_matrix.
         """
-        with open(path, 'w') as f:
-            f.write(str(self.num_regions) + '\n')
-            f.write(' '.join(self.region_keys) + '\n')
-            f.write(' '.join(str(p) for p in self.region_population) + '\n\n')
-
-            for row in self.Mij:
-                f.write(' '.join(str(x) for x in row) + '\n')
-            f.write('\n')
-
-            f.write(str(len(self.ext_com_Iu)) + '\n')
-            for day in self.ext_com_Iu:
-                f.write(' '.join(str(x) for x in day) + '\n')
-            f.write(' '.join(str(u) for u in self.Ui) + '\n')
-        print(f"Stored design parameters to {path}.")
+        arrays = binary.load_arrays(path, 'design')
+        keys = arrays['region_keys'].tobytes().decode('utf8')
+        keys = keys.split('\n') if keys else []
+        N = len(keys)
+
+        def _matrix(name):
+            if name in arrays:
+                return arrays[name].reshape(N, N)
+            return scipy.sparse.csr_matrix(
+                    (arrays[name + '.data'], arrays[name + '.indices'], arrays[name + '.indptr']),
+                    shape=(N, N))
+
+        return cls(keys, arrays['Ni'], _matrix('Mij'), _matrix('Cij'),
+                   ext_com_Iu=arrays['extComIu'].reshape(-1, N) if N else [],
+                   Ui=arrays['Ui'])
+
+
+def _dense(M):
+    """Return a dense numpy version of a numpy or a scipy.sparse matrix."""
+    return M.toarray() if scipy.sparse.issparse(M) else M
+
+
+def _as_float64(a):
+    """Return `a` as a C-contiguous float64 array, without copying if possible."""
+    return np.ascontiguousarray(a, dtype=np.float64)
 
 
 class ReferenceData:
@@ -111,35 +158,63 @@ class ReferenceData:
         self.region_to_index = {key: k for k, key in enumerate(region_keys)}
 
         # Not all elements of the `cases_per_country` matrix are known, so we
-        # create a list of tuples (day, region index, number of cases).
-        self.cases_data_points = [
-            (d, self.region_to_index[c], day_value)
-            for c, region_values in cases_per_country.items()
-            for d, day_value in enumerate(region_values)
-            if not math.isnan(day_value)
-        ]
+        # create a structured array of (day, region index, number of cases).
+        parts = []
+        for c, region_values in cases_per_country.items():
+            values = np.asarray(region_values, dtype=np.float64)
+            days = np.flatnonzero(~np.isnan(values))
+            part = np.empty(len(days), dtype=libepidemics.cantons.DATA_POINT_DTYPE)
+            part['day'] = days
+            part['region'] = self.region_to_index[c]
+            part['value'] = values[days]
+            parts.append(part)
+        self.cases = np.concatenate(parts) if parts else \
+                np.empty(0, dtype=libepidemics.cantons.DATA_POINT_DTYPE)
+
+    @property
+    def cases_data_points(self):
+        """List of tuples (day, region index, number of cases)."""
+        return self.cases.tolist()
+
+    def to_cpp(self):
+        """Return the libepidemics.cantons.ReferenceData instance."""
+        return libepidemics.cantons.ReferenceData(self.cases)
 
     def save_cpp_dat(self, path=DATA_CACHE_DIR / 'cpp_reference_data.dat'):
         """Generate cpp_reference_data.dat, the data for the C++ ReferenceData class.
 
-        File format:
-            <number of known data points M>
-            day1 region_index1 number_of_cases1
-            ...
-            dayM region_indexM number_of_casesM
+        The file is a binary container (see epidemics/utils/binary.py) of
+        kind 'reference' with the following arrays:
+            region_keys: '\\n'-separated region keys, uint8
+            day: int32 (M)
+            region: int32 (M)
+            value: number of cases, float64 (M)
 
         The known data points are all known values of numbers of cases. The
         region index refers to the order in cpp_design_parameters.dat
         Note that covid19_cases_switzerland_openzh.csv (see `fetch`) has many missing values.
         """
-        with open(path, 'w') as f:
-            f.write(str(len(self.cases_data_points)) + '\n')
-            for data_point in self.cases_data_points:
-                f.write('{} {} {}\n'.format(*data_point))
+        binary.save_arrays(path, 'reference', {
+            'region_keys': np.frombuffer('\n'.join(self.region_keys).encode('utf8'), dtype=np.uint8),
+            'day': self.cases['day'].astype(np.int32),
+            'region': self.cases['region'].astype(np.int32),
+            'value': self.cases['value'].astype(np.float64),
+        })
         print(f"Stored reference data to {path}.")
 
+    @classmethod
+    def load_cpp_dat(cls, path=DATA_CACHE_DIR / 'cpp_reference_data.dat'):
+        """Load reference data stored with `save_cpp_dat`."""
+        arrays = binary.load_arrays(path, 'reference')
+        keys = arrays['region_keys'].tobytes().decode('utf8')
+        keys = keys.split('\n') if keys else []
+        num_days = int(arrays['day'].max()) + 1 if len(arrays['day']) else 0
+        cases = np.full((len(keys), num_days), np.nan)
+        cases[arrays['region'], arrays['day']] = arrays['value']
+        return cls(keys, {key: cases[k] for k, key in enumerate(keys)})
 
-def get_cantom_design_parameters(include_foreign=True):
+
+def get_canton_design_parameters(include_foreign=True):
     """Creates the PyDesignParameters instance with default data."""
     keys = swiss_cantons.CANTON_KEYS_ALPHABETICAL
     population = [swiss_cantons.CANTON_POPULATION[c] for c in keys]
@@ -148,7 +223,7 @@ def get_cantom_design_parameters(include_foreign=True):
     Cij = swiss_cantons.get_Cij_numpy(keys)
 
     if include_foreign:
-        swiss_cases = get_region_cases('switzerland')
+        swiss_cases = get_country_cases('switzerland')
         num_days = len(swiss_cases.confirmed) + 10
         ext_com_Iu = swiss_cantons.get_external_Iu(
                 swiss_cases.get_date_of_first_confirmed(), num_days=num_days)
@@ -171,31 +246,128 @@ def get_canton_reference_data():
     return ReferenceData(keys, cases_per_country)
 
 
+def build_commute_matrix(region_keys, key_home, key_work, num_people):
+    """Build a sparse commute matrix from a list of commute records.
+
+    Records whose home or work key is not in `region_keys` are ignored,
+    duplicate records are summed up.
+
+    Arguments:
+        region_keys: List of N region keys, determines the matrix order.
+        key_home: Array of M home region keys.
+        key_work: Array of M work region keys.
+        num_people: Array of M number of commuters.
+
+    Returns:
+        A scipy.sparse.csr_matrix Cij of shape (N, N), where Cij[work, home]
+        is the number of people commuting from `home` to `work`.
+    """
+    index = pd.Index(np.asarray(region_keys, dtype=object))
+    home = index.get_indexer(np.asarray(key_home, dtype=object))
+    work = index.get_indexer(np.asarray(key_work, dtype=object))
+    valid = (home >= 0) & (work >= 0)
+    N = len(index)
+    return scipy.sparse.csr_matrix(
+            (np.asarray(num_people, dtype=np.float64)[valid], (work[valid], home[valid])),
+            shape=(N, N))
+
+
+def build_membership_matrix(region_keys, region_groups, group_keys=None):
+    """Build a sparse membership matrix P, where P[g, i] = 1 if region i belongs to group g.
+
+    Aggregation of a region quantity `x` to groups is then `P @ x`, and of a
+    region-region matrix `M` is `P @ M @ P.T`.
+
+    Arguments:
+        region_keys: List of N region keys.
+        region_groups: A dict {region key: group key}.
+        group_keys: (optional) List of G group keys, determines the row order.
+                    Defaults to the sorted list of all groups.
+
+    Returns:
+        A tuple (group_keys, P), P is a scipy.sparse.csr_matrix of shape (G, N).
+    """
+    groups = [region_groups.get(key) for key in region_keys]
+    if group_keys is None:
+        group_keys = sorted(set(g for g in groups if g is not None))
+    index = pd.Index(group_keys)
+    rows = index.get_indexer(np.asarray(groups, dtype=object))
+    cols = np.arange(len(region_keys))
+    valid = rows >= 0
+    P = scipy.sparse.csr_matrix(
+            (np.ones(valid.sum()), (rows[valid], cols[valid])),
+            shape=(len(group_keys), len(region_keys)))
+    return list(group_keys), P
+
+
+def get_municipality_canton_membership(region_keys):
+    """Return the (canton keys, membership matrix) for the given municipalities.
+
+    See `build_membership_matrix`.
+    """
+    cantons = swiss_municipalities.get_cantons().drop_duplicates('key')
+    region_groups = dict(zip(cantons['key'].astype(str), cantons['canton'].astype(str)))
+    return build_membership_matrix(
+            region_keys, region_groups, swiss_cantons.CANTON_KEYS_ALPHABETICAL)
+
+
+def make_cpp_aggregation(P):
+    """Return the libepidemics.cantons.Aggregation of a (G, N) matrix P.
+
+    Used with `Solver.solve_aggregated` to reduce municipality-level
+    trajectories to canton-level series in C++, see `build_membership_matrix`.
+    """
+    P = scipy.sparse.csr_matrix(P)
+    P.sum_duplicates()
+    return libepidemics.cantons.Aggregation(
+            P.shape[1], P.indptr.tolist(), P.indices.tolist(),
+            P.data.astype(np.float64).tolist())
+
+
 def get_municipality_design_parameters():
+    """Creates the PyDesignParameters instance for municipalities.
+
+    Mij and Cij are scipy.sparse.csr_matrix instances.
+    """
     namepop = swiss_municipalities.get_name_and_population()
     commute = swiss_municipalities.get_commute()
 
-    # TODO: Comparison with reference data requires aggregation wrt cantons,
-    # since that's the only reference data we have.
-    # cantons = swiss_municipalities.get_municipality_commute()
-
-    key_to_index = {key: k for k, key in enumerate(namepop['key'])}
-    N = len(key_to_index)
-    Cij = np.zeros((N, N))
-    for key_home, key_work, num_people in zip(
-            commute['key_home'],
-            commute['key_work'],
-            commute['num_people']):
-        home = key_to_index.get(key_home)
-        work = key_to_index.get(key_work)
-        if home is None or work is None:
-            continue
-        Cij[work, home] += num_people
+    # Reference data is available only for cantons. Aggregate with
+    # `get_municipality_canton_membership`, e.g. as `Data.aggregation` of
+    # applications/inference_cantons, which uses `Solver.solve_aggregated`.
+
+    keys = list(namepop['key'].astype(str))
+    Cij = build_commute_matrix(
+            keys, commute['key_home'], commute['key_work'], commute['num_people'])
 
     # NOTE: This Mij is wrong.
-    Mij = Cij + Cij.transpose()
+    Mij = (Cij + Cij.transpose()).tocsr()
 
-    return PyDesignParameters(namepop['key'], namepop['population'], Mij, Cij)
+    return PyDesignParameters(keys, list(namepop['population']), Mij, Cij)
+
+
+def aggregate_design_parameters(dp, group_keys, P):
+    """Aggregate region-level design parameters to groups (e.g. municipalities to cantons).
+
+    Arguments:
+        dp: PyDesignParameters with N regions.
+        group_keys: List of G group keys.
+        P: Membership matrix of shape (G, N), see `build_membership_matrix`.
+
+    Returns:
+        PyDesignParameters with G regions and sparse Mij and Cij, where the
+        flows within the same group are removed. The user-defined `Ui` is
+        not aggregated.
+    """
+    def _aggregate(M):
+        M = (P @ scipy.sparse.csr_matrix(M) @ P.T).tolil()
+        M.setdiag(0)
+        return M.tocsr()
+
+    population = P @ np.asarray(dp.region_population, dtype=np.float64)
+    ext_com_Iu = [P @ np.asarray(day, dtype=np.float64) for day in dp.ext_com_Iu]
+    return PyDesignParameters(list(group_keys), list(population), _aggregate(dp.Mij),
+                              _aggregate(dp.Cij), ext_com_Iu=ext_com_Iu)
 
 
 def get_municipality_model_data():
@@ -4,6 +4,7 @@ import matplotlib
 matplotlib.use("Agg")
 
 from matplotlib import animation
+from matplotlib.collections import LineCollection, PolyCollection
 import matplotlib.colors
 import matplotlib.pyplot as plt
 import numpy as np
@@ -11,10 +12,11 @@ import geopandas as gpd
 from pandas import Series
 import shapely
 
-import collections
 import itertools
 import json
+import multiprocessing
 import os
+import subprocess
 import sys
 import time
 
@@ -22,7 +24,7 @@ sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
 
 from epidemics.cantons.data import CANTONS_DATA_DIR
 from epidemics.cantons.data.swiss_cantons import NAME_TO_CODE, CODE_TO_NAME
-from epidemics.cantons.py.model import DesignParameters
+from epidemics.cantons.py.model import PyDesignParameters as DesignParameters, _dense
 from epidemics.data import DATA_CACHE_DIR
 from epidemics.utils.cache import cache, cache_to_file
 import epidemics.cantons.data.swiss_municipalities as munic
@@ -215,16 +217,24 @@ class Renderer:
         ax.set_aspect('equal')
         self.fig.tight_layout()
 
-        # Draw cantons.
-        fills = collections.defaultdict(list)
+        # Draw cantons. All polygons are drawn as two collections (outlines
+        # and fills), frames only update the face colors of the fills.
+        codes = list(CODE_TO_NAME)
+        self.code_to_index = {code: k for k, code in enumerate(codes)}
+        polys = []
+        poly_codes = []
         for name, ss in self.canton_shapes.items():
             code = NAME_TO_CODE[name]
-            for i,s in enumerate(ss):
-                x, y = s
-                line, = ax.plot(x, y, marker=None, c='black', lw=0.25)
-                fill, = ax.fill(x, y, alpha=0, c='red', lw=0)
-                fills[code].append(fill)
-        self.fills = fills
+            for s in ss:
+                polys.append(np.column_stack(s))
+                poly_codes.append(self.code_to_index[code])
+        self.poly_codes = np.array(poly_codes, dtype=int)
+        self.canton_rgb = np.tile(matplotlib.colors.to_rgb('red'), (len(codes), 1))
+        self.canton_alpha = np.zeros(len(codes))
+        ax.add_collection(LineCollection(polys, colors='black', lw=0.25))
+        self.fills = PolyCollection(polys, facecolors='none', lw=0)
+        ax.add_collection(self.fills)
+        self._update_canton_fills()
 
         # Draw zones (municipalities).
         if self.draw_zones:
@@ -237,76 +247,89 @@ class Renderer:
             self.zone_gdf = gdf
             self.zone_to_canton = zone_to_canton
 
-            zone_fills = [[] for i in range(gdf.shape[0])]
-            for i,geomvalue in enumerate(zip(gdf['geometry'], self.zone_values)):
-                geom, value = geomvalue
+            zone_polys = []
+            zone_index = []
+            for i, geom in enumerate(gdf['geometry']):
                 if isinstance(geom, shapely.geometry.MultiPolygon):
-                    geom = list(geom)
+                    geom = list(geom.geoms)
                 if isinstance(geom, shapely.geometry.Polygon):
                     geom = [geom]
                 for g in geom:
-                    poly = np.array(g.exterior.coords).T
-                    fill, = ax.fill(*poly, alpha=0, c='black', lw=0, zorder=5)
-                    zone_fills[i].append(fill)
-            self.zone_fills = zone_fills
-
+                    zone_polys.append(np.array(g.exterior.coords))
+                    zone_index.append(i)
+            self.zone_poly_index = np.array(zone_index, dtype=int)
+            self.zone_fills = PolyCollection(zone_polys, facecolors='none', lw=0, zorder=5)
+            ax.add_collection(self.zone_fills)
 
         dp = self.dp
         centers = self.centers
         def _draw_connections(matrix, color):
             max_people = np.max(matrix)
             if max_people == 0:
-                return
+                return None
+            segments = []
+            alphas = []
+            lws = []
             for c_home, c_work in itertools.product(dp.region_keys, repeat=2):
                 if c_home == c_work:
                     continue
                 if c_home not in centers or c_work not in centers:
                     continue
-                x0, y0 = centers[c_home]
-                x1, y1 = centers[c_work]
                 n = matrix[dp.key_to_index[c_home], dp.key_to_index[c_work]]
                 alpha_min = 0.01
                 alpha = np.clip(n / max_people * 20, alpha_min, 0.5)
                 if alpha == alpha_min:
                     continue
-                lw = np.clip(n / max_people * 5, 0.5, 4)
-                ax.plot([x0, x1], [y0, y1], color=color, alpha=alpha, lw=lw)
-
+                segments.append([centers[c_home], centers[c_work]])
+                alphas.append(alpha)
+                lws.append(np.clip(n / max_people * 5, 0.5, 4))
+            colors = np.tile(matplotlib.colors.to_rgba(color), (len(segments), 1))
+            colors[:, 3] = alphas
+            return ax.add_collection(LineCollection(segments, colors=colors, linewidths=lws))
+
+        self.connections = []
         if self.draw_Mij:
-            _draw_connections(dp.Mij, 'blue')
+            self.connections.append(_draw_connections(_dense(dp.Mij), 'blue'))
         if self.draw_Cij:
-            _draw_connections(dp.Cij, 'green')
+            self.connections.append(_draw_connections(_dense(dp.Cij), 'green'))
+        self.connections = [c for c in self.connections if c is not None]
 
         # Draw labels.
         texts = dict()
         self.texts = texts
+        self.labels = []
         for code in CODE_TO_NAME:
             xc, yc = self.centers[code]
-            ax.text(xc, yc, code, ha='center', va='bottom', zorder=10,
-                    color=[0,0,0])
+            self.labels.append(ax.text(xc, yc, code, ha='center', va='bottom',
+                                       zorder=10, color=[0,0,0]))
             text = ax.text(
                     xc, yc - 1700,
                     '', ha='center', va='top', zorder=10, fontsize=7,
                     color=[0,0,0])
             texts[code] = text
-            ax.scatter(xc, yc, color='black', s=8, zorder=5)
+        self.labels.append(ax.scatter(*np.array([self.centers[code] for code in CODE_TO_NAME]).T,
+                                      color='black', s=8, zorder=5))
 
         if self.airports is not None:
             for a in self.airports:
                 if a in centers:
                     marker="$\u2708$"
-                    ax.scatter(*centers[a], marker=marker, zorder=6,
-                            s=200, alpha=0.75, facecolor='green',
-                            lw=0)
+                    self.labels.append(ax.scatter(
+                            *centers[a], marker=marker, zorder=6,
+                            s=200, alpha=0.75, facecolor='green', lw=0))
 
+        ax.autoscale_view()
         return []
 
+    def _update_canton_fills(self):
+        rgba = np.column_stack((self.canton_rgb, self.canton_alpha))
+        self.fills.set_facecolor(rgba[self.poly_codes])
+
     def update_plot(self, frame=-1, silent=False):
         '''
         Updates design parameters and returns a list of artist to update
         (would make an effect in case blit=True).
         '''
-        plt.draw()
         self.frame = frame
         self.frame_callback(self)
 
@@ -318,30 +341,94 @@ class Renderer:
             Log("{:}/{:} {:.0f} ms".format(frame, self.max_frame, dtime * 1e3))
             self.last_frame_time = time1
         for code,value in self.code_to_value.items():
-            alpha = np.clip(value, 0, 1) * 0.75
-            for fill in self.fills[code]:
-                fill.set_alpha(alpha)
+            self.canton_alpha[self.code_to_index[code]] = np.clip(value, 0, 1) * 0.75
         for code,color in self.code_to_color.items():
-            for fill in self.fills[code]:
-                fill.set_color(color)
+            self.canton_rgb[self.code_to_index[code]] = matplotlib.colors.to_rgb(color)
+        self._update_canton_fills()
         for code in self.texts:
             if code in self.code_to_text:
                 self.texts[code].set_text(str(self.code_to_text[code]))
         if self.draw_zones:
-            for fills,value in zip(self.zone_fills, self.zone_values):
-                alpha = np.clip(value, 0, 1) * 0.25
-                for fill in fills:
-                    fill.set_alpha(alpha)
-        return []
+            alpha = np.clip(self.zone_values, 0, 1) * 0.25
+            rgba = np.zeros((len(self.zone_poly_index), 4))
+            rgba[:, 3] = alpha[self.zone_poly_index]
+            self.zone_fills.set_facecolor(rgba)
+        return self.get_dynamic_artists()
+
+    def get_dynamic_artists(self):
+        '''
+        Returns the artists redrawn on each frame when blitting, sorted by
+        zorder. Everything below the canton fills (outlines) is static.
+        '''
+        artists = [self.fills] + self.connections + self.labels + list(self.texts.values())
+        if self.draw_zones:
+            artists.append(self.zone_fills)
+        return sorted(artists, key=lambda artist: artist.get_zorder())
+
+    def init_blit(self):
+        '''
+        Draws the static part of the figure once and stores it as the
+        background for `render_frame`.
+        '''
+        self.init_plot()
+        for artist in self.get_dynamic_artists():
+            artist.set_animated(True)
+        self.fig.canvas.draw()
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+
+    def render_frame(self, frame):
+        '''
+        Renders one frame on top of the background from `init_blit`.
+        Returns the RGBA image as bytes.
+        '''
+        canvas = self.fig.canvas
+        canvas.restore_region(self.background)
+        for artist in self.update_plot(frame, silent=True):
+            self.ax.draw_artist(artist)
+        return bytes(canvas.buffer_rgba())
 
-    def save_movie(self, frames=100, filename="a.mp4", fps=15,):
+    def save_movie(self, frames=100, filename="a.mp4", fps=15, jobs=1):
+        '''
+        Renders frames with blitting and pipes them to ffmpeg.
+
+        jobs: `int`
+            Number of worker processes rendering batches of frames.
+            `frame_callback` must then depend only on the frame index.
+        '''
         self.max_frame = frames - 1
-        ani = animation.FuncAnimation(self.fig, self.update_plot,
-                frames=list(range(frames)),
-                init_func=self.init_plot, blit=False)
-        Writer = animation.writers['ffmpeg']
-        writer = Writer(fps=fps, metadata=dict(artist='Me'), bitrate=2000)
-        ani.save(filename, writer=writer)
+        width, height = self.fig.canvas.get_width_height()
+        cmd = [matplotlib.rcParams['animation.ffmpeg_path'], '-y',
+               '-loglevel', 'error',
+               '-f', 'rawvideo', '-vcodec', 'rawvideo', '-pix_fmt', 'rgba',
+               '-s', '{:}x{:}'.format(width, height), '-r', str(fps), '-i', '-',
+               '-vcodec', 'h264', '-pix_fmt', 'yuv420p', '-b:v', '2000k',
+               '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+               filename]
+        with subprocess.Popen(cmd, stdin=subprocess.PIPE) as ffmpeg:
+            for frame, image in enumerate(self._iter_frames(frames, jobs)):
+                ffmpeg.stdin.write(image)
+                if frame % 10 == 0:
+                    Log("{:}/{:}".format(frame, self.max_frame))
+            ffmpeg.stdin.close()
+        if ffmpeg.returncode != 0:
+            raise RuntimeError("ffmpeg failed with code {:}.".format(ffmpeg.returncode))
+
+    def _iter_frames(self, frames, jobs):
+        if jobs <= 1:
+            self.init_blit()
+            for frame in range(frames):
+                yield self.render_frame(frame)
+            for artist in self.get_dynamic_artists():
+                artist.set_animated(False)
+            return
+
+        # Workers are forked, so the renderer and the callback are not pickled.
+        batch = max(1, min(16, frames // (4 * jobs)))
+        batches = [range(k, min(k + batch, frames)) for k in range(0, frames, batch)]
+        ctx = multiprocessing.get_context('fork')
+        with ctx.Pool(jobs, initializer=_init_render_worker, initargs=(self,)) as pool:
+            for images in pool.imap(_render_frames, batches):
+                yield from images
 
     def run_interactive(self, frames=100, fps=15):
         self.max_frame = frames - 1
@@ -356,6 +443,18 @@ class Renderer:
         self.update_plot(self.max_frame, silent=True)
         self.fig.savefig(filename)
 
+
+_worker_renderer = None
+
+def _init_render_worker(renderer):
+    global _worker_renderer
+    _worker_renderer = renderer
+    _worker_renderer.init_blit()
+
+def _render_frames(frames):
+    return [_worker_renderer.render_frame(frame) for frame in frames]
+
+
 def example():
     def frame_callback(rend):
         colors = dict()
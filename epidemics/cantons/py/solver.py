@@ -34,6 +34,35 @@ def integrate(rhs_func, y0, num_days, iterations_per_day):
     return out
 
 
+def integrate_batch(rhs_func, y0, num_days, iterations_per_day, step=RK4_step):
+    """Integrate a batch of systems dy/dt = rhs_func(y, t) from t=0 to t=num_days with y(0) = y0.
+
+    The integration is out-of-place, such that the result can be
+    differentiated with autograd.
+
+    Arguments:
+        rhs_func: Function (y, t) -> dy/dt, operating on tensors of shape (B, n).
+        y0: Initial states, a tensor of shape (B, n).
+        num_days: Number of days to integrate.
+        iterations_per_day: Number of time steps per day.
+        step: Time step function, `RK4_step` or `FE_step`.
+
+    Returns:
+        A tensor of shape (num_days + 1, B, n) of the states at the beginning of each day.
+    """
+    out = y0.new_empty((num_days + 1,) + tuple(y0.shape))
+    out[0] = y0
+
+    y = y0
+    dt = 1 / iterations_per_day
+    for day in range(num_days):
+        for it in range(iterations_per_day):
+            y, _ = step(rhs_func, y, day + it * dt, dt)
+        out[day + 1] = y
+
+    return out
+
+
 class Solver:
     """PyTorch-based solver for the multi-region SEII model.
 
@@ -98,3 +127,72 @@ class Solver:
             return torch.cat((dS, dE, dIr, dIu, dN))
 
         return integrate(rhs, y0, num_days, iterations_per_day=10)
+
+
+class BatchSolver:
+    """Batched PyTorch solver for the multi-region SEII model, see `Solver`.
+
+    Integrates B parameter sets simultaneously with RK4 and supports autograd
+    with respect to the parameters and the initial state.
+
+    Arguments:
+        Mij: A commute matrix, a dense or a sparse (K, K) tensor. It is stored
+             as a sparse tensor.
+        iterations_per_day: Number of RK4 steps per day.
+    """
+
+    def __init__(self, Mij, iterations_per_day=10):
+        assert len(Mij.size()) == 2
+        assert Mij.size()[0] == Mij.size()[1]
+
+        self.num_cantons = Mij.size()[0]
+        self.Mij = (Mij if Mij.is_sparse else Mij.to_sparse()).coalesce()
+        self.colsumMij = torch.sparse.sum(self.Mij, dim=0).to_dense()
+        self.rowsumMij = torch.sparse.sum(self.Mij, dim=1).to_dense()
+        self.iterations_per_day = iterations_per_day
+
+    def solve(self, y0, params, num_days):
+        """Solve the model for a batch of parameter sets.
+
+        Arguments:
+            y0: Initial state, a tensor of shape (5K,) shared by all parameter
+                sets, or of shape (B, 5K).
+            params: A tensor of shape (B, 6) with columns (beta, mu, alpha, Z, D, theta).
+            num_days: Number of days to integrate.
+
+        Returns:
+            A tensor of shape (num_days + 1, B, 5K) of the states at the
+            beginning of each day, in the same layout as `y0`.
+        """
+        K = self.num_cantons
+        B = params.shape[0]
+        assert params.shape == (B, 6), params.shape
+        y0 = y0.to(params.dtype).expand(B, VARS_PER_REGION * K)
+
+        Mij = self.Mij.to(params.dtype)
+        colsumMij = self.colsumMij.to(params.dtype)
+        rowsumMij = self.rowsumMij.to(params.dtype)
+        beta, mu, alpha, Z, D, theta = (params[:, k:k+1] for k in range(6))
+        dN = theta * (rowsumMij - colsumMij)  # This can be also set to 0.
+
+        def rhs(y, t):
+            S, E, Ir, Iu, N = y.reshape(B, VARS_PER_REGION, K).unbind(1)
+
+            tmpI = beta * S / N * (Ir + mu * Iu)
+            tmpE_Z = E / Z
+            tmpalphaE_Z = alpha * tmpE_Z
+
+            # Migration of S, E and Iu with a single sparse product.
+            tmpNI = N - Ir
+            X = torch.stack((S, E, Iu), dim=1) / tmpNI[:, None, :]   # (B, 3, K)
+            MX = torch.sparse.mm(Mij, X.reshape(3 * B, K).t()).t().reshape(B, 3, K)
+            flow = theta[:, :, None] * (MX - colsumMij * X)
+
+            dS = -tmpI + flow[:, 0]
+            dE = tmpI - tmpE_Z + flow[:, 1]
+            dIr = tmpalphaE_Z - Ir / D
+            dIu = tmpE_Z - tmpalphaE_Z - Iu / D + flow[:, 2]
+
+            return torch.cat((dS, dE, dIr, dIu, dN), dim=1)
+
+        return integrate_batch(rhs, y0, num_days, self.iterations_per_day)
@@ -1,9 +1,11 @@
+import collections
 import os
 import sys
+import inspect
 import numpy as np
 import datetime
 from scipy.stats import truncnorm
-from scipy.special import loggamma
+from scipy.special import loggamma, logsumexp
 
 import matplotlib
 matplotlib.use('Agg')
@@ -13,10 +15,19 @@ plt.ioff()
 from epidemics.country.data.cases import CountryData
 from epidemics.data.synthetic import SyntheticData
 from epidemics.epidemics import EpidemicsBase
-from epidemics.utils.misc import save_file, prepare_folder
+from epidemics.utils.misc import save_file, load_file, prepare_folder, abort, printlog
+from epidemics.utils.warm_start import importance_resample, log_prior, reference_log_likelihood
+
+def solution_arrays( sol ):
+  """Returns the arrays of the solution object of `solve_ode`, by name."""
+  return { k: v for k, v in vars(sol).items() if isinstance(v, np.ndarray) }
+
 
 class EpidemicsCountry( EpidemicsBase ):
 
+  # Maximum number of solutions stored for `solve_propagation`.
+  endOfDataSize = 10000
+
   def __init__( self, **kwargs ):
     
     self.country           = kwargs.pop('country', 'switzerland')
@@ -94,14 +105,21 @@ class EpidemicsCountry( EpidemicsBase ):
     }
     
     super().__init__( **kwargs )
-  
+
+    self.smc = None
+    # Solutions up to the last observation, see `solve_propagation`.
+    self.endOfData = collections.OrderedDict()
+
+    self.load_data()
+    self.process_data()
+
+  def load_data( self ):
+
     if(self.synthetic):
         self.regionalData = SyntheticData( self.datafile, self.useInfections, self.useDeaths )
     else:
         self.regionalData = CountryData(self.country, lastDay=self.lastDay,
                                         preprocess=self.preprocess, up_to_int=self.up_to_int)
-
-    self.process_data()
  
   def save_data_path( self ):
       return ( self.dataFolder, self.country, self.modelName )
@@ -170,6 +188,10 @@ class EpidemicsCountry( EpidemicsBase ):
     tt  = np.linspace(0, t[-1], int(T+1))
     sol = self.solve_ode(y0=y0,T=t[-1], t_eval = tt, N=N, p=p)
 
+    # Stored for `solve_propagation` of the samples evaluated in this process.
+    if t[-1] == T and self.smc_is_restartable():
+        self.store_end_of_data(p, int(T), solution_arrays(sol), sol.state)
+
     eps = 1e-12
     # get infected
     infected = np.diff(sol.y) 
@@ -202,6 +224,43 @@ class EpidemicsCountry( EpidemicsBase ):
     if self.useDeaths:
         y = np.concatenate( (y, self.getCases( deaths, self.data['Model']['x-deaths'])) )
  
+    self.set_reference_evaluations( s, y, p )
+
+
+  def evaluate_reference( self, p, jacobian=False ):
+    """
+    Returns the reference evaluations for the parameters `p` and, if `jacobian`
+    is set, their derivatives from the forward sensitivities `sol.gradMu` of
+    the cumulative infected, see `EpidemicsBase.evaluate_reference`.
+    """
+    if not jacobian or self.useDeaths \
+        or type(self).computational_model is not EpidemicsCountry.computational_model:
+      return super().evaluate_reference( p, jacobian )
+
+    t  = self.data['Model']['x-data']
+    y0 = self.data['Model']['Initial Condition']
+    N  = self.data['Model']['Population Size']
+
+    T   = np.ceil(t[-1])
+    tt  = np.linspace(0, t[-1], int(T+1))
+    sol = self.solve_ode(y0=y0,T=t[-1], t_eval = tt, N=N, p=p)
+    if not hasattr(sol, 'gradMu'):
+      return super().evaluate_reference( p, jacobian )
+
+    eps = 1e-12
+    infected = np.diff(sol.y)
+    gradient = np.diff(np.asarray(sol.gradMu, dtype=float), axis=0)
+    clipped  = np.isnan(infected-infected) | (infected < eps)
+    infected[clipped] = eps
+    gradient[clipped] = 0.0
+
+    idx = np.asarray(self.data['Model']['x-infected'], dtype=int) - 1
+    return infected[idx], gradient[idx]
+
+
+  def set_reference_evaluations( self, s, y, p ):
+    """Store the model evaluations `y` and the likelihood parameters in the sample `s`."""
+
     s['Reference Evaluations'] = list(y)
     
     if self.likelihoodModel == 'Normal':
@@ -226,7 +285,7 @@ class EpidemicsCountry( EpidemicsBase ):
     N  = self.data['Model']['Population Size']
 
     tt = [t[0]-1] + t.tolist()
-    sol = self.solve_ode(y0=y0,T=t[-1],t_eval=t.tolist(), N=N,p=p)
+    sol = self.solve_propagation(y0=y0, t=t, N=N, p=p)
     
     _, ir0    = y0
     incidences = np.diff(sol.y)
@@ -344,6 +403,67 @@ class EpidemicsCountry( EpidemicsBase ):
 
 
   
+  def solve_propagation( self, y0, t, N, p ):
+    """
+    Solve on the propagation times `t`, resuming from the end of the data.
+
+    For restartable models, the solution up to the last observation and the
+    state there are stored per parameter set, such that propagating again
+    (e.g. with more `futureDays`) only integrates the interval after the data.
+    The solutions of `computational_model` and of the particles of
+    `assimilate` are stored as well. The stored solutions are kept per
+    process and not pickled, so samples evaluated by other processes (e.g.
+    Korali workers) are solved again from the initial condition.
+    """
+    tEnd = int(np.ceil(self.data['Model']['x-data'][-1]))
+    T    = int(np.ceil(t[-1]))
+    if not self.smc_is_restartable() or not np.array_equal(t, np.arange(T+1)) or T <= tEnd:
+        return self.solve_ode(y0=y0,T=t[-1],t_eval=t.tolist(), N=N,p=p)
+
+    stored = self.load_end_of_data(p, tEnd)
+    if stored is None:
+        sol = self.solve_ode(y0=y0, T=tEnd, t_eval=list(range(tEnd+1)), N=N, p=p)
+        stored = (solution_arrays(sol), sol.state)
+        self.store_end_of_data(p, tEnd, *stored)
+    arrays, state = stored
+
+    sol = self.solve_ode(y0=y0, T=T, t_eval=list(range(tEnd, T+1)), N=N, p=p, state=state)
+    for k, v in arrays.items():
+        setattr(sol, k, np.concatenate((v, getattr(sol, k)[1:])))
+    return sol
+
+
+  def store_end_of_data( self, p, tEnd, arrays, state ):
+    """
+    Store the solution `arrays` on the days 0 to `tEnd` and the model `state`
+    at `tEnd` for the parameters `p`, keeping the `endOfDataSize` most
+    recently used solutions.
+    """
+    cache = self.__dict__.setdefault('endOfData', collections.OrderedDict())
+    key = (tuple(p), tEnd)
+    cache[key] = (arrays, state)
+    cache.move_to_end(key)
+    while len(cache) > self.endOfDataSize:
+      cache.popitem(last=False)
+
+
+  def load_end_of_data( self, p, tEnd ):
+    """Returns the `(arrays, state)` stored by `store_end_of_data`, or `None`."""
+    cache = self.__dict__.setdefault('endOfData', collections.OrderedDict())
+    key = (tuple(p), tEnd)
+    if key not in cache:
+      return None
+    cache.move_to_end(key)
+    return cache[key]
+
+
+  def __getstate__( self ):
+    """Return the state for pickling, without the stored solutions."""
+    state = super().__getstate__()
+    state.pop('endOfData', None)
+    return state
+
+
   def plot_intervals( self, ns=10):
 
     fig = self.new_figure()
@@ -489,3 +609,240 @@ class EpidemicsCountry( EpidemicsBase ):
         field = field[valid]
     
     return field, t
+
+
+  def smc_is_restartable( self ):
+    """Whether `solve_ode` accepts the state to restart from, see `assimilate`."""
+    return type(self).computational_model is EpidemicsCountry.computational_model \
+        and 'state' in inspect.signature(self.solve_ode).parameters
+
+
+  def smc_observation_times( self ):
+    """Returns the time of each entry of the reference data."""
+    t = []
+    if self.useInfections:
+        t = t + list(self.data['Model']['x-infected'])
+    if self.useDeaths:
+        t = t + list(self.data['Model']['x-deaths'])
+    return np.asarray(t)
+
+
+  def smc_evaluate( self, args ):
+    """
+    Evaluate a particle on the observations after the time `t0`.
+
+    Arguments:
+      args: A tuple `(p, state, t0)` of the parameters, the model state at
+            `t0` (or `None`) and the time of the last assimilated observation.
+
+    Returns:
+      A tuple `(s, state, arrays)` of the sample with the reference
+      evaluations of the observations after `t0`, the model state at the
+      last observation and the solution arrays from `t0` (or 0) to the last
+      observation. The state and the arrays are `None` if the model is not
+      restartable.
+    """
+    p, state, t0 = args
+    p   = list(p)
+    new = self.smc_observation_times() > t0
+    s   = {'Parameters': p}
+
+    if not self.smc_is_restartable():
+        self.computational_model(s)
+        for key in ['Reference Evaluations', 'Standard Deviation', 'Degrees Of Freedom', 'Dispersion']:
+            if key in s:
+                s[key] = list(np.asarray(s[key])[new])
+        return s, None, None
+
+    # Same as `computational_model`, but only from `t0` if the state is known.
+    y0 = self.data['Model']['Initial Condition']
+    N  = self.data['Model']['Population Size']
+    T  = int(np.ceil(self.data['Model']['x-data'][-1]))
+    start = 0 if state is None else int(t0)
+    sol = self.solve_ode(y0=y0, T=T, t_eval=list(range(start, T+1)), N=N, p=p, state=state)
+
+    eps = 1e-12
+    infected = np.diff(sol.y)
+    infected[np.isnan(infected-infected)] = eps
+    infected[infected < eps] = eps
+
+    y = np.array([])
+    if self.useInfections:
+        t = np.asarray(self.data['Model']['x-infected'])
+        t = t[t > t0].astype(int)
+        y = np.concatenate( (y, infected[t - 1 - start]) )
+
+    if self.useDeaths:
+        deaths = np.diff(sol.d)
+        deaths[np.isnan(deaths-deaths)] = eps
+        deaths[deaths < eps] = eps
+        t = np.asarray(self.data['Model']['x-deaths'])
+        t = t[t > t0].astype(int)
+        y = np.concatenate( (y, deaths[t - 1 - start]) )
+
+    self.set_reference_evaluations( s, y, p )
+    return s, sol.state, solution_arrays(sol)
+
+
+  def smc_store_end_of_data( self, particles, states, results, t0 ):
+    """
+    Store the solutions of `smc_evaluate` for `solve_propagation`.
+
+    Arguments:
+      particles: Parameters of the evaluated particles.
+      states: Model states at `t0` the particles were restarted from, or `None`.
+      results: Results of `smc_evaluate` for the particles.
+      t0: Time of the states.
+
+    Solutions restarted from a state are appended to the stored solution up
+    to `t0`, and skipped if there is none.
+    """
+    if not self.smc_is_restartable():
+      return
+    tEnd = int(np.ceil(self.data['Model']['x-data'][-1]))
+    for p, state, (_, newState, arrays) in zip(particles, states, results):
+      if state is not None:
+        stored = self.load_end_of_data(p, int(np.ceil(t0)))
+        if stored is None:
+          continue
+        arrays = { k: np.concatenate((v, arrays[k][1:])) for k, v in stored[0].items() }
+      self.store_end_of_data(p, tEnd, arrays, newState)
+
+
+  def smc_init( self ):
+    """
+    Initialize the particles of `assimilate` from the posterior samples.
+
+    The particles are the samples of `sample`, `sample_knested` or
+    `load_parameters` with equal weights. For restartable models, the model
+    state at the last observation is computed and cached for each particle,
+    and the solution is stored for `solve_propagation`.
+    """
+    if not self.has_been_called['sample']:
+      abort('[Error] Sample before initializing the particles')
+
+    x  = np.stack([p['Values'] for p in self.parameters], axis=1)
+    t0 = float(self.data['Model']['x-data'][-1])
+    if self.smc_is_restartable():
+      results = self.map_samples(self.smc_evaluate, [(p, None, t0) for p in x])
+      states = [state for _, state, _ in results]
+      self.smc_store_end_of_data(x, [None] * len(x), results, t0)
+    else:
+      printlog(f'{self.modelName} is not restartable, particles will be solved from t=0.')
+      states = [None] * len(x)
+
+    logEvidence = np.nan
+    if os.path.isfile(self.saveInfo['evidence']):
+      logEvidence = load_file(self.saveInfo['evidence'], '', 'json')['Log Evidence']
+
+    self.smc = {
+      'Particles': x,
+      'Log Weights': np.zeros(len(x)),
+      'States': states,
+      'Time': t0,
+      'Log Evidence': logEvidence,
+    }
+
+
+  def assimilate( self, lastDay=None, minESS=0.5, nMoves=5 ):
+    """
+    Update the posterior with the observations up to `lastDay` by sequential Monte Carlo.
+
+    Each particle is advanced from the last assimilated observation, using
+    the cached model state for restartable models, and reweighted by the
+    likelihood of the new observations. If the effective sample size drops
+    below `minESS` times the number of particles, the particles are
+    resampled and rejuvenated with `nMoves` Metropolis-Hastings moves
+    targeting the posterior of all data.
+
+    Arguments:
+      lastDay: New last day of data in format %Y-%m-%d, or `None` to reload
+               the data (e.g. an extended synthetic data file).
+      minESS: Relative effective sample size threshold for resampling.
+      nMoves: Number of Metropolis-Hastings moves per rejuvenation.
+    """
+    if getattr(self, 'smc', None) is None:
+      self.smc_init()
+    smc = self.smc
+    t0  = smc['Time']
+
+    if lastDay is not None:
+      self.lastDay = datetime.datetime.strptime(lastDay,"%Y-%m-%d").date()
+    self.load_data()
+    self.process_data()
+
+    new = self.smc_observation_times() > t0
+    if not new.any():
+      printlog('No new observations to assimilate.')
+      return
+
+    yNew = np.asarray(self.data['Model']['y-data'])[new]
+    results = self.map_samples(self.smc_evaluate, list(zip(smc['Particles'], smc['States'], [t0] * len(smc['States']))))
+    loglike = np.array([reference_log_likelihood(self.likelihoodModel, yNew, s) for s, _, _ in results])
+    self.smc_store_end_of_data(smc['Particles'], smc['States'], results, t0)
+
+    logw = smc['Log Weights'] + loglike
+    smc['Log Evidence'] += logsumexp(logw) - logsumexp(smc['Log Weights'])
+    smc['Log Weights'] = logw
+    smc['States'] = [state for _, state, _ in results]
+    smc['Time'] = float(self.data['Model']['x-data'][-1])
+
+    n = len(logw)
+    idx, _, ess = importance_resample(logw, n)
+    printlog(f"Assimilated {new.sum()} observations, effective sample size = {ess:.1f} of {n}")
+    if not np.isfinite(ess) or ess < minESS * n:
+      self.smc_rejuvenate(idx, nMoves)
+      idx = np.arange(n)
+
+    js = self.get_variables_and_distributions()
+    self.parameters = []
+    for j in range(self.nParameters):
+      self.parameters.append({})
+      self.parameters[j]['Name'] = js['Variables'][j]['Name']
+      self.parameters[j]['Values'] = smc['Particles'][idx, j]
+    self.nSamples = n
+
+    js = {}
+    js['Log Evidence'] = smc['Log Evidence']
+    js['Effective Sample Size'] = ess
+    save_file( js, self.saveInfo['evidence'], 'Log Evidence', fileType='json' )
+    self.save_posterior_samples()
+    self.has_been_called['sample'] = True
+    self.has_been_called['propagate'] = False
+
+
+  def smc_rejuvenate( self, idx, nMoves ):
+    """Resample the particles `idx` and move them with random walk Metropolis-Hastings."""
+    smc = self.smc
+    x = smc['Particles'][idx].copy()
+    n, d = x.shape
+
+    priors = self.get_prior_distributions(self.get_variables_and_distributions())
+    cov = np.atleast_2d(np.cov(x, rowvar=False)) * (2.38**2 / d)
+    cov += 1e-12 * np.diag(np.maximum(np.diag(cov), 1.0))
+    chol = np.linalg.cholesky(cov)
+
+    logpost = log_prior(priors, x) + np.asarray(self.map_samples(self.evaluate_log_likelihood, x))
+    moved = np.zeros(n, dtype=bool)
+    for _ in range(nMoves):
+      proposal = x + np.random.standard_normal((n, d)) @ chol.T
+      logpostNew = log_prior(priors, proposal)
+      inside = np.where(np.isfinite(logpostNew))[0]
+      logpostNew[inside] += self.map_samples(self.evaluate_log_likelihood, proposal[inside])
+      accept = np.log(np.random.rand(n)) < logpostNew - logpost
+      x[accept] = proposal[accept]
+      logpost[accept] = logpostNew[accept]
+      moved |= accept
+      printlog(f"Rejuvenation acceptance rate = {accept.mean():.2f}")
+
+    states = [smc['States'][i] for i in idx]
+    if self.smc_is_restartable() and moved.any():
+      t0 = smc['Time']
+      results = self.map_samples(self.smc_evaluate, [(p, None, t0) for p in x[moved]])
+      for i, (_, state, _) in zip(np.where(moved)[0], results):
+        states[i] = state
+      self.smc_store_end_of_data(x[moved], [None] * len(results), results, t0)
+
+    smc['Particles'] = x
+    smc['Log Weights'] = np.zeros(n)
+    smc['States'] = states
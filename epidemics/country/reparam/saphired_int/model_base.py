@@ -15,7 +15,7 @@ class ModelBase( EpidemicsCountry ):
 
     super().__init__( **kwargs )
 
-  def solve_ode( self, y0, T, t_eval, N, p ):
+  def solve_ode( self, y0, T, t_eval, N, p, state=None ):
     
     saphire_int = libepidemics.country.saphire_int_reparam
     dp         = libepidemics.country.DesignParameters(N=N)
@@ -35,6 +35,9 @@ class ModelBase( EpidemicsCountry ):
 
     y0cpp   = (s0, e0, p0, ir0, iu0, 0.0, 0.0) # S E P Ir Iu R D
     
+    if state is not None:
+        y0cpp = tuple(state) # restart at t_eval[0]
+
     initial = saphire_int.State(y0cpp)
     
     cpp_res = cppsolver.solve(params, initial, t_eval=t_eval, dt = 0.01)
@@ -66,4 +69,6 @@ class ModelBase( EpidemicsCountry ):
     sol.r = recovered
     sol.d = deaths
  
+    sol.state = cpp_res[-1].tolist()
+
     return sol
@@ -13,7 +13,7 @@ class ModelBase( EpidemicsCountry ):
 
     super().__init__( **kwargs )
 
-  def solve_ode( self, y0, T, t_eval, N, p ):
+  def solve_ode( self, y0, T, t_eval, N, p, state=None ):
 
     seiir_int = libepidemics.country.seiir_int_reparam
     dp        = libepidemics.country.DesignParameters(N=N)
@@ -31,6 +31,9 @@ class ModelBase( EpidemicsCountry ):
  
     y0cpp   = (s0, e0, ir0, 0.0, 0.0) # S E Ir Iu  R
     
+    if state is not None:
+        y0cpp = tuple(state) # restart at t_eval[0]
+
     initial = seiir_int.State(y0cpp)
  
     cpp_res = cppsolver.solve_params_ad(params, initial, t_eval=t_eval, dt = 0.1)
@@ -69,7 +72,12 @@ class ModelBase( EpidemicsCountry ):
     sol.iu      = infectedu
     sol.e       = exposed
     sol.r       = recovered
-    sol.gradMu  = gradmu
-    sol.gradSig = gradsig
+    # The derivatives of a restarted solve miss the dependence before the
+    # restart, so gradients are only returned when starting from y0.
+    if state is None:
+        sol.gradMu  = gradmu
+        sol.gradSig = gradsig
  
+    sol.state = [x.val() for x in cpp_res[-1].tolist()]
+
     return sol
@@ -13,7 +13,7 @@ class ModelBase( EpidemicsCountry ):
 
     super().__init__( **kwargs )
 
-  def solve_ode( self, y0, T, t_eval, N, p ):
+  def solve_ode( self, y0, T, t_eval, N, p, state=None ):
     
     seiird2_int = libepidemics.country.seiird2_int_reparam
     dp          = libepidemics.country.DesignParameters(N=N)
@@ -32,6 +32,9 @@ class ModelBase( EpidemicsCountry ):
  
     y0cpp  = (s0, e0, ir0, iu0, 0.0, 0.0) # S E Ir Iu  R D
     
+    if state is not None:
+        y0cpp = tuple(state) # restart at t_eval[0]
+
     initial = seiird2_int.State(y0cpp)
  
     cpp_res = cppsolver.solve(params, initial, t_eval=t_eval, dt = 0.01)
@@ -68,4 +71,6 @@ class ModelBase( EpidemicsCountry ):
     sol.cir = cir
     sol.ciu = ciu
  
+    sol.state = cpp_res[-1].tolist()
+
     return sol
@@ -15,7 +15,7 @@ class ModelBase( EpidemicsCountry ):
 
     super().__init__( **kwargs )
 
-  def solve_ode( self, y0, T, t_eval, N, p ):
+  def solve_ode( self, y0, T, t_eval, N, p, state=None ):
     
     seird_int = libepidemics.country.seird_int_reparam
     dp        = libepidemics.country.DesignParameters(N=N)
@@ -31,6 +31,9 @@ class ModelBase( EpidemicsCountry ):
     s0 = s0 - e0
 
     y0cpp   = (s0, e0, i0, 0.0, 0.0) # S E I R D
+    if state is not None:
+        y0cpp = tuple(state) # restart at t_eval[0]
+
     initial = seird_int.State(y0cpp)
     
     cpp_res = cppsolver.solve(params, initial, t_eval=t_eval, dt = 0.01)
@@ -57,4 +60,6 @@ class ModelBase( EpidemicsCountry ):
     sol.r = recovered
     sol.d = deaths
  
+    sol.state = cpp_res[-1].tolist()
+
     return sol
@@ -14,7 +14,7 @@ class ModelBase( EpidemicsCountry ):
 
     super().__init__( **kwargs )
 
-  def solve_ode( self, y0, T, t_eval, N, p ):
+  def solve_ode( self, y0, T, t_eval, N, p, state=None ):
     
     
     sird_int   = libepidemics.country.sird_int_reparam
@@ -25,6 +25,9 @@ class ModelBase( EpidemicsCountry ):
     
     s0, i0 = y0
     y0cpp   = (s0, i0, 0.0, 0.0) # S I R D
+    if state is not None:
+        y0cpp = tuple(state) # restart at t_eval[0]
+
     initial = sird_int.State(y0cpp)
     
     cpp_res = cppsolver.solve(params, initial, t_eval=t_eval, dt = 0.1)
@@ -48,4 +51,6 @@ class ModelBase( EpidemicsCountry ):
     sol.r = recovered
     sol.d = deaths
  
+    sol.state = cpp_res[-1].tolist()
+
     return sol
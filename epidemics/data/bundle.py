@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+
+"""
+Offline data bundles: a versioned local mirror of all files downloaded by
+`epidemics.utils.io.download_and_save`.
+
+Compute nodes without internet access can use a mirror prepared on a login
+node (or a `.tar.gz` bundle of it):
+
+    # On a machine with internet.
+    python3 -m epidemics.data.bundle prefetch --root /scratch/epidemics-mirror
+    python3 -m epidemics.data.bundle pack /scratch/epidemics-mirror/latest mirror.tar.gz
+
+    # On the compute node.
+    export EPIDEMICS_DATA_MIRROR=/scratch/epidemics-mirror/latest  # or mirror.tar.gz
+
+With the mirror active, all loaders read from the local copy and never touch
+the network.
+"""
+
+from epidemics.data import DATA_DOWNLOADS_DIR
+from epidemics.utils.io import MIRROR_MANIFEST
+
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import datetime
+import functools
+import hashlib
+import http.server
+import json
+import os
+import pathlib
+import tarfile
+import threading
+import urllib.request
+
+DataSource = namedtuple('DataSource', ('url', 'filename', 'group'))
+
+_OPENZH = 'https://raw.githubusercontent.com/daenuprobst/covid19-cases-switzerland/master/'
+
+# All files downloaded by the loaders. The filenames match the names used in
+# DATA_DOWNLOADS_DIR. Large GIS archives are not prefetched by default.
+SOURCES = [
+    DataSource('https://hgis.uw.edu/virus/assets/virus.csv', 'hgis.virus.csv', 'cases'),
+    DataSource(_OPENZH + 'covid19_cases_switzerland_openzh.csv',
+               'covid19_cases_switzerland_openzh.csv', 'cases'),
+    *[
+        DataSource(_OPENZH + f'covid19_{field}_switzerland_openzh.csv',
+                   f'covid19_{field}_switzerland_openzh.csv', 'cases')
+        for field in ['fatalities', 'released', 'hospitalized', 'icu', 'vent']
+    ],
+    DataSource('https://www.bfs.admin.ch/bfsstatic/dam/assets/8507281/master',
+               'bfs_residence_work.xlsx', 'bfs'),
+    DataSource('https://www.bfs.admin.ch/bfsstatic/dam/assets/9635941/master',
+               'bfs_municipality_population.xlsx', 'bfs'),
+    DataSource('https://shop.swisstopo.admin.ch/shop-server/resources/products/swissBOUNDARIES3D/download',
+               'swissBOUNDARIES3D.zip', 'gis'),
+    DataSource('https://zenodo.org/record/3716134/files/Verkehrszonen_Schweiz_NPVM_2017.zip',
+               'Verkehrszonen_Schweiz_NPVM_2017.zip', 'gis'),
+    DataSource('https://zenodo.org/record/3716134/files/DWV_2017_OeV_Wegematrizen_bin%C3%A4r.zip',
+               'DWV_2017_OeV_Wegematrizen_bin.zip', 'gis'),
+]
+
+DEFAULT_GROUPS = ('cases', 'bfs')
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _fetch(source, target_dir, base_url):
+    """Download one source into `target_dir` and return its manifest entry."""
+    url = source.url if base_url is None else base_url.rstrip('/') + '/' + source.filename
+    # Not using `download`, its progress output is not thread-friendly.
+    with urllib.request.urlopen(url) as req:
+        data = req.read()
+    print(f"[Epidemics] Downloaded {url}.", flush=True)
+    path = target_dir / source.filename
+    tmp = path.with_name(path.name + '.part')
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return {'filename': source.filename, 'sha256': _sha256(path), 'size': len(data)}
+
+
+def prefetch(root, *, version=None, groups=DEFAULT_GROUPS, base_url=None, jobs=8):
+    """Download all known sources in parallel into `<root>/<version>/`.
+
+    On success, the `<root>/latest` symlink is updated to point to the new
+    version.
+
+    Arguments:
+        root: Mirror root directory.
+        version: (optional) Mirror version, defaults to today's date.
+        groups: Source groups to download, see `SOURCES`.
+        base_url: (optional) Download `<base_url>/<filename>` instead of the
+                  original URLs, e.g. from a local HTTP stand-in (see `serve`).
+        jobs: Number of concurrent downloads.
+
+    Returns:
+        The path of the versioned mirror directory.
+    """
+    root = pathlib.Path(root)
+    if version is None:
+        version = datetime.date.today().isoformat()
+    target_dir = root / version
+    target_dir.mkdir(parents=True, exist_ok=True)
+
+    sources = [s for s in SOURCES if s.group in groups]
+    fetch = functools.partial(_fetch, target_dir=target_dir, base_url=base_url)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        entries = list(executor.map(fetch, sources))
+
+    manifest = {
+        'version': version,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'files': {s.url: entry for s, entry in zip(sources, entries)},
+    }
+    with open(target_dir / MIRROR_MANIFEST, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    latest = root / 'latest'
+    tmp = root / 'latest.tmp'
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    os.symlink(version, tmp)
+    os.replace(tmp, latest)
+    print(f"[Epidemics] Stored {len(sources)} files to the data mirror {target_dir}.", flush=True)
+    return target_dir
+
+
+def verify(mirror_dir):
+    """Check the sizes and checksums of all files of a mirror.
+
+    Returns a list of filenames that are missing or corrupted.
+    """
+    mirror_dir = pathlib.Path(mirror_dir)
+    with open(mirror_dir / MIRROR_MANIFEST) as f:
+        manifest = json.load(f)
+    bad = []
+    for entry in manifest['files'].values():
+        path = mirror_dir / entry['filename']
+        if not path.exists() or _sha256(path) != entry['sha256']:
+            bad.append(entry['filename'])
+    return bad
+
+
+def pack(mirror_dir, output):
+    """Pack a versioned mirror directory into a `.tar.gz` bundle."""
+    mirror_dir = pathlib.Path(mirror_dir).resolve()
+    with open(mirror_dir / MIRROR_MANIFEST) as f:
+        version = json.load(f)['version']
+    with tarfile.open(output, 'w:gz') as tar:
+        tar.add(mirror_dir, arcname=version)
+    print(f"[Epidemics] Packed data mirror {mirror_dir} to {output}.", flush=True)
+
+
+def load_bundle(path, root=DATA_DOWNLOADS_DIR / 'mirror'):
+    """Extract a `.tar.gz` bundle created by `pack` (if not already extracted).
+
+    Returns:
+        The path of the extracted versioned mirror directory.
+    """
+    root = pathlib.Path(root)
+    with tarfile.open(path, 'r:gz') as tar:
+        members = tar.getmembers()
+        version = members[0].name.split('/')[0]
+        if version in ('', '.', '..'):
+            raise ValueError(f"Unexpected member {members[0].name} in the bundle {path}.")
+        target_dir = root / version
+        if not (target_dir / MIRROR_MANIFEST).exists():
+            for member in members:
+                parts = pathlib.PurePosixPath(member.name).parts
+                if member.name.startswith('/') or '..' in parts or parts[0] != version \
+                        or not (member.isfile() or member.isdir()):
+                    raise ValueError(f"Unexpected member {member.name} in the bundle {path}.")
+            root.mkdir(parents=True, exist_ok=True)
+            if hasattr(tarfile, 'data_filter'):
+                tar.extractall(root, filter='data')
+            else:
+                tar.extractall(root)
+    return target_dir
+
+
+def serve(directory, port=0):
+    """Serve `directory` over HTTP from a background thread.
+
+    Used as a local stand-in for the real data sources, e.g. in tests:
+        server, base_url = serve(dir_with_files)
+        prefetch(root, base_url=base_url)
+        server.shutdown()
+
+    Returns:
+        A tuple (server, base URL).
+    """
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    handler = functools.partial(Handler, directory=str(directory))
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('prefetch', help="Download all sources into a new mirror version.")
+    p.add_argument('--root', type=str, default=str(DATA_DOWNLOADS_DIR / 'mirror'), help="Mirror root directory.")
+    p.add_argument('--version', type=str, default=None, help="Mirror version (default: today's date).")
+    p.add_argument('--groups', type=str, nargs='+', default=list(DEFAULT_GROUPS),
+                   choices=sorted(set(s.group for s in SOURCES)), help="Source groups to download.")
+    p.add_argument('--base-url', type=str, default=None, help="Download from a local HTTP stand-in instead.")
+    p.add_argument('--jobs', type=int, default=8, help="Number of concurrent downloads.")
+
+    p = sub.add_parser('pack', help="Pack a mirror version into a .tar.gz bundle.")
+    p.add_argument('mirror', type=str, help="Versioned mirror directory.")
+    p.add_argument('output', type=str, help="Output .tar.gz file.")
+
+    p = sub.add_parser('verify', help="Verify checksums of a mirror version.")
+    p.add_argument('mirror', type=str, help="Versioned mirror directory.")
+
+    p = sub.add_parser('serve', help="Serve a directory over HTTP.")
+    p.add_argument('directory', type=str, help="Directory to serve.")
+    p.add_argument('--port', type=int, default=8000)
+
+    args = parser.parse_args(argv)
+    if args.command == 'prefetch':
+        prefetch(args.root, version=args.version, groups=args.groups,
+                 base_url=args.base_url, jobs=args.jobs)
+    elif args.command == 'pack':
+        pack(args.mirror, args.output)
+    elif args.command == 'verify':
+        bad = verify(args.mirror)
+        if bad:
+            raise SystemExit(f"Missing or corrupted files: {bad}")
+        print("[Epidemics] All files OK.")
+    elif args.command == 'serve':
+        server, base_url = serve(args.directory, args.port)
+        print(f"[Epidemics] Serving {args.directory} at {base_url}.", flush=True)
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,6 @@
 import numpy as np
+import scipy.optimize
+import scipy.stats
 import korali
 
 import json
@@ -15,9 +17,12 @@ matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 plt.ioff()
 
-from epidemics.utils.misc import prepare_folder, make_path, save_file, positive_standard_t, get_truncated_normal, abort, printlog
+from epidemics.utils.misc import prepare_folder, make_path, save_file, positive_standard_t, get_truncated_normal, abort, printlog, \
+                                 TruncatedDistribution
 from epidemics.utils.compute_credible_intervals import compute_credible_intervals
 from epidemics.utils.nested import priorTransformFromJs, getPosteriorFromResult, WorkerPool
+from epidemics.utils.warm_start import WarmStartProposal, importance_resample, load_posterior_samples, \
+    log_prior, reference_log_likelihood, save_posterior_samples
 
 class EpidemicsBase:
 
@@ -70,6 +75,7 @@ class EpidemicsBase:
       'nested results': './nested_res.pickle',
       'figures': './figures/',
       'evidence': 'evidence.json',
+      'posterior samples': 'posterior_samples.npz',
       'cmaes': 'cmaes.json'
     }
 
@@ -140,6 +146,8 @@ class EpidemicsBase:
       del state['e']
     if 'intervalVariables' in state:
       del state['intervalVariables']
+    if 'workerPool' in state:
+      del state['workerPool']
     return state
 
 
@@ -190,7 +198,17 @@ class EpidemicsBase:
     return js
 
 
-  def sample(self, nSamples=1000, cov=0.4, maxiter=100 ):
+  def sample(self, nSamples=1000, cov=0.4, maxiter=100, warmStart=None, minESS=0.5 ):
+    """
+    Sample the posterior with TMCMC.
+
+    If `warmStart` is given (a previous run's output folder or its posterior
+    samples file), the posterior is first computed by importance sampling
+    from the previous posterior, see `sample_warm_start`. TMCMC is run only
+    if the effective sample size is below `minESS * nSamples`.
+    """
+    if warmStart and self.sample_warm_start(warmStart, nSamples, minESS):
+      return
 
     self.e = korali.Experiment()
 
@@ -234,11 +252,20 @@ class EpidemicsBase:
       self.parameters[j]['Name'] = self.e['Variables'][j]['Name']
       self.parameters[j]['Values'] = np.asarray( [myDatabase[k][j] for k in range(self.nSamples)] )
 
+    self.save_posterior_samples()
     self.has_been_called['sample'] = True
     self.has_been_called['propagate'] = False
     printlog('Done copying variables.')
 
-  def sample_knested(self, nLiveSamples=1500, freq=1500, maxiter=1e9, dlogz=0.1, batch=1 ):
+  def sample_knested(self, nLiveSamples=1500, freq=1500, maxiter=1e9, dlogz=0.1, batch=1, warmStart=None, minESS=0.5 ):
+    """
+    Sample the posterior and compute the evidence with nested sampling.
+
+    See `sample` for `warmStart` and `minESS`, the warm start draws
+    `nLiveSamples` samples.
+    """
+    if warmStart and self.sample_warm_start(warmStart, nLiveSamples, minESS):
+      return
 
     self.e = korali.Experiment()
 
@@ -292,11 +319,138 @@ class EpidemicsBase:
       self.parameters[j]['Name'] = self.e['Variables'][j]['Name']
       self.parameters[j]['Values'] = np.asarray( [myDatabase[k][j] for k in range(self.nSamples)] )
 
+    self.save_posterior_samples()
     self.has_been_called['sample'] = True
     self.has_been_called['propagate'] = False
     printlog('Done copying variables.')
 
 
+  def get_prior_distributions( self, js ):
+    """
+    Returns the priors set by `set_variables_and_distributions` as frozen scipy
+    distributions. The informed priors are truncated to the variable bounds
+    `Minimum` and `Maximum`, as in Korali.
+    """
+    informed = getattr(self, 'useInformedPriors', False)
+    priors = []
+    for k in range(self.nParameters):
+      name = js['Variables'][k]['Name']
+      lower = js['Distributions'][k]['Minimum']
+      upper = js['Distributions'][k]['Maximum']
+      if informed and name in ('D', 'Z', 'Zl', 'Y'):
+        gamma = scipy.stats.gamma( self.informed_priors[name + '_shape'],
+                                   scale=self.informed_priors[name + '_scale'] )
+        priors.append( TruncatedDistribution( gamma, lower, upper ) )
+      else:
+        priors.append( scipy.stats.uniform( lower, upper - lower ) )
+    return priors
+
+
+  def evaluate_log_likelihood( self, p ):
+    """Returns the log-likelihood of the data for the parameters `p`."""
+    s = {'Parameters': list(p)}
+    self.computational_model(s)
+    return reference_log_likelihood(self.likelihoodModel, self.data['Model']['y-data'], s)
+
+
+  def evaluate_reference( self, p, jacobian=False ):
+    """
+    Returns the reference evaluations for the parameters `p` and, if `jacobian`
+    is set and the model provides sensitivities, their derivatives with respect
+    to `p` (num evaluations x num parameters), otherwise `None`.
+    """
+    s = {'Parameters': list(p)}
+    self.computational_model(s)
+    return np.asarray(s['Reference Evaluations'], dtype=float), None
+
+
+  def map_samples( self, func, samples ):
+    """
+    Returns `[func(x) for x in samples]`, evaluated by a `WorkerPool` of
+    `nThreads` processes which is kept for later calls, or serially if
+    `func` (e.g. a method of a model with unpicklable members) cannot be pickled.
+    """
+    if self.nThreads > 1 and len(samples) > 1:
+      try:
+        pickle.dumps(func)
+      except (pickle.PicklingError, AttributeError, TypeError):
+        printlog('Cannot pickle the model, evaluating the samples serially.')
+      else:
+        if getattr(self, 'workerPool', None) is None:
+          self.workerPool = WorkerPool(self.nThreads)
+        return self.workerPool.map(func, samples)
+    return [func(x) for x in samples]
+
+
+  def sample_warm_start( self, path, nSamples, minESS=0.5 ):
+    """
+    Sample the posterior by importance sampling from a previous posterior.
+
+    Samples are drawn from a mixture of a kernel density estimate of the
+    previous posterior samples and the prior, weighted by the ratio of the
+    prior times the likelihood of the current data and the proposal density,
+    and resampled. The log evidence is the log of the mean weight.
+
+    Arguments:
+      path: Output folder of a previous run or its posterior samples file.
+      nSamples: Number of proposal samples and of posterior samples.
+      minESS: Minimum effective sample size, relative to `nSamples`.
+
+    Returns:
+      `True` on success, `False` if the effective sample size is too small
+      and the posterior has to be sampled from scratch.
+    """
+    js = self.get_variables_and_distributions()
+    names = [v['Name'] for v in js['Variables']]
+    priors = self.get_prior_distributions(js)
+
+    printlog(f'Warm start from {path}...')
+    previous = load_posterior_samples(path, names)
+    proposal = WarmStartProposal(previous, priors)
+    x = proposal.sample(nSamples)
+
+    logw = log_prior(priors, x) - proposal.logpdf(x)
+    inside = np.where(np.isfinite(logw))[0]
+    logw[inside] += self.map_samples(self.evaluate_log_likelihood, x[inside])
+
+    idx, logEvidence, ess = importance_resample(logw, nSamples)
+    printlog(f"Warm start effective sample size = {ess:.1f} of {nSamples}")
+    if not np.isfinite(logEvidence) or ess < minESS * nSamples:
+      printlog('Effective sample size too small, sampling from scratch.')
+      return False
+
+    js = {}
+    js['Log Evidence'] = logEvidence
+    # Delta-method variance of the log of the mean weight w, the counterpart of
+    # 'LogEvidence Var' of Korali: Var[log mean(w)] ~ Var[w] / (n mean(w)^2)
+    # = (mean(w^2) / mean(w)^2 - 1) / n = 1/ess - 1/n with ess = n mean(w)^2 / mean(w^2).
+    js['Error'] = 1.0/ess - 1.0/len(logw)
+    js['Warm Start'] = os.path.abspath(path)
+    js['Effective Sample Size'] = ess
+    printlog(f"Log Evidence = {js['Log Evidence']}")
+    save_file( js, self.saveInfo['evidence'], 'Log Evidence', fileType='json' )
+
+    self.nSamples = nSamples
+    self.parameters = []
+    for j in range(self.nParameters):
+      self.parameters.append({})
+      self.parameters[j]['Name'] = names[j]
+      self.parameters[j]['Values'] = x[idx, j]
+
+    self.save_posterior_samples()
+    self.has_been_called['sample'] = True
+    self.has_been_called['propagate'] = False
+    return True
+
+
+  def save_posterior_samples( self ):
+    """Store the posterior samples for warm starting later runs."""
+    names = [p['Name'] for p in self.parameters]
+    values = np.stack([p['Values'] for p in self.parameters], axis=1)
+    prepare_folder( os.path.dirname(self.saveInfo['posterior samples']) )
+    save_posterior_samples( self.saveInfo['posterior samples'], names, values )
+
+
   def optimize( self, populationSize, maxiter=1000 ):
 
     self.nSamples = 1
@@ -352,6 +506,136 @@ class EpidemicsBase:
     js["Names"]     = names
     save_file( js, self.saveInfo['cmaes'], 'Optimum', fileType='json' )
 
+
+  def least_squares( self, maxiter=100, nStarts=4, seed=12345 ):
+    """
+    Deterministic point estimate of the parameters, an alternative to `optimize`.
+
+    The model parameters are fitted with a bounded Levenberg-Marquardt type
+    (trust region reflective) least squares method, minimizing the residuals
+    (model - data) / sqrt(max(data, 1)) within the bounds of the variables.
+    Columns of the Jacobian are taken from the sensitivities returned by
+    `evaluate_reference` if they agree with finite differences at each
+    starting point, and from finite differences otherwise. The statistical
+    parameter of the likelihood (e.g. the dispersion) is then fitted by
+    maximizing the posterior. The result is stored like the result of `optimize`.
+
+    Arguments:
+      maxiter: Maximum number of residual evaluations of each start.
+      nStarts: Number of starting points, the median of the priors and
+               `nStarts-1` random points within the priors.
+      seed: Seed of the random starting points.
+
+    Returns:
+      The content of `cmaes.json`, with the log-posterior as 'Value'.
+    """
+    js = self.get_variables_and_distributions()
+    names = [v['Name'] for v in js['Variables']]
+    priors = self.get_prior_distributions(js)
+
+    nStat = 0 if self.likelihoodModel in ('Poisson', 'Geometric') else 1
+    nModel = self.nParameters - nStat
+    # Bounds of the variables, which the priors are truncated to.
+    lower = np.array([d['Minimum'] for d in js['Distributions'][:nModel]], dtype=float)
+    upper = np.array([d['Maximum'] for d in js['Distributions'][:nModel]], dtype=float)
+    stat = np.array([prior.median() for prior in priors[nModel:]], dtype=float)
+
+    y = np.asarray(self.data['Model']['y-data'], dtype=float)
+    scale = np.sqrt(np.maximum(y, 1.0))
+    nEvaluations = [0]
+    cache = {}
+
+    def evaluate( theta, jacobian=False ):
+      key = (theta.tobytes(), jacobian)
+      if key not in cache:
+        cache.clear()
+        nEvaluations[0] += 1
+        cache[key] = self.evaluate_reference(np.concatenate([theta, stat]), jacobian=jacobian)
+      return cache[key]
+
+    def difference( theta, m, j ):
+      h = 1e-6 * max(abs(theta[j]), 1.0)
+      if theta[j] + h > upper[j]:
+        h = -h
+      x = theta.copy()
+      x[j] += h
+      return (evaluate(x)[0] - m) / h
+
+    def residuals( theta ):
+      return (evaluate(theta, useSensitivities)[0] - y) / scale
+
+    def jacobian( theta ):
+      m, J = evaluate(theta, useSensitivities)
+      D = np.empty((len(m), nModel))
+      for j in range(nModel):
+        D[:, j] = J[:, j] if j in exact else difference(theta, m, j)
+      return D / scale[:, None]
+
+    rng = np.random.RandomState(seed)
+    u = np.vstack([np.full(nModel, 0.5), rng.uniform(0.05, 0.95, size=(nStarts - 1, nModel))])
+    starts = np.column_stack([prior.ppf(u[:, j]) for j, prior in enumerate(priors[:nModel])])
+
+    def check_sensitivities( theta ):
+      """Returns the columns of the sensitivities which agree with finite differences at `theta`."""
+      m, J = evaluate(theta, jacobian=True)
+      agree = set()
+      if J is not None:
+        J = np.asarray(J, dtype=float)
+        for j in range(nModel):
+          D = difference(theta, m, j)
+          if np.linalg.norm(J[:, j] - D) <= 1e-2 * np.linalg.norm(D) + 1e-12:
+            agree.add(j)
+      return agree
+
+    # Sensitivities may miss dependencies, e.g. through the initial condition,
+    # a column is used only while it agrees at all starting points so far.
+    exact = set(range(nModel))
+    best = None
+    for k, x0 in enumerate(starts):
+      exact &= check_sensitivities(x0)
+      useSensitivities = len(exact) > 0
+      if useSensitivities:
+        printlog(f"Start {k}: using sensitivities for {[names[j] for j in sorted(exact)]}, "
+                 f"finite differences for the other parameters.")
+      res = scipy.optimize.least_squares(residuals, x0, jac=jacobian, bounds=(lower, upper),
+                                         method='trf', x_scale='jac', max_nfev=maxiter)
+      printlog(f"Start {k}: cost {res.cost:.6e} after {res.nfev} evaluations ({res.message})")
+      if best is None or res.cost < best.cost:
+        best = res
+
+    def negative_log_posterior( p ):
+      value = self.evaluate_log_likelihood(p) + sum(prior.logpdf(x) for prior, x in zip(priors, p))
+      return -value if np.isfinite(value) else np.inf
+
+    if nStat:
+      bounds = priors[-1].ppf([1e-6, 1.0 - 1e-6])
+      res = scipy.optimize.minimize_scalar(lambda x: negative_log_posterior(np.append(best.x, x)),
+                                           bounds=bounds, method='bounded')
+      nEvaluations[0] += res.nfev
+      stat = np.array([res.x])
+
+    p = np.concatenate([best.x, stat])
+    value = -float(negative_log_posterior(p))
+    printlog(f"Log-posterior {value:.6e} after {nEvaluations[0]} model evaluations.")
+
+    self.nSamples = 1
+    self.parameters = []
+    for j in range(self.nParameters):
+      self.parameters.append({})
+      self.parameters[j]['Name'] = names[j]
+      self.parameters[j]['Values'] = np.asarray( [p[j]] )
+
+    self.has_been_called['optimize'] = True
+    self.has_been_called['propagate'] = False
+
+    js = {}
+    js["Value"]     = value
+    js["Parameter"] = p.tolist()
+    js["Names"]     = names
+    save_file( js, self.saveInfo['cmaes'], 'Optimum', fileType='json' )
+    return js
+
+
   def set_variables_and_distributions( self, js ):
 
     nP = self.nParameters
@@ -0,0 +1,127 @@
+"""
+Versioned binary container of named 1D arrays, read with mmap.
+
+The format is shared with the C++ reader, see src/epidemics/utils/binary.h.
+All values are little-endian:
+
+    header:      magic "EPIDBIN\\0", uint32 version, uint32 num_arrays, char kind[16]
+    array table: num_arrays x (char name[40], uint32 dtype, uint32 reserved,
+                               uint64 offset, uint64 count)
+    data:        raw arrays, each 8-byte aligned
+"""
+
+import numpy as np
+
+MAGIC = b'EPIDBIN\0'
+VERSION = 1
+
+_HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'), ('version', '<u4'), ('num_arrays', '<u4'), ('kind', 'S16')])
+_ENTRY_DTYPE = np.dtype([
+    ('name', 'S40'), ('dtype', '<u4'), ('reserved', '<u4'),
+    ('offset', '<u8'), ('count', '<u8')])
+_HEADER_SIZE = _HEADER_DTYPE.itemsize
+
+# Type codes, must match `BinaryDType` in binary.h.
+_CODE_TO_DTYPE = {
+    1: np.dtype('<f8'),
+    2: np.dtype('<i4'),
+    3: np.dtype('<i8'),
+    4: np.dtype('u1'),
+}
+_DTYPE_TO_CODE = {dtype: code for code, dtype in _CODE_TO_DTYPE.items()}
+
+_ALIGNMENT = 8
+
+
+def is_binary_file(path):
+    """Check whether the file starts with the binary container magic."""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except FileNotFoundError:
+        return False
+
+
+def save_arrays(path, kind, arrays):
+    """Store a dict of 1D arrays to a binary container.
+
+    Arguments:
+        path: Output file path.
+        kind: Content type (at most 16 characters), checked by readers.
+        arrays: A dict {name: array}. Arrays must be of a supported type
+                (float64, int32, int64 or uint8), multidimensional arrays
+                are stored flattened in the C order.
+    """
+    names = list(arrays)
+    data = []
+    for name in names:
+        a = np.ascontiguousarray(arrays[name])
+        dtype = a.dtype.newbyteorder('<') if a.dtype.itemsize > 1 else a.dtype
+        if dtype not in _DTYPE_TO_CODE:
+            raise TypeError(f"Unsupported dtype {a.dtype} of the array {name!r}.")
+        if len(name.encode('ascii')) > _ENTRY_DTYPE['name'].itemsize:
+            raise ValueError(f"Array name {name!r} too long.")
+        data.append(a.astype(dtype, copy=False).ravel())
+
+    header = np.zeros(1, dtype=_HEADER_DTYPE)
+    header['magic'] = MAGIC
+    header['version'] = VERSION
+    header['num_arrays'] = len(names)
+    header['kind'] = kind.encode('ascii')
+
+    table = np.zeros(len(names), dtype=_ENTRY_DTYPE)
+    offset = _HEADER_SIZE + len(names) * _ENTRY_DTYPE.itemsize
+    for k, (name, a) in enumerate(zip(names, data)):
+        offset = -(-offset // _ALIGNMENT) * _ALIGNMENT
+        table[k] = (name.encode('ascii'), _DTYPE_TO_CODE[a.dtype], 0, offset, a.size)
+        offset += a.nbytes
+
+    with open(path, 'wb') as f:
+        f.write(header.tobytes())
+        f.write(table.tobytes())
+        for entry, a in zip(table, data):
+            f.write(b'\0' * (int(entry['offset']) - f.tell()))
+            a.tofile(f)
+
+
+def load_arrays(path, kind=None):
+    """Load arrays stored with `save_arrays`.
+
+    The file is memory-mapped and the returned arrays are read-only views,
+    no data is read until accessed.
+
+    Arguments:
+        path: File path.
+        kind: (optional) Expected content type.
+
+    Returns:
+        A dict {name: 1D numpy array}.
+    """
+    buf = np.memmap(path, dtype=np.uint8, mode='r')
+    if buf.size < _HEADER_SIZE:
+        raise ValueError(f"File {path} too small to be a binary container.")
+    header = buf[:_HEADER_SIZE].view(_HEADER_DTYPE)[0]
+    if buf[:len(MAGIC)].tobytes() != MAGIC:
+        raise ValueError(f"File {path} is not a binary container.")
+    if header['version'] != VERSION:
+        raise ValueError(f"File {path} has format version {header['version']}, expected {VERSION}.")
+    file_kind = header['kind'].decode('ascii')
+    if kind is not None and file_kind != kind:
+        raise ValueError(f"Expected {kind!r} in {path}, found {file_kind!r}.")
+
+    num_arrays = int(header['num_arrays'])
+    table_end = _HEADER_SIZE + num_arrays * _ENTRY_DTYPE.itemsize
+    table = buf[_HEADER_SIZE:table_end].view(_ENTRY_DTYPE)
+    out = {}
+    for entry in table:
+        name = entry['name'].decode('ascii')
+        dtype = _CODE_TO_DTYPE.get(int(entry['dtype']))
+        if dtype is None:
+            raise ValueError(f"Unknown dtype {entry['dtype']} of the array {name!r} in {path}.")
+        begin = int(entry['offset'])
+        end = begin + int(entry['count']) * dtype.itemsize
+        if end > buf.size:
+            raise ValueError(f"Array {name!r} in {path} is truncated.")
+        out[name] = buf[begin:end].view(dtype=dtype, type=np.ndarray)
+    return out
@@ -1,3 +1,4 @@
+import numpy as np
 import pandas
 
 from pathlib import Path
@@ -32,10 +33,49 @@ def cache(func):
     return functools.wraps(func)(inner)
 
 
+def save_df_npz(df, path):
+    """Store a pandas.DataFrame to a typed binary `.npz` file.
+
+    String columns are stored as categorical (int32 codes + categories),
+    integer columns are narrowed to int32 where possible, other columns are
+    stored as they are. See `load_df_npz`.
+    """
+    arrays = {'__columns__': np.array([str(c) for c in df.columns])}
+    for k, name in enumerate(df.columns):
+        column = df[name]
+        if not pandas.api.types.is_numeric_dtype(column.dtype):
+            cat = pandas.Categorical(column)
+            arrays[f'{k}.codes'] = cat.codes.astype(np.int32)
+            arrays[f'{k}.categories'] = np.asarray(cat.categories, dtype=str)
+        else:
+            values = column.to_numpy()
+            if values.dtype.kind in 'iu' and len(values) \
+                    and values.min() >= np.iinfo(np.int32).min \
+                    and values.max() <= np.iinfo(np.int32).max:
+                values = values.astype(np.int32)
+            arrays[f'{k}.values'] = values
+    with open(path, 'wb') as f:
+        np.savez(f, **arrays)
+
+
+def load_df_npz(path):
+    """Load a pandas.DataFrame stored with `save_df_npz`."""
+    with np.load(path, allow_pickle=False) as npz:
+        columns = {}
+        for k, name in enumerate(npz['__columns__']):
+            if f'{k}.codes' in npz:
+                columns[str(name)] = pandas.Categorical.from_codes(
+                        npz[f'{k}.codes'], categories=npz[f'{k}.categories'])
+            else:
+                columns[str(name)] = npz[f'{k}.values']
+    return pandas.DataFrame(columns)
+
+
 def cache_to_file(target, dependencies=[]):
     """Factory for a decorator that caches the result of a no-argument function and stores it to a target file.
 
-    Handles JSON, pickle and pandas.DataFrame CSV files.
+    Handles JSON, pickle, pandas.DataFrame CSV files (`.df.csv`) and
+    pandas.DataFrame typed binary files (`.df.npz`, see `save_df_npz`).
 
     Arguments:
         target: The target cache filename.
@@ -73,9 +113,13 @@ def cache_to_file(target, dependencies=[]):
             with open(path, 'w') as f:
                 f.write(content.to_csv(index=False))
 
+    elif target_str.endswith('.df.npz'):
+        load = load_df_npz
+        save = save_df_npz
+
     else:
         raise ValueError(f"Unrecognized extension '{target.suffix}'. "
-                         f"Only .json and .pickle supported.")
+                         f"Only .json, .pickle, .df.csv and .df.npz supported.")
 
     def decorator(func):
         all_dependencies = dependencies + [Path(inspect.getfile(func))]
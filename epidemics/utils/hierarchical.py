@@ -0,0 +1,277 @@
+"""
+Likelihood of the hyperparameters of a hierarchical model (phase 2).
+
+Given posterior samples theta_rs ~ p(theta | data_r) of each region r, obtained
+with the prior p_r(theta) (phase 1), the likelihood of the hyperparameters psi is
+
+    p(data | psi) ~ prod_r 1/S_r sum_s p(theta_rs | psi) / p_r(theta_rs),
+
+the same estimator as Korali's `Hierarchical/Psi` problem. Here the samples of
+all regions are stacked into one (regions, samples, parameters) array and the
+sum over samples is evaluated with log-sum-exp for a batch of psi at once.
+
+Phase 1 posteriors are exported to compact files (`export_compact`), holding
+at most a target number of weighted samples instead of the full Korali state.
+The posterior of the parameters of one region given the data of all regions
+(phase 3) is obtained by reweighting these samples (`theta_log_weights`).
+"""
+
+import json
+
+import numpy as np
+import scipy.stats
+from scipy.special import logsumexp
+
+from epidemics.utils.warm_start import importance_resample
+
+CONDITIONAL_TYPES = ('Normal', 'LogNormal', 'Uniform')
+COMPACT_FILE = 'posterior_compact.npz'
+
+
+def load_korali_samples(path):
+    """Load the posterior samples of a Korali state file.
+
+    Arguments:
+        path: A Korali state file, e.g. `_korali_samples/latest`.
+
+    Returns:
+        (names, samples, logPrior, logLikelihood): the variable names, an array
+        of shape (num samples, num variables), and the log-prior and the
+        log-likelihood (NaN if not stored) of each sample.
+    """
+    with open(path) as f:
+        js = json.load(f)
+
+    names = [v['Name'] for v in js['Variables']]
+    results = js.get('Results', {})
+    if 'Sample Database' in results:
+        samples = results['Sample Database']
+    elif 'Posterior Sample Database' in results:
+        samples = results['Posterior Sample Database']
+    else:
+        raise ValueError(f"No posterior samples found in {path}.")
+    samples = np.asarray(samples, dtype=np.float64).reshape(-1, len(names))
+
+    distributions = {d['Name']: d for d in js['Distributions']}
+    logPrior = np.zeros(len(samples))
+    for j, v in enumerate(js['Variables']):
+        logPrior += korali_logpdf(distributions[v['Prior Distribution']], samples[:, j])
+
+    logLikelihood = js.get('Solver', {}).get('Sample LogLikelihood Database')
+    if logLikelihood is None or len(logLikelihood) != len(samples):
+        logLikelihood = np.full(len(samples), np.nan)
+    return names, samples, logPrior, np.asarray(logLikelihood, dtype=np.float64)
+
+
+def compress_samples(samples, logWeights=None, targetESS=1000, rng=None):
+    """Reduce weighted samples to at most `targetESS` distinct samples.
+
+    Duplicated samples (e.g. repeated MCMC states) are merged first, which
+    does not change the distribution. If more than `targetESS` distinct
+    samples remain, `targetESS` of them are drawn by systematic resampling and
+    duplicates are merged again, such that equally weighted samples keep an
+    effective sample size of `targetESS`.
+
+    Returns:
+        (indices, log weights): indices of the kept samples and their normalized log-weights.
+    """
+    samples = np.asarray(samples)
+    if logWeights is None:
+        logWeights = np.zeros(len(samples))
+    _, first, inverse = np.unique(samples, axis=0, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    merged = np.full(len(first), -np.inf)
+    np.logaddexp.at(merged, inverse, logWeights)
+    merged -= logsumexp(merged)
+
+    if len(first) <= targetESS:
+        return first, merged
+    idx, _, _ = importance_resample(merged, int(targetESS), rng=rng)
+    idx, counts = np.unique(idx, return_counts=True)
+    return first[idx], np.log(counts / int(targetESS))
+
+
+def effective_sample_size(logWeights):
+    logWeights = np.asarray(logWeights, dtype=np.float64)
+    return float(np.exp(2 * logsumexp(logWeights) - logsumexp(2 * logWeights)))
+
+
+def export_compact(path, names, samples, logPrior, logLikelihood, logWeights=None,
+                   targetESS=1000, rng=None):
+    """Store a compressed posterior (see `compress_samples`) and return its effective sample size.
+
+    The file can also be read by `epidemics.utils.warm_start.load_posterior_samples`,
+    which ignores the weights.
+    """
+    idx, logWeights = compress_samples(samples, logWeights, targetESS, rng=rng)
+    with open(path, 'wb') as f:
+        np.savez(f, names=np.array(names), values=np.asarray(samples, dtype=np.float64)[idx],
+                 logPrior=np.asarray(logPrior, dtype=np.float64)[idx],
+                 logLikelihood=np.asarray(logLikelihood, dtype=np.float64)[idx],
+                 logWeights=logWeights)
+    return effective_sample_size(logWeights)
+
+
+def load_compact(path, names=None):
+    """Load a file written by `export_compact`.
+
+    Arguments:
+        path: The `.npz` file.
+        names: (optional) Variable names, to reorder the columns of the samples.
+
+    Returns:
+        A dict with the keys 'names', 'values', 'logPrior', 'logLikelihood' and 'logWeights'.
+    """
+    with np.load(path) as data:
+        compact = {key: data[key] for key in data.files}
+    compact['names'] = list(compact['names'])
+    if names is not None:
+        if sorted(compact['names']) != sorted(names):
+            raise ValueError(f"Variables {compact['names']} in {path} do not match {names}.")
+        compact['values'] = compact['values'][:, [compact['names'].index(name) for name in names]]
+        compact['names'] = list(names)
+    return compact
+
+
+def conditional_log_density(theta, logTheta, psi, conditionals):
+    """Log-density of `theta` under the conditional priors.
+
+    Arguments:
+        theta: Array of shape (..., num variables).
+        logTheta: `log(theta)`, NaN where `theta <= 0`.
+        psi: Array of hyperparameters of shape (batch size, num hyperparameters).
+        conditionals: See `PsiLikelihood`.
+
+    Returns:
+        An array of shape (batch size, ...). NaN or -inf where the density is zero.
+    """
+    extra = (np.newaxis,) * (theta.ndim - 1)
+    logp = 0.0
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        for j, (kind, a, b) in enumerate(conditionals):
+            pa = psi[(slice(None), a) + extra]
+            pb = psi[(slice(None), b) + extra]
+            x = theta[np.newaxis, ..., j]
+            if kind == 'Uniform':
+                logp = logp + np.where((pa <= x) & (x <= pb), -np.log(pb - pa), -np.inf)
+                continue
+            if kind == 'Normal':
+                z = (x - pa) / pb
+            else:
+                z = (logTheta[np.newaxis, ..., j] - pa) / pb
+                logp = logp - logTheta[np.newaxis, ..., j]
+            logp = logp - (0.5 * z * z + np.log(pb) + 0.5 * np.log(2 * np.pi))
+    return logp
+
+
+def korali_logpdf(distribution, x):
+    """Log-density of a Korali univariate distribution with numeric parameters."""
+    kind = distribution['Type']
+    if kind == 'Univariate/Uniform':
+        lower, upper = distribution['Minimum'], distribution['Maximum']
+        return scipy.stats.uniform.logpdf(x, lower, upper - lower)
+    if kind == 'Univariate/Normal':
+        return scipy.stats.norm.logpdf(x, distribution['Mean'], distribution['Standard Deviation'])
+    if kind == 'Univariate/LogNormal':
+        return scipy.stats.lognorm.logpdf(x, distribution['Sigma'], scale=np.exp(distribution['Mu']))
+    if kind == 'Univariate/Gamma':
+        return scipy.stats.gamma.logpdf(x, distribution['Shape'], scale=distribution['Scale'])
+    raise ValueError(f"Unsupported prior distribution {kind!r}.")
+
+
+class PsiLikelihood:
+    """Vectorized log-likelihood of the hyperparameters psi.
+
+    Arguments:
+        samples: List of arrays of shape (num samples, num variables), one per
+                 region. The number of samples may differ between regions.
+        logPriors: List of arrays with the phase 1 log-prior of each sample.
+        conditionals: One tuple (type, i, j) per variable, where type is one of
+                      `CONDITIONAL_TYPES` and i, j are the indices in psi of
+                      the parameters (mean and standard deviation for Normal,
+                      mu and sigma for LogNormal, minimum and maximum for Uniform).
+        logWeights: (optional) List of arrays with the log-weights of the
+                    samples, e.g. of compressed posteriors. Equal weights by default.
+        maxElements: (optional) Maximum size of the temporary arrays, larger
+                     batches are evaluated in chunks.
+    """
+    def __init__(self, samples, logPriors, conditionals, logWeights=None, maxElements=2**24):
+        if len(samples) != len(logPriors):
+            raise ValueError("Expected one log-prior array per region.")
+        d = len(conditionals)
+        for kind, _, _ in conditionals:
+            if kind not in CONDITIONAL_TYPES:
+                raise ValueError(f"Unsupported conditional prior {kind!r}.")
+        if logWeights is None:
+            logWeights = [np.full(len(x), -np.log(len(x))) for x in samples]
+        R = len(samples)
+        S = max(len(x) for x in samples)
+
+        # Padding samples get a zero weight, they contribute exp(-inf) = 0.
+        self.theta = np.ones((R, S, d))
+        self.offset = np.full((R, S), -np.inf)
+        for r, (x, logPrior, logWeight) in enumerate(zip(samples, logPriors, logWeights)):
+            x = np.asarray(x, dtype=np.float64)
+            if x.ndim != 2 or x.shape[1] != d:
+                raise ValueError(f"Expected samples of shape (n, {d}), got {x.shape}.")
+            self.theta[r, :len(x)] = x
+            self.offset[r, :len(x)] = np.asarray(logWeight) - logsumexp(logWeight) - np.asarray(logPrior)
+
+        self.conditionals = conditionals
+        self.logTheta = _log_theta(self.theta)
+        self.maxElements = maxElements
+
+    @property
+    def nRegions(self):
+        return self.theta.shape[0]
+
+    def __call__(self, psi):
+        """Returns the log-likelihood of each row of `psi`, an array of shape (batch size, num hyperparameters)."""
+        psi = np.atleast_2d(np.asarray(psi, dtype=np.float64))
+        chunk = max(1, self.maxElements // self.offset.size)
+        return np.concatenate([self._evaluate(psi[k:k + chunk])
+                               for k in range(0, len(psi), chunk)])
+
+    def _evaluate(self, psi):
+        logp = self.offset + conditional_log_density(self.theta, self.logTheta, psi, self.conditionals)
+        # Samples outside of the support and invalid hyperparameters get a zero weight.
+        logp[np.isnan(logp)] = -np.inf
+        return logsumexp(logp, axis=2).sum(axis=1)
+
+
+def theta_log_weights(samples, logPrior, psiSamples, conditionals, logWeights=None, maxElements=2**24):
+    """Importance weights of phase 1 samples of one region for the phase 3 posterior.
+
+    The phase 3 posterior of the parameters of a region is p(theta | data_r)
+    p(theta | all data) / p_r(theta), where the conditional prior is averaged
+    over the phase 2 posterior samples of psi.
+
+    Arguments:
+        samples: Phase 1 samples of the region, shape (num samples, num variables).
+        logPrior: Phase 1 log-prior of the samples.
+        psiSamples: Phase 2 posterior samples, shape (num psi samples, num hyperparameters).
+        conditionals: See `PsiLikelihood`.
+        logWeights: (optional) Log-weights of the phase 1 samples.
+
+    Returns:
+        The normalized log-weights of the samples.
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    psiSamples = np.atleast_2d(np.asarray(psiSamples, dtype=np.float64))
+    logTheta = _log_theta(samples)
+    chunk = max(1, maxElements // len(samples))
+    logMean = np.full(len(samples), -np.inf)
+    for k in range(0, len(psiSamples), chunk):
+        logp = conditional_log_density(samples, logTheta, psiSamples[k:k + chunk], conditionals)
+        logp[np.isnan(logp)] = -np.inf
+        logMean = np.logaddexp(logMean, logsumexp(logp, axis=0))
+
+    if logWeights is None:
+        logWeights = np.zeros(len(samples))
+    logw = np.asarray(logWeights) - np.asarray(logPrior) + logMean
+    return logw - logsumexp(logw)
+
+
+def _log_theta(theta):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(theta > 0, np.log(theta), np.nan)
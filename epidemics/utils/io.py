@@ -1,8 +1,18 @@
+import json
 import os
 import pathlib
+import shutil
 import time
 import urllib.request
 
+# Name of the index file stored in the root of a data mirror.
+MIRROR_MANIFEST = 'manifest.json'
+
+# Environment variable pointing to a local data mirror (see `set_data_mirror`).
+MIRROR_ENV_VAR = 'EPIDEMICS_DATA_MIRROR'
+
+_mirror = None
+
 def download(url):
     """Download and return the content of a URL."""
     print(f"[Epidemics] Downloading {url}... ", end="", flush=True)
@@ -12,9 +22,88 @@ def download(url):
     return data
 
 
+class DataMirror:
+    """A local directory with pre-downloaded files, indexed by their URL.
+
+    The directory contains the files and a `manifest.json` of the form
+        {"version": ..., "files": {url: {"filename": ..., "sha256": ..., "size": ...}, ...}}
+
+    Mirrors are created by `epidemics.data.bundle.prefetch`.
+    """
+    def __init__(self, root):
+        self.root = pathlib.Path(root)
+        with open(self.root / MIRROR_MANIFEST) as f:
+            manifest = json.load(f)
+        self.version = manifest.get('version')
+        self.files = manifest['files']
+
+    def resolve(self, url):
+        """Return the path of the mirrored copy of `url`, or `None`."""
+        entry = self.files.get(url)
+        if entry is None:
+            return None
+        return self.root / entry['filename']
+
+
+def set_data_mirror(root):
+    """Make `download_and_save` read from the given mirror instead of the network.
+
+    Arguments:
+        root: Mirror directory, a `.tar.gz` bundle (see
+              `epidemics.data.bundle.load_bundle`) or `None` to disable the
+              mirror and the `EPIDEMICS_DATA_MIRROR` environment variable.
+    """
+    global _mirror
+    if root is None:
+        _mirror = False
+        return None
+    root = pathlib.Path(root)
+    if root.is_file():
+        from epidemics.data.bundle import load_bundle
+        root = load_bundle(root)
+    _mirror = DataMirror(root)
+    return _mirror
+
+
+def get_data_mirror():
+    """Return the active `DataMirror` or `None`.
+
+    If `set_data_mirror` was not called, the `EPIDEMICS_DATA_MIRROR`
+    environment variable is used, if set.
+    """
+    if _mirror is None:
+        root = os.environ.get(MIRROR_ENV_VAR)
+        if not root:
+            return None
+        set_data_mirror(root)
+    return _mirror or None
+
+
+def _copy_from_mirror(mirror, url, path):
+    """Copy the mirrored file of `url` to `path`, if not already up to date."""
+    source = mirror.resolve(url)
+    if source is None:
+        raise FileNotFoundError(
+                f"URL {url} not found in the data mirror {mirror.root} "
+                f"(version {mirror.version}). Rebuild the mirror with "
+                f"`python3 -m epidemics.data.bundle prefetch`.")
+    src = source.stat()
+    try:
+        dst = path.stat()
+        if dst.st_size == src.st_size and dst.st_mtime == src.st_mtime:
+            return
+    except FileNotFoundError:
+        pass
+    path.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copy2(source, path)
+
+
 def download_and_save(url, path, cache_duration=1000000000, load=True):
     """Download the URL, store to a file, and return its content.
 
+    If a data mirror is active (see `set_data_mirror`), the file is taken from
+    the mirror instead and `cache_duration` is ignored.
+
     Arguments:
         url: URL to download.
         path: Target file path.
@@ -22,6 +111,14 @@ def download_and_save(url, path, cache_duration=1000000000, load=True):
         load: Should the file be loaded in memory? If not, `None` is returned.
     """
     path = pathlib.Path(path)
+    mirror = get_data_mirror()
+    if mirror is not None:
+        _copy_from_mirror(mirror, url, path)
+        if load:
+            with open(path, 'rb') as f:
+                return f.read()
+        return None
+
     try:
         if time.time() - path.lstat().st_mtime <= cache_duration:
             if load:
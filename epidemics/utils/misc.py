@@ -130,6 +130,47 @@ def positive_standard_t(m, dof):
 def get_truncated_normal(mean, sd, low, upp):
     return truncnorm( (low - mean) / sd, (upp - mean) / sd, loc=mean, scale=sd)
 
+
+class TruncatedDistribution:
+    """Frozen scipy.stats distribution `dist` restricted to [low, upp].
+
+    The density is renormalized inside the interval and zero outside,
+    like a Korali distribution with the variable bounds.
+    """
+    def __init__(self, dist, low, upp):
+        self.dist = dist
+        self.low = float(low)
+        self.upp = float(upp)
+        self.cdfLow = dist.cdf(self.low)
+        self.mass = dist.cdf(self.upp) - self.cdfLow
+
+    def support(self):
+        return self.low, self.upp
+
+    def logpdf(self, x):
+        x = np.asarray(x, dtype=float)
+        inside = (x >= self.low) & (x <= self.upp)
+        with np.errstate(divide='ignore'):
+            out = np.where(inside, self.dist.logpdf(x) - np.log(self.mass), -np.inf)
+        return out[()]
+
+    def pdf(self, x):
+        return np.exp(self.logpdf(x))
+
+    def cdf(self, x):
+        return np.clip((self.dist.cdf(x) - self.cdfLow) / self.mass, 0.0, 1.0)
+
+    def ppf(self, q):
+        x = self.dist.ppf(self.cdfLow + np.asarray(q, dtype=float) * self.mass)
+        return np.clip(x, self.low, self.upp)[()]
+
+    def median(self):
+        return self.ppf(0.5)
+
+    def rvs(self, size=None, random_state=None):
+        from scipy.stats import uniform
+        return self.ppf(uniform.rvs(size=size, random_state=random_state))
+
 def put_comment(msg, directory, country, model):
     text_file = open("{}/{}/{}/comment.txt".format(directory,country,model), "w")
     text_file.write(msg)
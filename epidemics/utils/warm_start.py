@@ -0,0 +1,157 @@
+"""
+Warm start of the sampling from the posterior of a previous run.
+
+The previous posterior samples are used to build an importance sampling
+proposal: a mixture of a Gaussian kernel density estimate around the previous
+samples and the prior itself (the defensive component, which keeps the weights
+bounded where the new posterior extends beyond the old one). The new posterior
+is obtained by resampling the proposal samples according to the weights
+prior * likelihood / proposal, and the evidence is the mean weight.
+"""
+
+import os
+
+import numpy as np
+import scipy.stats
+from scipy.special import gammaln, logsumexp
+
+POSTERIOR_SAMPLES_FILE = 'posterior_samples.npz'
+
+
+def save_posterior_samples(path, names, values):
+    """Store equally weighted posterior samples.
+
+    Arguments:
+        path: Output `.npz` file.
+        names: List of parameter names.
+        values: Array of shape (num samples, num parameters).
+    """
+    with open(path, 'wb') as f:
+        np.savez(f, names=np.array(names), values=np.asarray(values, dtype=np.float64))
+
+
+def load_posterior_samples(path, names):
+    """Load posterior samples of the given parameters from a previous run.
+
+    Arguments:
+        path: A file stored with `save_posterior_samples`, or an output folder
+              of a previous run containing such a file.
+        names: Expected parameter names, in order.
+
+    Returns:
+        An array of shape (num samples, num parameters).
+    """
+    if os.path.isdir(path):
+        path = os.path.join(path, POSTERIOR_SAMPLES_FILE)
+    with np.load(path) as data:
+        stored = list(data['names'])
+        values = data['values']
+    if sorted(stored) != sorted(names):
+        raise ValueError(f"Parameters {stored} in {path} do not match the model parameters {names}.")
+    return values[:, [stored.index(name) for name in names]]
+
+
+def reference_log_likelihood(likelihoodModel, data, s):
+    """Log-likelihood of the reference data, as computed by Korali's `Bayesian/Reference` problem.
+
+    Arguments:
+        likelihoodModel: Korali likelihood model name.
+        data: Reference data.
+        s: The sample dict filled by the computational model.
+    """
+    y = np.asarray(data, dtype=np.float64)
+    m = np.asarray(s['Reference Evaluations'], dtype=np.float64)
+
+    if likelihoodModel in ('Normal', 'Positive Normal'):
+        sigma = np.asarray(s['Standard Deviation'], dtype=np.float64)
+        llk = scipy.stats.norm.logpdf(y, m, sigma)
+        if likelihoodModel == 'Positive Normal':
+            llk -= scipy.stats.norm.logcdf(m / sigma)
+    elif likelihoodModel in ('StudentT', 'Positive StudentT'):
+        dof = np.asarray(s['Degrees Of Freedom'], dtype=np.float64)
+        llk = scipy.stats.t.logpdf(y - m, dof)
+        if likelihoodModel == 'Positive StudentT':
+            llk -= scipy.stats.t.logcdf(m, dof)
+    elif likelihoodModel == 'Poisson':
+        llk = y * np.log(m) - m - gammaln(y + 1)
+    elif likelihoodModel == 'Geometric':
+        llk = y * np.log(m / (1 + m)) - np.log(1 + m)
+    elif likelihoodModel == 'Negative Binomial':
+        r = np.asarray(s['Dispersion'], dtype=np.float64)
+        llk = gammaln(y + r) - gammaln(r) - gammaln(y + 1) \
+            + r * np.log(r / (m + r)) + y * np.log(m / (m + r))
+    else:
+        raise ValueError(f"Unknown likelihood model {likelihoodModel!r}.")
+
+    llk = float(np.sum(llk))
+    return llk if np.isfinite(llk) else -np.inf
+
+
+class WarmStartProposal:
+    """Mixture of a Gaussian kernel density estimate and the prior.
+
+    Arguments:
+        samples: Previous posterior samples, shape (num samples, num parameters).
+        priors: List of frozen scipy.stats distributions, one per parameter.
+        defensive: Weight of the prior component.
+        bandwidth: Kernel width relative to Scott's rule. Wider kernels make the
+                   proposal robust to posteriors shifted by the new data.
+        maxKernels: Maximum number of previous samples used as kernel centers.
+    """
+    def __init__(self, samples, priors, defensive=0.1, bandwidth=2.0, maxKernels=2000, rng=None):
+        self.rng = rng or np.random.RandomState()
+        samples = np.asarray(samples, dtype=np.float64)
+        if len(samples) > maxKernels:
+            samples = samples[self.rng.choice(len(samples), maxKernels, replace=False)]
+        n, d = samples.shape
+        self.centers = samples
+        self.priors = priors
+        self.defensive = defensive
+
+        # Scott's rule, with a small diagonal regularization for degenerate samples.
+        cov = np.atleast_2d(np.cov(samples, rowvar=False)) * (bandwidth**2 * n ** (-2.0 / (d + 4)))
+        cov += 1e-12 * np.diag(np.maximum(np.diag(cov), 1.0))
+        self.chol = np.linalg.cholesky(cov)
+        self.logdet = 2 * np.sum(np.log(np.diag(self.chol)))
+
+    def sample(self, n):
+        d = self.centers.shape[1]
+        x = self.centers[self.rng.randint(len(self.centers), size=n)]
+        x = x + self.rng.standard_normal((n, d)) @ self.chol.T
+        fromPrior = self.rng.rand(n) < self.defensive
+        for j, prior in enumerate(self.priors):
+            x[fromPrior, j] = prior.rvs(size=fromPrior.sum(), random_state=self.rng)
+        return x
+
+    def logpdf(self, x):
+        n, d = self.centers.shape
+        logpdf = np.empty(len(x))
+        for i, xi in enumerate(x):
+            z = np.linalg.solve(self.chol, (xi - self.centers).T)
+            logpdf[i] = logsumexp(-0.5 * np.sum(z * z, axis=0)) - np.log(n)
+        logpdf -= 0.5 * (d * np.log(2 * np.pi) + self.logdet)
+        logprior = log_prior(self.priors, x)
+        return np.logaddexp(np.log1p(-self.defensive) + logpdf,
+                            np.log(self.defensive) + logprior)
+
+
+def log_prior(priors, x):
+    """Log-density of independent priors at the points `x` of shape (n, num parameters)."""
+    return sum(prior.logpdf(x[:, j]) for j, prior in enumerate(priors))
+
+
+def importance_resample(logWeights, n, rng=None):
+    """Resample indices proportionally to the weights (systematic resampling).
+
+    Returns:
+        (indices, log mean weight, effective sample size)
+    """
+    rng = rng or np.random.RandomState()
+    logWeights = np.asarray(logWeights, dtype=np.float64)
+    logSum = logsumexp(logWeights)
+    ess = float(np.exp(2 * logSum - logsumexp(2 * logWeights)))
+    weights = np.exp(logWeights - logSum)
+    positions = (rng.rand() + np.arange(n)) / n
+    idx = np.searchsorted(np.cumsum(weights), positions)
+    idx = np.minimum(idx, len(weights) - 1)
+    return idx, float(logSum - np.log(len(logWeights))), ess
@@ -27,13 +27,35 @@ py::class_<AD> exportAutoDiffBase(py::module &m, std::string name) {
              "Get the derivative with respect to the ith variable.")
         .def("d", [](const AD &ad) {
             return std::vector<T>(ad.dBegin(), ad.dEnd());
-        }, "Return a list of all derivatives.");
+        }, "Return a list of all derivatives.")
+        .def(-py::self)
+        .def(py::self + py::self)
+        .def(py::self - py::self)
+        .def(py::self * py::self)
+        .def(py::self / py::self)
+        .def(py::self + T())
+        .def(py::self - T())
+        .def(py::self * T())
+        .def(py::self / T())
+        .def(T() + py::self)
+        .def(T() - py::self)
+        .def(T() * py::self)
+        .def(T() / py::self);
 
     py::implicitly_convertible<long long, AD>();
     py::implicitly_convertible<T, AD>();
     return cls;
 }
 
+/// Create a DynamicAutoDiff from a value and an array of `N` derivatives.
+template <typename AD>
+AD makeDynamicAD(typename AD::ValueType value, const typename AD::ValueType *der, size_t N) {
+    std::vector<typename AD::ValueType> v(1 + N);
+    v[0] = value;
+    std::copy(der, der + N, v.begin() + 1);
+    return AD(std::move(v));
+}
+
 template <typename AD>
 py::handle exportStaticAutoDiff(py::module &m, std::string prefix) {
     static py::handle cls;
@@ -63,4 +85,32 @@ py::handle exportDynamicAutoDiff(py::module &m, std::string prefix) {
     return cls;
 }
 
+/// Scope of `ADPoolScope<double>` usable as a Python context manager.
+struct PyADPoolScope {
+    size_t N;
+    std::unique_ptr<ADPoolScope<double>> scope;
+};
+
+/// Export the hooks into the DynamicAD block pools, for testing only.
+/// The pools are per thread, values must be freed by the creating thread.
+inline void exportADPool(py::module &m) {
+    using namespace py::literals;
+    py::class_<PyADPoolScope>(m, "_ADPoolScope")
+        .def(py::init([](size_t N) { return PyADPoolScope{N, nullptr}; }), "N"_a,
+             "Context manager which allocates DynamicAD values with N "
+             "derivatives from the pool of the thread.")
+        .def("__enter__", [](PyADPoolScope &s) {
+            s.scope = std::make_unique<ADPoolScope<double>>(s.N);
+        })
+        .def("__exit__", [](PyADPoolScope &s, py::args) { s.scope.reset(); });
+    m.def("_ad_pool_num_live", [](size_t N) {
+        return ADBlockPool<double>::forThread(1 + N).numLive();
+    }, "N"_a, "Return the number of live blocks of the pool for N derivatives.");
+    m.def("_set_ad_pool_enabled", [](bool enabled) {
+        bool previous = ADBlockPool<double>::enabled();
+        ADBlockPool<double>::enabled() = enabled;
+        return previous;
+    }, "enabled"_a, "Enable or disable the pools of the thread, return the previous state.");
+}
+
 }  // namespace epidemics
@@ -1,3 +1,4 @@
+#include "autodiff.h"
 #include "bindings.h"
 
 #include <epidemics/models/country/base.h>
@@ -13,6 +14,9 @@ IntegratorSettings integratorSettingsFromKwargs(py::kwargs kwargs) {
     auto pop = kwargs.attr("pop");
     IntegratorSettings out;
     out.dt = pop("dt", out.dt).cast<double>();
+    out.denseOutput = pop("dense_output", out.denseOutput).cast<bool>();
+    out.checkpointSteps = pop("checkpoint_steps", out.checkpointSteps).cast<size_t>();
+    out.startTime = pop("start_time", out.startTime).cast<double>();
     if (!kwargs.empty())
         throw py::key_error(kwargs.begin()->first.cast<std::string>());
     return out;
@@ -36,15 +40,101 @@ namespace cantons {
 
 void exportCantonsModels(py::module &top, py::module &m);
 
+/// Return a read-only numpy view of a vector owned by the Python object `owner`.
+template <typename T>
+static py::array readonlyView(const std::vector<T> &v, py::handle owner) {
+    py::array_t<T> out({v.size()}, {sizeof(T)}, v.data(), owner);
+    py::detail::array_proxy(out.ptr())->flags &= ~py::detail::npy_api::NPY_ARRAY_WRITEABLE_;
+    return std::move(out);
+}
+
 static void exportDesignParameters(py::module &m) {
     py::class_<DesignParameters>(m, "DesignParameters")
+        // The NumPy overload must come first, such that float64 arrays are
+        // not converted element by element to std::vector<double>.
+        .def(py::init([](std::vector<std::string> regionKeys,
+                         const ArrayD &Ni, const ArrayD &Mij, const ArrayD &Cij,
+                         const ArrayD &extComIu, const ArrayD &Ui) {
+                size_t K = regionKeys.size();
+                if (extComIu.size() % (K ? K : 1) != 0)
+                    throw std::invalid_argument("ext_com_iu: size not divisible by the number of regions.");
+                return DesignParameters{
+                        std::move(regionKeys),
+                        arrayToVector(Ni, K, "Ni"),
+                        arrayToVector(Mij, K * K, "Mij"),
+                        arrayToVector(Cij, K * K, "Cij"),
+                        arrayToVector(extComIu, (size_t)-1, "ext_com_iu"),
+                        arrayToVector(Ui, K, "Ui")};
+             }),
+             "region_keys"_a, "Ni"_a, "Mij"_a, "Cij"_a,
+             "ext_com_iu"_a, "Ui"_a,
+             "Create design parameters from float64 arrays. Mij and Cij may "
+             "be 2D (K, K) and ext_com_iu 2D (days, K) arrays.")
         .def(py::init<std::vector<std::string>, std::vector<double>,
                       std::vector<double>, std::vector<double>,
                       std::vector<double>, std::vector<double>>(),
              "region_keys"_a, "Ni"_a, "Mij"_a, "Cij"_a,
              "ext_com_iu"_a, "Ui"_a)
-        .def_readonly("Mij", &DesignParameters::Mij)
+        .def_property_readonly("Mij", [](py::object self) {
+            return readonlyView(self.cast<const DesignParameters &>().Mij, self);
+        }, "Read-only view of the row-major Mij matrix.")
+        .def_property_readonly("Cij", [](py::object self) {
+            return readonlyView(self.cast<const DesignParameters &>().Cij, self);
+        }, "Read-only view of the row-major Cij matrix.")
+        .def_property_readonly("Ni", [](py::object self) {
+            return readonlyView(self.cast<const DesignParameters &>().Ni, self);
+        }, "Read-only view of the region population.")
+        .def_property_readonly("Ui", [](py::object self) {
+            return readonlyView(self.cast<const DesignParameters &>().Ui, self);
+        }, "Read-only view of the user-defined Ui.")
+        .def_property_readonly("ext_com_iu", [](py::object self) {
+            return readonlyView(self.cast<const DesignParameters &>().extComIu, self);
+        }, "Read-only view of the row-major external cases [day][region].")
+        .def_readonly("region_keys", &DesignParameters::regionKeys)
         .def_readonly("num_regions", &DesignParameters::numRegions);
+    m.def("read_design_parameters", [](const std::string &filename) {
+        return readDesignParameters(filename.c_str());
+    }, "filename"_a, "Read design parameters stored with PyDesignParameters.save_cpp_dat.");
+}
+
+static void exportReferenceData(py::module &m) {
+    PYBIND11_NUMPY_DTYPE(DataPoint, day, region, value);
+    using DataPointArray = py::array_t<DataPoint, py::array::c_style>;
+
+    py::class_<ReferenceData>(m, "ReferenceData")
+        .def(py::init([](const DataPointArray &cases) {
+                ReferenceData out;
+                out.cases.assign(cases.data(), cases.data() + cases.size());
+                return out;
+             }), "cases"_a,
+             "Create reference data from a structured array with fields "
+             "(day: int32, region: int32, value: float64).")
+        .def_property_readonly("cases", [](py::object self) {
+            return readonlyView(self.cast<const ReferenceData &>().cases, self);
+        }, "Read-only structured array view of the data points.")
+        .def("get_reference_data", [](const ReferenceData &rd) {
+            std::vector<double> out = rd.getReferenceData();
+            return ArrayD(out.size(), out.data());
+        }, "Return the values of all data points as a float64 array.");
+    m.attr("DATA_POINT_DTYPE") = py::dtype::of<DataPoint>();
+    m.def("read_reference_data", [](const std::string &filename) {
+        return readReferenceData(filename.c_str());
+    }, "filename"_a, "Read reference data stored with ReferenceData.save_cpp_dat.");
+}
+
+static void exportAggregation(py::module &m) {
+    py::class_<Aggregation>(m, "Aggregation")
+        .def(py::init<size_t, std::vector<int>, std::vector<int>, std::vector<double>>(),
+             "num_regions"_a, "indptr"_a, "indices"_a, "weights"_a,
+             "Create a (groups x regions) aggregation matrix from CSR arrays.")
+        .def_readonly("num_groups", &Aggregation::numGroups)
+        .def_readonly("num_regions", &Aggregation::numRegions)
+        .def("__call__", [](const Aggregation &agg, const ArrayD &x) {
+            std::vector<double> xx = arrayToVector(x, agg.numRegions, "x");
+            ArrayD out(agg.numGroups);
+            agg.apply(xx.data(), out.mutable_data());
+            return out;
+        }, "x"_a, "Aggregate a vector of region values.");
 }
 
 }  // namespace cantons
@@ -55,7 +145,10 @@ PYBIND11_MODULE(libepidemics, m)
     using namespace epidemics;
     py::class_<IntegratorSettings>(m, "IntegratorSettings")
         .def(py::init<double>(), "dt"_a)
-        .def_readwrite("dt", &IntegratorSettings::dt);
+        .def_readwrite("dt", &IntegratorSettings::dt)
+        .def_readwrite("dense_output", &IntegratorSettings::denseOutput)
+        .def_readwrite("start_time", &IntegratorSettings::startTime);
+    epidemics::exportADPool(m);
 
     auto country = m.def_submodule("country");
     epidemics::country::exportCountryModels(m, country);
@@ -64,4 +157,6 @@ PYBIND11_MODULE(libepidemics, m)
     auto cantons = m.def_submodule("cantons");
     epidemics::cantons::exportCantonsModels(m, cantons);
     epidemics::cantons::exportDesignParameters(cantons);
+    epidemics::cantons::exportReferenceData(cantons);
+    epidemics::cantons::exportAggregation(cantons);
 }
@@ -4,6 +4,8 @@
 // otherwise you get a One-definition rule violation.
 // https://github.com/pybind/pybind11/issues/1055
 #include <pybind11/pybind11.h>
+#include <pybind11/numpy.h>
+#include <pybind11/operators.h>
 #include <pybind11/stl.h>
 
 #include <epidemics/utils/signal.h>
@@ -47,6 +49,20 @@ struct type_caster<boost::array<Type, Size>>
 
 namespace epidemics {
 
+/// A C-contiguous float64 array. Without `forcecast`, matching arrays are
+/// accepted as they are, other inputs are converted only as a fallback.
+using ArrayD = py::array_t<double, py::array::c_style>;
+
+/// Copy the array buffer to a vector, checking the total number of elements.
+inline std::vector<double> arrayToVector(const ArrayD &a, size_t expected, const char *name) {
+    if (expected != (size_t)-1 && (size_t)a.size() != expected) {
+        throw std::invalid_argument(
+                std::string(name) + ": expected " + std::to_string(expected) +
+                " elements, got " + std::to_string(a.size()) + ".");
+    }
+    return std::vector<double>(a.data(), a.data() + a.size());
+}
+
 class SignalRAII {
 public:
     SignalRAII() {
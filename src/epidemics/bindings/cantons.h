@@ -18,6 +18,23 @@ static auto makeValuesGetter(size_t valueIndex) {
     };
 }
 
+/// Convert a list of states to an array of shape (vars, regions, times).
+template <typename State>
+py::array_t<double> statesToArray(const std::vector<State> &states) {
+    const size_t V = State::kVarsPerRegion;
+    const size_t K = states.empty() ? 0 : states[0].numRegions();
+    const size_t T = states.size();
+    py::array_t<double> out({V, K, T});
+    auto o = out.mutable_unchecked<3>();
+    for (size_t t = 0; t < T; ++t) {
+        const double *p = states[t].raw().data();
+        for (size_t v = 0; v < V; ++v)
+            for (size_t i = 0; i < K; ++i)
+                o(v, i, t) = p[v * K + i];
+    }
+    return out;
+}
+
 /// Convert a State<double> to State<AD>.
 template <template <typename> class State, typename AD>
 State<AD> convertScalarStateToAD(const State<double> &state) {
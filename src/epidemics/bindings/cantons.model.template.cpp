@@ -59,7 +59,125 @@ void exportAll(py::module &top, py::module &m) {
     m.attr("StaticAD") = exportStaticAutoDiff<StaticAD>(top, "StaticAD_double_");
     m.attr("DynamicAD") = exportDynamicAutoDiff<DynamicAD>(top, "DynamicAD_double_");
     exportSolver<Solver, DesignParameters, State, Parameters>(m)
-        .def("state_size", &Solver::stateSize, "Return the number of state variables.");
+        .def("state_size", &Solver::stateSize, "Return the number of state variables.")
+        .def("_solve_custom_derivatives", [](const Solver &solver,
+                                             const Parameters<double> &params,
+                                             const State<double> &y0,
+                                             const ArrayD &paramsDer,
+                                             const ArrayD &y0Der,
+                                             const std::vector<double> &tEval,
+                                             py::kwargs kwargs) {
+            return solveCustomDerivatives(
+                    solver, Parameters<double>::numParameters, y0, paramsDer, y0Der,
+                    tEval, std::move(kwargs), [&params](const double *der, size_t K) {
+                return Parameters<DynamicAD>{
+                    {%- for field in PARAMS %}
+                    makeDynamicAD<DynamicAD>(params.{{field}}, der + {{loop.index0}} * K, K),
+                    {%- endfor %}
+                };
+            });
+        }, "params"_a, "y0"_a, "params_der"_a, "y0_der"_a, "t_eval"_a,
+           "Solve with the derivatives of the parameters and the initial state "
+           "set to the rows of `params_der` and `y0_der`. Returns the arrays "
+           "(values, derivatives). Use cantons_custom_derivatives instead.")
+        .def("solve_array", [](const Solver &solver,
+                               const Parameters<double> &params,
+                               State<double> state,
+                               const std::vector<double> &tEval,
+                               py::kwargs kwargs) {
+            std::vector<State<double>> result;
+            {
+                SignalRAII breakRAII;
+                result = solver.solve(params, std::move(state), tEval,
+                                      integratorSettingsFromKwargs(kwargs));
+            }
+            return statesToArray(result);
+        }, "params"_a, "y0"_a, "t_eval"_a,
+           "Solve and return the solution as an array of shape (vars, regions, len(t_eval)). "
+           "Pass dense_output=True to evaluate t_eval by interpolation instead of "
+           "adapting the time step to it, and start_time=t0 to resume from the "
+           "state y0 at the time t0 < t_eval[0].")
+        .def("solve_aggregated", [](const Solver &solver,
+                                    const Parameters<double> &params,
+                                    State<double> state,
+                                    const std::vector<double> &tEval,
+                                    const Aggregation &agg,
+                                    const std::vector<size_t> &vars,
+                                    py::kwargs kwargs) {
+            std::vector<double> result;
+            {
+                SignalRAII breakRAII;
+                result = solver.solveAggregated(params, std::move(state), tEval, agg, vars,
+                                                integratorSettingsFromKwargs(kwargs));
+            }
+            // [time][var][group] -> (vars, groups, times).
+            const size_t T = tEval.size(), V = vars.size(), G = agg.numGroups;
+            py::array_t<double> out({V, G, T});
+            auto o = out.mutable_unchecked<3>();
+            for (size_t t = 0; t < T; ++t)
+                for (size_t v = 0; v < V; ++v)
+                    for (size_t g = 0; g < G; ++g)
+                        o(v, g, t) = result[(t * V + v) * G + g];
+            return out;
+        }, "params"_a, "y0"_a, "t_eval"_a, "aggregation"_a, "vars"_a,
+           "Solve and return the variables `vars` (indices within a region) "
+           "aggregated with `aggregation`, as an array of shape "
+           "(len(vars), groups, len(t_eval)).")
+        .def("solve_adjoint", [](const Solver &solver,
+                                 const Parameters<double> &params,
+                                 const State<double> &state,
+                                 const std::vector<double> &tEval,
+                                 const ArrayD &dLossdY,
+                                 py::kwargs kwargs) {
+            const size_t V = State<double>::kVarsPerRegion;
+            const size_t K = solver.designParameters().numRegions;
+            const size_t T = tEval.size();
+            if (dLossdY.ndim() != 3 || (size_t)dLossdY.shape(0) != V
+                    || (size_t)dLossdY.shape(1) != K || (size_t)dLossdY.shape(2) != T)
+                throw std::invalid_argument("dloss_dy: expected shape (vars, regions, len(t_eval)).");
+            // (vars, regions, times) -> [time][var][region].
+            std::vector<double> dLossdY_(T * V * K);
+            auto d = dLossdY.unchecked<3>();
+            for (size_t t = 0; t < T; ++t)
+                for (size_t v = 0; v < V; ++v)
+                    for (size_t i = 0; i < K; ++i)
+                        dLossdY_[(t * V + v) * K + i] = d(v, i, t);
+
+            AdjointResult result;
+            {
+                SignalRAII breakRAII;
+                result = solver.solveAdjoint(params, state, tEval, dLossdY_,
+                                             integratorSettingsFromKwargs(kwargs));
+            }
+            py::array_t<double> dY0({V, K});
+            std::copy(result.dY0.begin(), result.dY0.end(), dY0.mutable_data());
+            py::array_t<double> dParams(result.dParams.size(), result.dParams.data());
+            return py::make_tuple(dParams, dY0);
+        }, "params"_a, "y0"_a, "t_eval"_a, "dloss_dy"_a,
+           "Compute the gradient of a scalar loss with the adjoint method, given "
+           "the derivatives `dloss_dy` of the loss with respect to the solution "
+           "at `t_eval`, an array of shape (vars, regions, len(t_eval)) as "
+           "returned by `solve_array`. Returns a tuple of the derivatives with "
+           "respect to the parameters and to the initial state (vars, regions). "
+           "The cost does not depend on the number of parameters. Pass "
+           "checkpoint_steps=n to store the forward state every n steps.")
+        .def("set_ext_com_iu", [](Solver &solver, const ArrayD &extComIu) {
+            solver.setExternalCommutersIu(arrayToVector(extComIu, (size_t)-1, "ext_com_iu"));
+        }, "ext_com_iu"_a, "Replace the external infected commuters [day][region].")
+        .def("set_Ui", [](Solver &solver, const ArrayD &Ui) {
+            solver.setUi(arrayToVector(Ui, (size_t)-1, "Ui"));
+        }, "Ui"_a, "Replace the user-defined per-region values Ui.")
+        .def("set_design_derivatives", [](Solver &solver, const ArrayD &UiDer,
+                                          const ArrayD &extComIuDer) {
+            if (UiDer.ndim() != 2)
+                throw std::invalid_argument("Ui_der: expected a 2D array.");
+            solver.setDesignDerivatives((size_t)UiDer.shape(1),
+                                        arrayToVector(UiDer, (size_t)-1, "Ui_der"),
+                                        arrayToVector(extComIuDer, (size_t)-1, "ext_com_iu_der"));
+        }, "Ui_der"_a, "ext_com_iu_der"_a,
+           "Set the derivatives of Ui (regions, derivatives) and of the external "
+           "infected commuters (days, regions, derivatives) with respect to the "
+           "variables of `_solve_custom_ad`. Used by models that support it (sei_c).");
 }
 
 }  // namespace {{NAME}}
@@ -3,8 +3,11 @@
 #pragma once
 
 #include "bindings.h"
+#include "autodiff.h"
 #include <epidemics/integrator.hh>
 
+#include <boost/array.hpp>
+
 namespace epidemics {
 
 /// Shorthand for the autodiff type used for the given model.
@@ -60,6 +63,76 @@ auto exportSolver(py::module &m) {
     return solver;
 }
 
+namespace detail {
+
+template <typename T>
+void resizeRawState(std::vector<T> &raw, size_t size) {
+    raw.resize(size);
+}
+
+template <typename T, size_t N>
+void resizeRawState(boost::array<T, N> &, size_t) { }
+
+}  // namespace detail
+
+/// Solve with DynamicAD, seeding the derivatives of the parameters and of the
+/// initial state with the rows of `paramsDer` and `y0Der`, which must have
+/// the same number of columns K. `makeParams(der, K)` creates the AD
+/// parameters given the row-major derivatives matrix.
+///
+/// Returns a tuple of arrays (values (T, S), derivatives (T, S, K)), where
+/// T = len(tEval) and S is the number of state variables.
+template <typename Solver, template <typename> class State, typename MakeParams>
+py::tuple solveCustomDerivatives(
+        const Solver &solver,
+        size_t numParameters,
+        const State<double> &y0,
+        const ArrayD &paramsDer,
+        const ArrayD &y0Der,
+        const std::vector<double> &tEval,
+        py::kwargs kwargs,
+        MakeParams makeParams)
+{
+    using DynamicAD = DynamicAutoDiff<double>;
+    const size_t S = y0.raw().size();
+    if (paramsDer.ndim() != 2 || (size_t)paramsDer.shape(0) != numParameters) {
+        throw py::type_error("Expected `params_der` of shape (" + std::to_string(numParameters)
+                             + ", K), got " + std::to_string(paramsDer.ndim()) + "D array.");
+    }
+    const size_t K = paramsDer.shape(1);  // Number of derivatives to compute.
+    if (y0Der.ndim() != 2 || (size_t)y0Der.shape(0) != S || (size_t)y0Der.shape(1) != K) {
+        throw py::type_error("Expected `y0_der` of shape (" + std::to_string(S)
+                             + ", " + std::to_string(K) + ").");
+    }
+
+    typename State<DynamicAD>::RawState raw;
+    detail::resizeRawState(raw, S);
+    const double *d = y0Der.data();
+    for (size_t i = 0; i < S; ++i)
+        raw[i] = makeDynamicAD<DynamicAD>(y0.raw()[i], d + i * K, K);
+
+    std::vector<State<DynamicAD>> result;
+    {
+        SignalRAII breakRAII;
+        result = solver.solve(makeParams(paramsDer.data(), K), State<DynamicAD>{std::move(raw)},
+                              tEval, integratorSettingsFromKwargs(kwargs));
+    }
+
+    const size_t T = result.size();
+    py::array_t<double> values({T, S});
+    py::array_t<double> derivatives({T, S, K});
+    double *v = values.mutable_data();
+    double *dv = derivatives.mutable_data();
+    for (size_t t = 0; t < T; ++t) {
+        for (size_t i = 0; i < S; ++i) {
+            const DynamicAD &ad = result[t].raw()[i];
+            *v++ = ad.val();
+            dv = std::copy(ad.dBegin(), ad.dEnd(), dv);
+        }
+    }
+    return py::make_tuple(values, derivatives);
+}
+
 /// Export a model State. Returns the State class handler.
 template <typename State>
 static auto exportGenericState(py::module &m, const char *name) {
@@ -58,7 +58,27 @@ void exportAll(py::module &top, py::module &m) {
     exportSolver<Solver, DesignParameters, State, Parameters>(m)
         .def("state_size", [](const Solver &) noexcept {
             return State<double>::size();
-        }, "Return the number of state variables.");
+        }, "Return the number of state variables.")
+        .def("_solve_custom_derivatives", [](const Solver &solver,
+                                             const Parameters<double> &params,
+                                             const State<double> &y0,
+                                             const ArrayD &paramsDer,
+                                             const ArrayD &y0Der,
+                                             const std::vector<double> &tEval,
+                                             py::kwargs kwargs) {
+            return solveCustomDerivatives(
+                    solver, Parameters<double>::numParameters, y0, paramsDer, y0Der,
+                    tEval, std::move(kwargs), [&params](const double *der, size_t K) {
+                return Parameters<DynamicAD>{
+                    {%- for field in PARAMS %}
+                    makeDynamicAD<DynamicAD>(params.{{field}}, der + {{loop.index0}} * K, K),
+                    {%- endfor %}
+                };
+            });
+        }, "params"_a, "y0"_a, "params_der"_a, "y0_der"_a, "t_eval"_a,
+           "Solve with the derivatives of the parameters and the initial state "
+           "set to the rows of `params_der` and `y0_der`. Returns the arrays "
+           "(values, derivatives). Use country_custom_derivatives instead.");
 }
 
 }  // namespace {{NAME}}
@@ -1,23 +1,121 @@
 #pragma once
 
 #include <epidemics/utils/autodiff.h>
+#include <epidemics/utils/reverse_autodiff.h>
 #include <epidemics/utils/signal.h>
+#include <boost/array.hpp>
 #include <boost/numeric/odeint.hpp>
 
+#include <limits>
 #include <vector>
 
 namespace epidemics {
 
 struct IntegratorSettings {
     double dt{0.1};
+
+    /// If set, integrate on a fixed grid of step `dt` independent of `tEval`
+    /// and evaluate the solution at `tEval` using the continuous extension
+    /// (dense output) of the dopri5 method. Otherwise, the step is shortened
+    /// to hit every point of `tEval` exactly.
+    bool denseOutput{false};
+
+    /// Number of steps between the forward states stored by
+    /// `integrateAdjoint`, 0 for about sqrt(total number of steps).
+    size_t checkpointSteps{0};
+
+    /// Time of the initial state, NaN for `tEval[0]`. Allows resuming the
+    /// integration from a state stored at an earlier time, the solution is
+    /// reported only at `tEval`, which must not precede `startTime`.
+    double startTime{std::numeric_limits<double>::quiet_NaN()};
+};
+
+/// Gradient of a scalar loss computed by `integrateAdjoint`.
+struct AdjointResult {
+    std::vector<double> dParams;  /// Derivatives with respect to the parameters.
+    std::vector<double> dY0;      /// Derivatives with respect to the initial state.
+};
+
+namespace detail {
+
+struct NoADPool {
+    template <typename ...Args>
+    explicit NoADPool(Args && ...) { }
+};
+
+/// Selects the ADBlockPool scopes used by `integrate` for the given raw
+/// state type, a no-op unless the elements are DynamicAutoDiff.
+template <typename RawState>
+struct ADPoolFor {
+    using Scope = NoADPool;
+    using Suspend = NoADPool;
+    static size_t numDerivatives(const RawState &) noexcept { return 0; }
+};
+
+template <typename T>
+struct ADPoolFor<std::vector<DynamicAutoDiff<T>>> {
+    using Scope = ADPoolScope<T>;
+    using Suspend = ADPoolSuspend<T>;
+    static size_t numDerivatives(const std::vector<DynamicAutoDiff<T>> &x) noexcept {
+        return x.empty() ? 0 : x[0].N();
+    }
 };
 
+template <typename T, size_t N>
+struct ADPoolFor<boost::array<DynamicAutoDiff<T>, N>> {
+    using Scope = ADPoolScope<T>;
+    using Suspend = ADPoolSuspend<T>;
+    static size_t numDerivatives(const boost::array<DynamicAutoDiff<T>, N> &x) noexcept {
+        return N == 0 ? 0 : x[0].N();
+    }
+};
+
+}  // namespace detail
+
 template <typename RHS, typename State>
 std::vector<State> integrate(
         RHS rhs,
         State y0,
         const std::vector<double> &tEval,
         IntegratorSettings settings);
+
+/// Integrate and pass the raw state at each time of `tEval` to
+/// `observer(const RawState &, double t)`, without storing the trajectory.
+template <typename RHS, typename State, typename Observer>
+void integrate(
+        RHS rhs,
+        State y0,
+        const std::vector<double> &tEval,
+        IntegratorSettings settings,
+        Observer observer);
+
+/// Compute the gradient of a scalar loss L(y(tEval[0]), ..., y(tEval[T-1]))
+/// with respect to the parameters and the initial state with the discrete
+/// adjoint of the integrator, at a cost independent of the number of
+/// parameters.
+///
+/// The forward pass stores the state every `settings.checkpointSteps` steps,
+/// the backward pass recomputes the states between the checkpoints and
+/// propagates the adjoint state through each step, using reverse-mode
+/// autodiff (`ReverseAD`) for the vector-Jacobian products of `rhs`.
+///
+/// Arguments:
+///     rhs: `rhs(double t, const T *params, const std::vector<T> &x,
+///          std::vector<T> &dxdt)`, callable with T = double and ReverseAD.
+///     params: Parameter values.
+///     y0: Initial state at `tEval[0]`.
+///     tEval: Sorted times at which the loss depends on the state.
+///     dLossdY: Derivatives of the loss with respect to the states at
+///              `tEval`, in the row-major [time][state] layout.
+///     settings: Step size and checkpointing. Dense output is not supported.
+template <typename RHS>
+AdjointResult integrateAdjoint(
+        RHS rhs,
+        const std::vector<double> &params,
+        std::vector<double> y0,
+        const std::vector<double> &tEval,
+        const std::vector<double> &dLossdY,
+        IntegratorSettings settings);
 }  // namespace epidemics
 
 
@@ -27,6 +125,7 @@ namespace odeint {
 
 /// Partial template specialization of boost's internal vector resize functor
 /// for DynamicAD types, which need to know their size at construct time.
+/// The elements are constructed in place, from the active ADBlockPool if any.
 template <class T>
 #if BOOST_VERSION >= 105600
 struct resize_impl_sfinae
@@ -40,7 +139,11 @@ struct resize_impl
     using State = std::vector<AD>;
     static void resize(State &x1, const State &x2)
     {
-        x1.resize(x2.size(), AD((typename AD::size_tag){}, x2[0].N()));
+        const size_t N = x2.empty() ? 0 : x2[0].N();
+        x1.clear();
+        x1.reserve(x2.size());
+        for (size_t i = 0; i < x2.size(); ++i)
+            x1.emplace_back(typename AD::size_tag{}, N);
     }
 };
 }  // namespace odeint
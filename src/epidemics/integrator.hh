@@ -5,25 +5,98 @@
 #include <epidemics/utils/signal.h>
 #include <boost/numeric/odeint.hpp>
 
+#include <algorithm>
+#include <cmath>
+#include <limits>
+#include <stdexcept>
+
 namespace epidemics {
 
-template <typename RHS, typename State>
-std::vector<State> integrate(
+/// Integrate with the fixed step `dt` starting at `tEval[0]` and report the
+/// solution at the (sorted) times `tEval` by interpolating within the steps.
+template <typename Stepper, typename RHS, typename RawState, typename Observer>
+void integrateDenseOutput(
+        Stepper stepper,
+        RHS &rhs,
+        RawState &x,
+        const std::vector<double> &tEval,
+        double dt,
+        Observer &observer)
+{
+    if (tEval.empty())
+        return;
+
+    // Copy instead of default-constructing, such that DynamicAD elements
+    // get the correct number of derivatives.
+    RawState dxdt(x);
+    RawState xNew(x);
+    RawState dxdtNew(x);
+    RawState xOut(x);
+
+    const double t0 = tEval[0];
+    double t = t0;
+    rhs(x, dxdt, t);
+    size_t k = 0;
+    for (; k < tEval.size() && tEval[k] <= t; ++k)
+        observer(x, tEval[k]);
+
+    for (size_t step = 1; k < tEval.size(); ++step) {
+        // Compute the grid point directly, to avoid accumulating round-off.
+        double tNew = t0 + step * dt;
+        stepper.do_step(rhs, x, dxdt, t, xNew, dxdtNew, dt);
+        for (; k < tEval.size() && tEval[k] <= tNew; ++k) {
+            if (tEval[k] == tNew) {
+                observer(xNew, tEval[k]);
+            } else {
+                stepper.calc_state(tEval[k], xOut, x, dxdt, t, xNew, dxdtNew, tNew);
+                observer(xOut, tEval[k]);
+            }
+        }
+        std::swap(x, xNew);
+        std::swap(dxdt, dxdtNew);
+        t = tNew;
+    }
+}
+
+template <typename RHS, typename State, typename Observer>
+void integrate(
         RHS rhs,
         State y0,
         const std::vector<double> &tEval,
-        IntegratorSettings settings)
+        IntegratorSettings settings,
+        Observer observer)
 {
     using RawState = typename State::RawState;
     using Stepper = boost::numeric::odeint::runge_kutta_dopri5<RawState>;
 
-    std::vector<State> result;
-    result.reserve(tEval.size());
+    using ADPool = detail::ADPoolFor<RawState>;
+    // Temporaries of DynamicAD values are taken from a pool sized for the
+    // number of derivatives, except for the values created by the observer.
+    typename ADPool::Scope poolScope{ADPool::numDerivatives(y0.raw())};
 
-    auto observer = [&result](const RawState &y, double /*t*/) mutable {
+    // When resuming from `startTime`, the initial state is not reported.
+    const std::vector<double> *times = &tEval;
+    std::vector<double> resumeTimes;
+    size_t skip = 0;
+    if (!std::isnan(settings.startTime) && !tEval.empty() && settings.startTime != tEval[0]) {
+        if (settings.startTime > tEval[0])
+            throw std::invalid_argument("tEval must not precede the start time.");
+        resumeTimes.reserve(tEval.size() + 1);
+        resumeTimes.push_back(settings.startTime);
+        resumeTimes.insert(resumeTimes.end(), tEval.begin(), tEval.end());
+        times = &resumeTimes;
+        skip = 1;
+    }
+
+    auto observerWrapper = [&observer, &skip](const RawState &y, double t) {
         if (check_signals_func)
             check_signals_func();
-        result.push_back(State{y});
+        if (skip > 0) {
+            --skip;
+            return;
+        }
+        typename ADPool::Suspend poolSuspend;
+        observer(y, t);
     };
 
     auto rhsWrapper = [rhs = std::move(rhs)](
@@ -41,9 +114,247 @@ std::vector<State> integrate(
     };
 
     typename State::RawState y0_(std::move(y0).raw());
-    boost::numeric::odeint::integrate_times(
-            Stepper{}, rhsWrapper, y0_,
-            tEval.begin(), tEval.end(), settings.dt, observer);
+    if (settings.denseOutput) {
+        integrateDenseOutput(Stepper{}, rhsWrapper, y0_, *times, settings.dt, observerWrapper);
+    } else {
+        boost::numeric::odeint::integrate_times(
+                Stepper{}, rhsWrapper, y0_,
+                times->begin(), times->end(), settings.dt, observerWrapper);
+    }
+}
+
+namespace detail {
+
+/// Explicit steps of the Dormand-Prince 5(4) method (the 5th order solution,
+/// as in boost's runge_kutta_dopri5) and their discrete adjoints.
+template <typename RHS>
+class Dopri5Adjoint {
+public:
+    static constexpr int kStages = 6;
+
+    Dopri5Adjoint(RHS &rhs, const std::vector<double> &params, size_t n) :
+        rhs_(rhs), params_(params),
+        Y_(kStages, std::vector<double>(n)),
+        k_(kStages, std::vector<double>(n)),
+        YBar_(kStages, std::vector<double>(n)),
+        kBar_(n),
+        pAD_(params.size()),
+        xAD_(n),
+        dxdtAD_(n)
+    { }
+
+    /// Advance `y` from `t` to `t + h`.
+    void step(double t, double h, std::vector<double> &y) {
+        computeStages(t, h, y);
+        for (size_t j = 0; j < y.size(); ++j) {
+            double sum = 0.0;
+            for (int i = 0; i < kStages; ++i)
+                sum += b(i) * k_[i][j];
+            y[j] += h * sum;
+        }
+    }
+
+    /// Given the derivatives `lambda` of the loss with respect to the state
+    /// after the step from `y` at `t` to `t + h`, replace them with the
+    /// derivatives with respect to `y` and accumulate the derivatives with
+    /// respect to the parameters to `dParams`.
+    void backward(double t, double h, const std::vector<double> &y,
+                  std::vector<double> &lambda, std::vector<double> &dParams) {
+        const size_t n = y.size();
+        computeStages(t, h, y);
+        for (int i = kStages - 1; i >= 0; --i) {
+            for (size_t j = 0; j < n; ++j) {
+                double sum = b(i) * lambda[j];
+                for (int l = i + 1; l < kStages; ++l)
+                    sum += a(l, i) * YBar_[l][j];
+                kBar_[j] = h * sum;
+            }
+            std::fill(YBar_[i].begin(), YBar_[i].end(), 0.0);
+            vjp(t + c(i) * h, Y_[i], kBar_, YBar_[i], dParams);
+        }
+        for (int i = 0; i < kStages; ++i)
+            for (size_t j = 0; j < n; ++j)
+                lambda[j] += YBar_[i][j];
+    }
+
+private:
+    static double c(int i) {
+        static const double c_[kStages] = {0., 1. / 5, 3. / 10, 4. / 5, 8. / 9, 1.};
+        return c_[i];
+    }
+    static double a(int i, int j) {
+        static const double a_[kStages][kStages] = {
+            {},
+            {1. / 5},
+            {3. / 40, 9. / 40},
+            {44. / 45, -56. / 15, 32. / 9},
+            {19372. / 6561, -25360. / 2187, 64448. / 6561, -212. / 729},
+            {9017. / 3168, -355. / 33, 46732. / 5247, 49. / 176, -5103. / 18656},
+        };
+        return a_[i][j];
+    }
+    static double b(int i) {
+        static const double b_[kStages] = {
+            35. / 384, 0., 500. / 1113, 125. / 192, -2187. / 6784, 11. / 84};
+        return b_[i];
+    }
+
+    /// Compute the stage states `Y_` and derivatives `k_` of the step.
+    void computeStages(double t, double h, const std::vector<double> &y) {
+        for (int i = 0; i < kStages; ++i) {
+            for (size_t j = 0; j < y.size(); ++j) {
+                double sum = 0.0;
+                for (int l = 0; l < i; ++l)
+                    sum += a(i, l) * k_[l][j];
+                Y_[i][j] = y[j] + h * sum;
+            }
+            rhs_(t + c(i) * h, params_.data(), Y_[i], k_[i]);
+        }
+    }
+
+    /// Accumulate the vector-Jacobian products `w^T df/dx` to `dY` and
+    /// `w^T df/dp` to `dParams`, where f = rhs(t, p, x).
+    void vjp(double t, const std::vector<double> &x, const std::vector<double> &w,
+             std::vector<double> &dY, std::vector<double> &dParams) {
+        ReverseTape *previous = ReverseTape::active();
+        ReverseTape::active() = &tape_;
+        tape_.clear();
+        for (size_t i = 0; i < pAD_.size(); ++i)
+            pAD_[i] = ReverseAD::variable(params_[i]);
+        for (size_t j = 0; j < x.size(); ++j)
+            xAD_[j] = ReverseAD::variable(x[j]);
+        rhs_(t, pAD_.data(), xAD_, dxdtAD_);
+        ReverseTape::active() = previous;
+
+        adj_.assign(tape_.size(), 0.0);
+        for (size_t j = 0; j < dxdtAD_.size(); ++j)
+            if (dxdtAD_[j].index() >= 0)
+                adj_[dxdtAD_[j].index()] += w[j];
+        tape_.backward(adj_);
+        // Independent variables are the first nodes of the tape.
+        const size_t P = pAD_.size();
+        for (size_t i = 0; i < P; ++i)
+            dParams[i] += adj_[i];
+        for (size_t j = 0; j < x.size(); ++j)
+            dY[j] += adj_[P + j];
+    }
+
+    RHS &rhs_;
+    const std::vector<double> &params_;
+    std::vector<std::vector<double>> Y_;
+    std::vector<std::vector<double>> k_;
+    std::vector<std::vector<double>> YBar_;
+    std::vector<double> kBar_;
+
+    ReverseTape tape_;
+    std::vector<double> adj_;
+    std::vector<ReverseAD> pAD_;
+    std::vector<ReverseAD> xAD_;
+    std::vector<ReverseAD> dxdtAD_;
+};
+
+}  // namespace detail
+
+template <typename RHS>
+AdjointResult integrateAdjoint(
+        RHS rhs,
+        const std::vector<double> &params,
+        std::vector<double> y0,
+        const std::vector<double> &tEval,
+        const std::vector<double> &dLossdY,
+        IntegratorSettings settings)
+{
+    const size_t n = y0.size();
+    if (settings.denseOutput)
+        throw std::invalid_argument("Adjoint sensitivities do not support dense output.");
+    if (!std::isnan(settings.startTime) && !tEval.empty() && settings.startTime != tEval[0])
+        throw std::invalid_argument("Adjoint sensitivities do not support a start time other than tEval[0].");
+    if (dLossdY.size() != tEval.size() * n)
+        throw std::invalid_argument("dLossdY: expected one value per state and time.");
+
+    AdjointResult out{std::vector<double>(params.size(), 0.0), {}};
+    if (tEval.empty()) {
+        out.dY0.assign(n, 0.0);
+        return out;
+    }
+
+    // The sequence of steps, as in boost::numeric::odeint::integrate_times,
+    // and the number of steps preceding each of `tEval`.
+    std::vector<double> stepT;
+    std::vector<double> stepH;
+    std::vector<size_t> evalStep(tEval.size());
+    double t = tEval[0];
+    for (size_t k = 0; k < tEval.size(); ++k) {
+        while (tEval[k] - t > std::numeric_limits<double>::epsilon()) {
+            const double h = std::min(settings.dt, tEval[k] - t);
+            stepT.push_back(t);
+            stepH.push_back(h);
+            t += h;
+        }
+        evalStep[k] = stepT.size();
+    }
+
+    const size_t numSteps = stepT.size();
+    const size_t C = settings.checkpointSteps > 0
+            ? settings.checkpointSteps
+            : std::max<size_t>(1, (size_t)std::ceil(std::sqrt((double)numSteps)));
+
+    // Forward pass, store the checkpoints.
+    detail::Dopri5Adjoint<RHS> stepper{rhs, params, n};
+    std::vector<std::vector<double>> checkpoints;
+    checkpoints.reserve(numSteps / C + 1);
+    for (size_t s = 0; s < numSteps; ++s) {
+        if (s % C == 0) {
+            if (check_signals_func)
+                check_signals_func();
+            checkpoints.push_back(y0);
+        }
+        stepper.step(stepT[s], stepH[s], y0);
+    }
+
+    // Backward pass, segment by segment.
+    std::vector<double> lambda(n, 0.0);
+    size_t k = tEval.size();
+    auto addLossDerivatives = [&](size_t s) {
+        for (; k > 0 && evalStep[k - 1] == s; --k)
+            for (size_t j = 0; j < n; ++j)
+                lambda[j] += dLossdY[(k - 1) * n + j];
+    };
+    std::vector<std::vector<double>> segment;
+    for (size_t cp = checkpoints.size(); cp-- > 0; ) {
+        if (check_signals_func)
+            check_signals_func();
+        const size_t begin = cp * C;
+        const size_t end = std::min(numSteps, begin + C);
+        segment.resize(end - begin);
+        segment[0] = std::move(checkpoints[cp]);
+        for (size_t s = begin + 1; s < end; ++s) {
+            segment[s - begin] = segment[s - begin - 1];
+            stepper.step(stepT[s - 1], stepH[s - 1], segment[s - begin]);
+        }
+        for (size_t s = end; s-- > begin; ) {
+            addLossDerivatives(s + 1);
+            stepper.backward(stepT[s], stepH[s], segment[s - begin], lambda, out.dParams);
+        }
+    }
+    addLossDerivatives(0);
+    out.dY0 = std::move(lambda);
+    return out;
+}
+
+template <typename RHS, typename State>
+std::vector<State> integrate(
+        RHS rhs,
+        State y0,
+        const std::vector<double> &tEval,
+        IntegratorSettings settings)
+{
+    std::vector<State> result;
+    result.reserve(tEval.size());
+    integrate(std::move(rhs), std::move(y0), tEval, std::move(settings),
+              [&result](const typename State::RawState &y, double /*t*/) {
+                  result.push_back(State{y});
+              });
     return result;
 }
 
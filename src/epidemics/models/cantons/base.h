@@ -3,7 +3,10 @@
 #include "data.h"
 #include <epidemics/integrator.h>
 
+#include <algorithm>
 #include <cassert>
+#include <stdexcept>
+#include <type_traits>
 
 namespace epidemics {
 namespace cantons {
@@ -45,6 +48,14 @@ protected:
 };
 
 
+/// Parameters are structs of `numParameters` values of type T, view them as arrays.
+template <typename T, template <typename> class Parameters>
+T *parametersData(Parameters<T> &p) noexcept {
+    static_assert(sizeof(Parameters<T>) == Parameters<T>::numParameters * sizeof(T),
+                  "Parameters must consist of numParameters values of type T.");
+    return reinterpret_cast<T *>(&p);
+}
+
 /** CRTP base class for solvers.
  *
  * Solvers have to only define a `rhs` function, the integrator is handled by
@@ -61,6 +72,39 @@ public:
 
     const DesignParameters &designParameters() const noexcept { return dp_; }
 
+    /// Replace the external infected commuters, a row-major [day][region]
+    /// matrix. The remaining design parameters are kept.
+    void setExternalCommutersIu(std::vector<double> extComIu) {
+        if (dp_.numRegions > 0 && extComIu.size() % dp_.numRegions != 0)
+            throw std::invalid_argument("extComIu: size not divisible by the number of regions.");
+        dp_.extComIu = std::move(extComIu);
+    }
+
+    /// Replace the user-defined per-region values `Ui`.
+    void setUi(std::vector<double> Ui) {
+        if (Ui.size() != dp_.numRegions)
+            throw std::invalid_argument("Ui: expected one value per region.");
+        dp_.Ui = std::move(Ui);
+    }
+
+    /// Set the derivatives of `Ui` and of the external infected commuters
+    /// with respect to the `numDerivatives` variables of the custom AD solve
+    /// (`_solve_custom_ad`), as row-major [region][derivative] and
+    /// [day][region][derivative] matrices. Empty vectors denote zero
+    /// derivatives. Other value types ignore these derivatives.
+    void setDesignDerivatives(size_t numDerivatives,
+                              std::vector<double> UiDer,
+                              std::vector<double> extComIuDer) {
+        const size_t K = dp_.numRegions;
+        if (!UiDer.empty() && UiDer.size() != K * numDerivatives)
+            throw std::invalid_argument("Ui_der: expected one row of derivatives per region.");
+        if (K * numDerivatives > 0 && extComIuDer.size() % (K * numDerivatives) != 0)
+            throw std::invalid_argument("ext_com_iu_der: size not divisible by regions * derivatives.");
+        numDesignDerivatives_ = numDerivatives;
+        UiDer_ = std::move(UiDer);
+        extComIuDer_ = std::move(extComIuDer);
+    }
+
     size_t stateSize() const noexcept {
         return State<double>::kVarsPerRegion * dp_.numRegions;
     }
@@ -97,7 +141,107 @@ public:
                 std::move(y0), tEval, std::move(settings));
     }
 
+    /// Solve and aggregate the variables `vars` of each state with `agg`
+    /// (e.g. municipalities to cantons), without storing the full states.
+    ///
+    /// Returns a vector of `tEval.size() * vars.size() * agg.numGroups`
+    /// values in the row-major [time][var][group] layout.
+    template <typename T>
+    std::vector<T> solveAggregated(
+            const Parameters<T> &parameters,
+            State<T> y0,
+            const std::vector<double> &tEval,
+            const Aggregation &agg,
+            const std::vector<size_t> &vars,
+            IntegratorSettings settings) const
+    {
+        const size_t K = dp_.numRegions;
+        if (y0.raw().size() != K * State<T>::kVarsPerRegion)
+            throw std::invalid_argument("Invalid state vector length.");
+        if (agg.numRegions != K)
+            throw std::invalid_argument("Aggregation: number of regions does not match.");
+        for (size_t v : vars)
+            if (v >= State<T>::kVarsPerRegion)
+                throw std::invalid_argument("Invalid variable index.");
+
+        const size_t G = agg.numGroups;
+        std::vector<T> out(tEval.size() * vars.size() * G, 0 * y0.raw()[0]);
+        size_t offset = 0;
+        integrate(
+                [this, parameters](double t, const State<T> &x, State<T> &dxdt) {
+                    return derived()->rhs(t, parameters, x, dxdt);
+                },
+                std::move(y0), tEval, std::move(settings),
+                [&](const typename State<T>::RawState &y, double /* t */) {
+                    for (size_t v : vars) {
+                        agg.apply(y.data() + v * K, out.data() + offset);
+                        offset += G;
+                    }
+                });
+        return out;
+    }
+
+    /// Compute the gradient of a scalar loss with respect to the parameters
+    /// and the initial state with the adjoint method, see `integrateAdjoint`.
+    ///
+    /// `dLossdY` are the derivatives of the loss with respect to the states
+    /// at `tEval`, in the row-major [time][state] layout.
+    AdjointResult solveAdjoint(
+            Parameters<double> parameters,
+            const State<double> &y0,
+            const std::vector<double> &tEval,
+            const std::vector<double> &dLossdY,
+            IntegratorSettings settings) const
+    {
+        if (y0.raw().size() != dp_.numRegions * State<double>::kVarsPerRegion)
+            throw std::invalid_argument("Invalid state vector length.");
+
+        const double *p = parametersData(parameters);
+        std::vector<double> params(p, p + Parameters<double>::numParameters);
+        auto rhs = [this](double t, const auto *p, const auto &x, auto &dxdt) {
+            using T = std::decay_t<decltype(*p)>;
+            Parameters<T> params;
+            std::copy(p, p + Parameters<T>::numParameters, parametersData(params));
+            State<T> x_{x};
+            State<T> dxdt_{std::move(dxdt)};
+            derived()->rhs(t, params, x_, dxdt_);
+            dxdt = std::move(dxdt_).raw();
+        };
+        return integrateAdjoint(rhs, params, y0.raw(), tEval, dLossdY, std::move(settings));
+    }
+
 protected:
+    /// `Ui[i]` as the type of `zero`, including the design derivatives.
+    template <typename T>
+    T Ui(size_t i, const T &zero) const {
+        T out = zero + dp_.Ui[i];
+        if (!UiDer_.empty())
+            addDesignDerivatives(out, UiDer_.data() + i * numDesignDerivatives_);
+        return out;
+    }
+
+    /// External infected commuters as the type of `zero`, including the
+    /// design derivatives.
+    template <typename T>
+    T externalCommutersIu(int day, size_t i, const T &zero) const {
+        T out = zero + dp_.getExternalCommutersIu(day, (int)i);
+        const size_t idx = (size_t)day * dp_.numRegions + i;
+        if (day >= 0 && (idx + 1) * numDesignDerivatives_ <= extComIuDer_.size())
+            addDesignDerivatives(out, extComIuDer_.data() + idx * numDesignDerivatives_);
+        return out;
+    }
+
+    template <typename T>
+    void addDesignDerivatives(T &, const double *) const noexcept { }
+
+    template <typename T>
+    void addDesignDerivatives(DynamicAutoDiff<T> &x, const double *der) const {
+        if (x.N() != numDesignDerivatives_)
+            throw std::invalid_argument("Number of design derivatives does not match the AD variables.");
+        for (size_t k = 0; k < numDesignDerivatives_; ++k)
+            x.d(k) += der[k];
+    }
+
     Derived *derived() noexcept {
         return static_cast<Derived *>(this);
     }
@@ -106,6 +250,9 @@ protected:
     }
 
     DesignParameters dp_;
+    size_t numDesignDerivatives_{0};
+    std::vector<double> UiDer_;
+    std::vector<double> extComIuDer_;
 };
 
 }  // namespace cantons
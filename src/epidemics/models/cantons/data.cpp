@@ -1,5 +1,8 @@
 #include "data.h"
 #include <epidemics/utils/assert.h>
+#include <epidemics/utils/binary.h>
+
+#include <stdexcept>
 
 namespace epidemics {
 namespace cantons {
@@ -29,6 +32,28 @@ DesignParameters::DesignParameters(
     init();
 }
 
+Aggregation::Aggregation(
+        size_t numRegions_,
+        std::vector<int> indptr_,
+        std::vector<int> indices_,
+        std::vector<double> weights_) :
+    numGroups(indptr_.empty() ? 0 : indptr_.size() - 1),
+    numRegions(numRegions_),
+    indptr(std::move(indptr_)),
+    indices(std::move(indices_)),
+    weights(std::move(weights_))
+{
+    if (indptr.empty() || indptr[0] != 0 || (size_t)indptr.back() != indices.size()
+            || indices.size() != weights.size())
+        throw std::invalid_argument("Aggregation: inconsistent CSR arrays.");
+    for (size_t g = 0; g < numGroups; ++g)
+        if (indptr[g] > indptr[g + 1])
+            throw std::invalid_argument("Aggregation: indptr not sorted.");
+    for (int i : indices)
+        if (i < 0 || (size_t)i >= numRegions)
+            throw std::invalid_argument("Aggregation: region index out of range.");
+}
+
 void DesignParameters::init() {
     size_t K = regionKeys.size();
     numRegions = K;
@@ -63,7 +88,100 @@ std::vector<double> ReferenceData::getReferenceEvaluations(
 }
 */
 
+/// Read a K x K matrix stored either densely as `name` or in the CSR format
+/// as `name.indptr` (int64), `name.indices` (int32) and `name.data` (float64).
+static std::vector<double> readBinaryMatrix(
+        const MappedBinaryFile &file, const std::string &name, size_t K) {
+    if (file.has(name.c_str())) {
+        auto M = file.get<double>(name.c_str());
+        if (M.size != K * K)
+            DIE("Expected %zu elements of %s, got %zu.\n", K * K, name.c_str(), M.size);
+        return M.toVector();
+    }
+    auto indptr = file.get<int64_t>((name + ".indptr").c_str());
+    auto indices = file.get<int32_t>((name + ".indices").c_str());
+    auto data = file.get<double>((name + ".data").c_str());
+    if (indptr.size != K + 1 || indices.size != data.size
+            || (size_t)indptr[K] != data.size)
+        DIE("Inconsistent sparse matrix %s.\n", name.c_str());
+    std::vector<double> out(K * K, 0.0);
+    for (size_t i = 0; i < K; ++i)
+        for (int64_t k = indptr[i]; k < indptr[i + 1]; ++k) {
+            if (indices[k] < 0 || (size_t)indices[k] >= K)
+                DIE("Column index out of range in %s.\n", name.c_str());
+            out[i * K + indices[k]] += data[k];
+        }
+    return out;
+}
+
+static DesignParameters readDesignParametersBinary(const char *filename) {
+    MappedBinaryFile file{filename};
+    if (file.kind() != "design")
+        DIE("Expected design parameters in \"%s\", found \"%s\".\n",
+            filename, file.kind().c_str());
+
+    DesignParameters out;
+    // Region keys are stored as a single '\n'-separated string.
+    auto keys = file.get<uint8_t>("region_keys");
+    if (keys.size > 0) {
+        std::string key;
+        for (uint8_t c : keys) {
+            if (c == '\n') {
+                out.regionKeys.push_back(std::move(key));
+                key.clear();
+            } else {
+                key.push_back((char)c);
+            }
+        }
+        out.regionKeys.push_back(std::move(key));
+    }
+    size_t N = out.regionKeys.size();
+
+    out.Ni = file.get<double>("Ni").toVector();
+    if (out.Ni.size() != N)
+        DIE("Expected %zu elements of Ni, got %zu.\n", N, out.Ni.size());
+
+    out.Mij = readBinaryMatrix(file, "Mij", N);
+    for (size_t i = 0; i < N; ++i)
+        out.Mij[i * N + i] = 0.0;
+    out.Cij = readBinaryMatrix(file, "Cij", N);
+
+    out.extComIu = file.get<double>("extComIu").toVector();
+    if (N > 0 && out.extComIu.size() % N != 0)
+        DIE("Size of extComIu not divisible by the number of regions.\n");
+
+    out.Ui = file.get<double>("Ui").toVector();
+    if (out.Ui.size() != N)
+        DIE("Expected %zu elements of Ui, got %zu.\n", N, out.Ui.size());
+
+    out.init();
+    return out;
+}
+
+static ReferenceData readReferenceDataBinary(const char *filename) {
+    MappedBinaryFile file{filename};
+    if (file.kind() != "reference")
+        DIE("Expected reference data in \"%s\", found \"%s\".\n",
+            filename, file.kind().c_str());
+
+    auto day = file.get<int32_t>("day");
+    auto region = file.get<int32_t>("region");
+    auto value = file.get<double>("value");
+    if (day.size != region.size || day.size != value.size)
+        DIE("Inconsistent number of data points in \"%s\".\n", filename);
+
+    ReferenceData out;
+    out.cases.resize(day.size);
+    for (size_t i = 0; i < day.size; ++i)
+        out.cases[i] = DataPoint{day[i], region[i], value[i]};
+    return out;
+}
+
 DesignParameters readDesignParameters(const char *filename) {
+    if (MappedBinaryFile::isBinaryFile(filename))
+        return readDesignParametersBinary(filename);
+
+    // Legacy text format.
     FILE *f = fopen(filename, "r");
     if (f == nullptr)
         DIE("Error opening file \"%s\". Did you forget to run ./py/data.py?\n", filename);
@@ -112,10 +230,18 @@ DesignParameters readDesignParameters(const char *filename) {
 
     fclose(f);
 
+    // The text format does not store Cij.
+    out.Cij.assign(N * N, 0.0);
+    out.init();
+
     return out;
 }
 
 ReferenceData readReferenceData(const char *filename) {
+    if (MappedBinaryFile::isBinaryFile(filename))
+        return readReferenceDataBinary(filename);
+
+    // Legacy text format.
     FILE *f = fopen(filename, "r");
     if (f == nullptr)
         DIE("Error opening file \"%s\". Did you forget to run ./py/data.py?\n", filename);
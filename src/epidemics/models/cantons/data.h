@@ -7,6 +7,7 @@ namespace epidemics {
 namespace cantons {
 
 /// A data value for the given region and day.
+/// Note: The layout must match `DATA_POINT_DTYPE` exported in bindings.cpp.
 struct DataPoint {
     int day;
     int region;
@@ -17,6 +18,7 @@ struct DataPoint {
 struct DesignParameters {
     // Note: The following files depend on the structure of this struct:
     //       epidemics/cantons/py/model.py:PyDesignParameters.to_cpp
+    //       src/epidemics/bindings/bindings.cpp
     //       src/epidemics/bindings/cantons.template.cpp
     //       tests/py/common.py
     std::vector<std::string> regionKeys;
@@ -50,6 +52,35 @@ struct DesignParameters {
     void init();
 };
 
+/// Sparse aggregation of region values to groups, e.g. municipalities to
+/// cantons. Stores the (numGroups x numRegions) matrix P in the CSR format,
+/// such that the aggregated value of group `g` is `sum_i P[g][i] * x[i]`.
+struct Aggregation {
+    // Note: py/model.py:make_cpp_aggregation depends on this structure.
+    size_t numGroups;
+    size_t numRegions;
+    std::vector<int> indptr;       // numGroups + 1
+    std::vector<int> indices;      // Region indices.
+    std::vector<double> weights;
+
+    Aggregation() = default;
+    Aggregation(size_t numRegions,
+                std::vector<int> indptr,
+                std::vector<int> indices,
+                std::vector<double> weights);
+
+    /// Compute `out[g] = sum_i P[g][i] * x[i]` for all groups.
+    template <typename T>
+    void apply(const T * __restrict__ x, T * __restrict__ out) const {
+        for (size_t g = 0; g < numGroups; ++g) {
+            T sum = 0 * x[0];
+            for (int k = indptr[g]; k < indptr[g + 1]; ++k)
+                sum += weights[k] * x[indices[k]];
+            out[g] = sum;
+        }
+    }
+};
+
 /// UQ-specific data
 struct ReferenceData {
     // Note: py/model.py:ReferenceData.to_cpp depends on this structure.
@@ -70,6 +101,10 @@ struct ReferenceData {
     */
 };
 
+/// Read design parameters or reference data stored by `save_cpp_dat` in
+/// epidemics/cantons/py/model.py. Files in the binary container format (see
+/// utils/binary.h) are memory-mapped, files in the legacy text format are
+/// parsed as before.
 DesignParameters readDesignParameters(const char *filename = "data/cpp_design_parameters.dat");
 ReferenceData readReferenceData(const char *filename = "data/cpp_reference_data.dat");
 
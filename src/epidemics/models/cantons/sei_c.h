@@ -55,8 +55,8 @@ struct Solver : SolverBase<Solver, State, Parameters> {
             for (size_t j = 0; j < dp_.numRegions; ++j) {
                 sumIC_N += x.I(j) * this->C_plus_Ct(i, j) * invNi[j];
             }
-            const double ext = dp_.getExternalCommutersIu(day, i);
-            const T beta_i = beta * (1 + dp_.Ui[i]);
+            const T ext = this->externalCommutersIu(day, i, ZERO);
+            const T beta_i = beta * (1 + this->Ui(i, ZERO));
             const T A = beta_i * x.S(i) * invNi[i] * (
                     x.I(i) + p.nu * sumIC_N + ext);
             const T E_Z = x.E(i) / p.Z;
@@ -69,6 +69,22 @@ public:
                 std::move(y0), tEval, std::move(settings));
     }
 
+    /// Resume the integration from the state `y0` at time `t0`, e.g. a state
+    /// stored at the end of the data, and report the solution at `tEval`.
+    /// As the right-hand side sees the absolute time, the result is the same
+    /// as of the integration from t=0, up to the step sequence.
+    template <typename T>
+    std::vector<State<T>> solve(
+            const Parameters<T> &parameters,
+            double t0,
+            State<T> y0,
+            const std::vector<double> &tEval,
+            IntegratorSettings settings) const
+    {
+        settings.startTime = t0;
+        return solve(parameters, std::move(y0), tEval, std::move(settings));
+    }
+
 protected:
     Derived *derived() noexcept {
         return static_cast<Derived *>(this);
@@ -1,7 +1,12 @@
 #pragma once
 
+#include <algorithm>
 #include <array>
+#include <cassert>
 #include <cmath>
+#include <cstring>
+#include <memory>
+#include <type_traits>
 #include <vector>
 
 namespace epidemics {
@@ -41,40 +46,241 @@ private:
     std::array<T, 1 + N_> v_;
 };
 
+/** Pool of equally-sized blocks of T, used as the storage of DynamicAutoDiff.
+ *
+ * Blocks are carved from large chunks with a bump pointer and recycled
+ * through a free list, such that arithmetic on DynamicAutoDiff values does
+ * not call the heap allocator. Pools are per-thread and are activated for
+ * the duration of a solve with `ADPoolScope`.
+ */
+template <typename T>
+class ADBlockPool {
+public:
+    static_assert(std::is_trivially_copyable<T>::value, "T must be trivially copyable.");
+
+    explicit ADBlockPool(size_t blockSize) :
+        blockSize_{blockSize},
+        stride_{std::max(blockSize, (sizeof(T *) + sizeof(T) - 1) / sizeof(T))}
+    { }
+    ADBlockPool(const ADBlockPool &) = delete;
+    ADBlockPool &operator=(const ADBlockPool &) = delete;
+
+    size_t blockSize() const noexcept { return blockSize_; }
+    size_t numLive() const noexcept { return numLive_; }
+
+    T *allocate() {
+        ++numLive_;
+        if (free_ != nullptr) {
+            T *p = free_;
+            std::memcpy(&free_, p, sizeof(T *));
+            return p;
+        }
+        if (next_ == end_)
+            newChunk();
+        T *p = next_;
+        next_ += stride_;
+        return p;
+    }
+
+    void deallocate(T *p) noexcept {
+        --numLive_;
+        std::memcpy(p, &free_, sizeof(T *));
+        free_ = p;
+    }
+
+    /// Make all memory available again, keeping the chunks.
+    /// Must be called only when no blocks are in use.
+    void reset() noexcept {
+        assert(numLive_ == 0);
+        free_ = nullptr;
+        chunk_ = 0;
+        next_ = end_ = nullptr;
+        if (!chunks_.empty()) {
+            next_ = chunks_[0].get();
+            end_ = next_ + kBlocksPerChunk * stride_;
+        }
+    }
+
+    /// The pool of the innermost `ADPoolScope` of this thread, or nullptr.
+    static ADBlockPool *&active() noexcept {
+        static thread_local ADBlockPool *pool = nullptr;
+        return pool;
+    }
+
+    /// Whether `ADPoolScope` activates the pools of this thread. Disabling
+    /// them allows comparing against the heap-allocated computation.
+    static bool &enabled() noexcept {
+        static thread_local bool enabled = true;
+        return enabled;
+    }
+
+    /// The pool of this thread for the given block size.
+    static ADBlockPool &forThread(size_t blockSize) {
+        static thread_local std::vector<std::unique_ptr<ADBlockPool>> pools;
+        for (auto &pool : pools)
+            if (pool->blockSize() == blockSize)
+                return *pool;
+        pools.push_back(std::make_unique<ADBlockPool>(blockSize));
+        return *pools.back();
+    }
+
+private:
+    static constexpr size_t kBlocksPerChunk = 1024;
+
+    void newChunk() {
+        if (chunk_ + 1 < chunks_.size()) {
+            next_ = chunks_[++chunk_].get();
+        } else {
+            chunks_.push_back(std::make_unique<T[]>(kBlocksPerChunk * stride_));
+            chunk_ = chunks_.size() - 1;
+            next_ = chunks_.back().get();
+        }
+        end_ = next_ + kBlocksPerChunk * stride_;
+    }
+
+    size_t blockSize_;
+    size_t stride_;
+    size_t numLive_{0};
+    T *free_{nullptr};
+    T *next_{nullptr};
+    T *end_{nullptr};
+    size_t chunk_{0};
+    std::vector<std::unique_ptr<T[]>> chunks_;
+};
+
+/** Activate the thread's `ADBlockPool` for DynamicAutoDiff values with `N`
+ * derivatives while the scope is alive.
+ *
+ * Values allocated from the pool must not outlive the scope, use
+ * `ADPoolSuspend` when creating values that are returned to the caller.
+ */
+template <typename T>
+class ADPoolScope {
+public:
+    explicit ADPoolScope(size_t N) :
+        pool_{&ADBlockPool<T>::forThread(1 + N)},
+        previous_{ADBlockPool<T>::active()}
+    {
+        ADBlockPool<T>::active() = ADBlockPool<T>::enabled() ? pool_ : nullptr;
+    }
+    ADPoolScope(const ADPoolScope &) = delete;
+    ADPoolScope &operator=(const ADPoolScope &) = delete;
+
+    ~ADPoolScope() {
+        ADBlockPool<T>::active() = previous_;
+        if (pool_->numLive() == 0)
+            pool_->reset();
+    }
+
+private:
+    ADBlockPool<T> *pool_;
+    ADBlockPool<T> *previous_;
+};
+
+/// Deactivate the `ADBlockPool` while the object is alive.
+template <typename T>
+class ADPoolSuspend {
+public:
+    ADPoolSuspend() : previous_{ADBlockPool<T>::active()} {
+        ADBlockPool<T>::active() = nullptr;
+    }
+    ADPoolSuspend(const ADPoolSuspend &) = delete;
+    ADPoolSuspend &operator=(const ADPoolSuspend &) = delete;
+    ~ADPoolSuspend() { ADBlockPool<T>::active() = previous_; }
+
+private:
+    ADBlockPool<T> *previous_;
+};
+
+/// Storage of a runtime number of values, taken from the active
+/// `ADBlockPool` if the size matches, otherwise from the heap.
 template <typename T>
 struct ADDynamicStorage
 {
-    ADDynamicStorage(std::vector<T> v) : v_(std::move(v)) { }
-    ADDynamicStorage(T value, const std::vector<T> &d) : v_(d.size() + 1) {
-        v_[0] = value;
-        for (size_t i = 0; i < d.size(); ++i)
-            v_[1 + i] = d[i];
+    ADDynamicStorage(const std::vector<T> &v) : ADDynamicStorage(v.size()) {
+        std::copy(v.begin(), v.end(), v_);
     }
-
-    size_t N() const noexcept { return v_.size() - 1; }
+    ADDynamicStorage(T value, const std::vector<T> &d) : ADDynamicStorage(d.size() + 1) {
+        v_[0] = value;
+        std::copy(d.begin(), d.end(), v_ + 1);
+    }
+    ADDynamicStorage(size_t size, T fill) : ADDynamicStorage(size) {
+        std::fill(v_, v_ + size_, fill);
+    }
+    ADDynamicStorage(const ADDynamicStorage &other) : ADDynamicStorage(other.size_) {
+        std::copy(other.v_, other.v_ + size_, v_);
+    }
+    ADDynamicStorage(ADDynamicStorage &&other) noexcept :
+        v_{other.v_}, size_{other.size_}, pool_{other.pool_}
+    {
+        other.v_ = nullptr;
+        other.size_ = 0;
+        other.pool_ = nullptr;
+    }
+    ADDynamicStorage &operator=(const ADDynamicStorage &other) {
+        if (this != &other) {
+            if (size_ != other.size_) {
+                ADDynamicStorage tmp{other.size_};
+                swap(tmp);
+            }
+            std::copy(other.v_, other.v_ + size_, v_);
+        }
+        return *this;
+    }
+    ADDynamicStorage &operator=(ADDynamicStorage &&other) noexcept {
+        swap(other);
+        return *this;
+    }
+    ~ADDynamicStorage() { release(); }
+
+    size_t N() const noexcept { return size_ - 1; }
 protected:
     void checkSize() const {
-        assert(!v_.empty());
+        assert(size_ > 0);
     }
     void checkSize(const ADDynamicStorage &other) const {
         (void)other;
-        assert(v_.size() == other.v_.size());
+        assert(size_ == other.size_);
     }
 
     T &get(size_t index) {
-        assert(index < v_.size());
+        assert(index < size_);
         return v_[index];
     }
     const T &get(size_t index) const {
-        assert(index < v_.size());
+        assert(index < size_);
         return v_[index];
     }
-    T *data() noexcept { return v_.data(); }
-    const T *data() const noexcept { return v_.data(); }
+    T *data() noexcept { return v_; }
+    const T *data() const noexcept { return v_; }
 
 private:
-    // TODO: A custom container with T* v_ and size_t N.
-    std::vector<T> v_;
+    explicit ADDynamicStorage(size_t size) : size_{size} {
+        ADBlockPool<T> *pool = ADBlockPool<T>::active();
+        if (pool != nullptr && pool->blockSize() == size) {
+            pool_ = pool;
+            v_ = pool->allocate();
+        } else if (size > 0) {
+            v_ = new T[size];
+        }
+    }
+
+    void release() noexcept {
+        if (pool_ != nullptr)
+            pool_->deallocate(v_);
+        else
+            delete[] v_;
+    }
+
+    void swap(ADDynamicStorage &other) noexcept {
+        std::swap(v_, other.v_);
+        std::swap(size_, other.size_);
+        std::swap(pool_, other.pool_);
+    }
+
+    T *v_{nullptr};
+    size_t size_{0};
+    ADBlockPool<T> *pool_{nullptr};  // nullptr if allocated on the heap.
 };
 
 /** First partial derivatives class. */
@@ -308,8 +514,8 @@ private:
 public:
     using size_tag = typename Base::size_tag;
 
-    DynamicAutoDiff(size_tag, size_t N) : Base(std::vector<T>(1 + N)) { }
-    DynamicAutoDiff(std::vector<T> v) : Base(std::move(v)) { }
+    DynamicAutoDiff(size_tag, size_t N) : Base(1 + N, T{}) { }
+    DynamicAutoDiff(const std::vector<T> &v) : Base(v) { }
     DynamicAutoDiff(T value, const std::vector<T> &d) : Base(value, d) { }
 
     // Cannot construct a DynamicAutoDiff without num of derivatives.
@@ -0,0 +1,121 @@
+#include "binary.h"
+#include "assert.h"
+
+#include <cstdio>
+#include <cstring>
+
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+namespace epidemics {
+
+static constexpr char kMagic[8] = {'E', 'P', 'I', 'D', 'B', 'I', 'N', '\0'};
+static constexpr size_t kHeaderSize = 32;
+static constexpr size_t kEntrySize = 64;
+static constexpr size_t kNameSize = 40;
+static constexpr size_t kKindSize = 16;
+
+template <typename T>
+static T readLE(const char *ptr) {
+    // The file is little-endian. On big-endian machines we abort in the
+    // constructor, so a plain memcpy suffices here.
+    T out;
+    memcpy(&out, ptr, sizeof(T));
+    return out;
+}
+
+static size_t dtypeSize(BinaryDType dtype) {
+    switch (dtype) {
+        case BinaryDType::Float64: return 8;
+        case BinaryDType::Int32: return 4;
+        case BinaryDType::Int64: return 8;
+        case BinaryDType::UInt8: return 1;
+    }
+    return 0;
+}
+
+bool MappedBinaryFile::isBinaryFile(const char *filename) {
+    FILE *f = fopen(filename, "rb");
+    if (f == nullptr)
+        return false;
+    char magic[sizeof(kMagic)];
+    bool ok = fread(magic, 1, sizeof(magic), f) == sizeof(magic)
+           && memcmp(magic, kMagic, sizeof(magic)) == 0;
+    fclose(f);
+    return ok;
+}
+
+MappedBinaryFile::MappedBinaryFile(const char *filename) : filename_(filename) {
+    const uint16_t one = 1;
+    if (*reinterpret_cast<const uint8_t *>(&one) != 1)
+        DIE("Binary files are supported only on little-endian machines.\n");
+
+    int fd = open(filename, O_RDONLY);
+    if (fd < 0)
+        DIE("Error opening file \"%s\".\n", filename);
+    struct stat st;
+    if (fstat(fd, &st) != 0)
+        DIE("fstat of \"%s\" failed.\n", filename);
+    size_ = (size_t)st.st_size;
+    if (size_ < kHeaderSize)
+        DIE("File \"%s\" too small to be a binary container.\n", filename);
+    void *ptr = mmap(nullptr, size_, PROT_READ, MAP_PRIVATE, fd, 0);
+    close(fd);
+    if (ptr == MAP_FAILED)
+        DIE("mmap of \"%s\" failed.\n", filename);
+    data_ = static_cast<const char *>(ptr);
+
+    if (memcmp(data_, kMagic, sizeof(kMagic)) != 0)
+        DIE("File \"%s\" is not a binary container.\n", filename);
+    uint32_t version = readLE<uint32_t>(data_ + 8);
+    if (version != BINARY_FORMAT_VERSION)
+        DIE("File \"%s\" has format version %u, expected %u.\n",
+            filename, version, BINARY_FORMAT_VERSION);
+    uint32_t numArrays = readLE<uint32_t>(data_ + 12);
+    kind_.assign(data_ + 16, strnlen(data_ + 16, kKindSize));
+
+    if (kHeaderSize + numArrays * kEntrySize > size_)
+        DIE("File \"%s\" truncated (array table).\n", filename);
+    entries_.reserve(numArrays);
+    for (uint32_t i = 0; i < numArrays; ++i) {
+        const char *p = data_ + kHeaderSize + i * kEntrySize;
+        Entry e;
+        e.name.assign(p, strnlen(p, kNameSize));
+        e.dtype = (BinaryDType)readLE<uint32_t>(p + 40);
+        e.offset = readLE<uint64_t>(p + 48);
+        e.count = readLE<uint64_t>(p + 56);
+        size_t elemSize = dtypeSize(e.dtype);
+        if (elemSize == 0)
+            DIE("Array \"%s\" in \"%s\" has unknown dtype %u.\n",
+                e.name.c_str(), filename, (unsigned)e.dtype);
+        if (e.offset % elemSize != 0 || e.offset + e.count * elemSize > size_)
+            DIE("Array \"%s\" in \"%s\" is misaligned or truncated.\n",
+                e.name.c_str(), filename);
+        entries_.push_back(std::move(e));
+    }
+}
+
+MappedBinaryFile::~MappedBinaryFile() {
+    munmap(const_cast<char *>(data_), size_);
+}
+
+auto MappedBinaryFile::find(const char *name) const noexcept -> const Entry * {
+    for (const Entry &e : entries_)
+        if (e.name == name)
+            return &e;
+    return nullptr;
+}
+
+auto MappedBinaryFile::getEntry(const char *name, BinaryDType dtype) const -> const Entry & {
+    const Entry *e = find(name);
+    if (e == nullptr)
+        DIE("Array \"%s\" not found in \"%s\".\n", name, filename_.c_str());
+    if (e->dtype != dtype)
+        DIE("Array \"%s\" in \"%s\" has dtype %u, expected %u.\n",
+            name, filename_.c_str(), (unsigned)e->dtype, (unsigned)dtype);
+    return *e;
+}
+
+}  // namespace epidemics
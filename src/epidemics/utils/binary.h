@@ -0,0 +1,100 @@
+#pragma once
+
+#include <cstddef>
+#include <cstdint>
+#include <string>
+#include <vector>
+
+namespace epidemics {
+
+/// Versioned binary container of named 1D arrays.
+///
+/// Note: The format must match epidemics/utils/binary.py.
+///
+/// All values are little-endian.
+///
+/// Header (32 bytes):
+///     char     magic[8];      "EPIDBIN\0"
+///     uint32_t version;       BINARY_FORMAT_VERSION
+///     uint32_t numArrays;
+///     char     kind[16];      Zero-padded content type, e.g. "design".
+///
+/// Array table (numArrays entries of 64 bytes):
+///     char     name[40];      Zero-padded array name.
+///     uint32_t dtype;         See `BinaryDType`.
+///     uint32_t reserved;
+///     uint64_t offset;        Offset from the beginning of the file, 8-byte aligned.
+///     uint64_t count;         Number of elements.
+///
+/// Followed by raw array data.
+enum class BinaryDType : uint32_t {
+    Float64 = 1,
+    Int32 = 2,
+    Int64 = 3,
+    UInt8 = 4,
+};
+
+constexpr uint32_t BINARY_FORMAT_VERSION = 1;
+
+template <typename T> struct BinaryDTypeOf;
+template <> struct BinaryDTypeOf<double>  { static constexpr BinaryDType value = BinaryDType::Float64; };
+template <> struct BinaryDTypeOf<int32_t> { static constexpr BinaryDType value = BinaryDType::Int32; };
+template <> struct BinaryDTypeOf<int64_t> { static constexpr BinaryDType value = BinaryDType::Int64; };
+template <> struct BinaryDTypeOf<uint8_t> { static constexpr BinaryDType value = BinaryDType::UInt8; };
+
+/// A non-owning view of a contiguous array.
+template <typename T>
+struct ArrayView {
+    const T *data;
+    size_t size;
+
+    const T *begin() const noexcept { return data; }
+    const T *end() const noexcept { return data + size; }
+    const T &operator[](size_t i) const noexcept { return data[i]; }
+
+    std::vector<T> toVector() const { return std::vector<T>(begin(), end()); }
+};
+
+/// Read-only memory-mapped binary container.
+///
+/// Arrays are accessed without copying, the views are valid as long as the
+/// `MappedBinaryFile` object is alive.
+class MappedBinaryFile {
+public:
+    explicit MappedBinaryFile(const char *filename);
+    ~MappedBinaryFile();
+    MappedBinaryFile(const MappedBinaryFile &) = delete;
+    MappedBinaryFile &operator=(const MappedBinaryFile &) = delete;
+
+    /// Check whether the file starts with the binary container magic.
+    static bool isBinaryFile(const char *filename);
+
+    const std::string &kind() const noexcept { return kind_; }
+    bool has(const char *name) const noexcept { return find(name) != nullptr; }
+
+    /// Return the view of the array `name`, abort if missing or of wrong type.
+    template <typename T>
+    ArrayView<T> get(const char *name) const {
+        const Entry &e = getEntry(name, BinaryDTypeOf<T>::value);
+        return {reinterpret_cast<const T *>(data_ + e.offset), (size_t)e.count};
+    }
+
+private:
+    struct Entry {
+        std::string name;
+        BinaryDType dtype;
+        uint64_t offset;
+        uint64_t count;
+    };
+
+    const Entry *find(const char *name) const noexcept;
+    const Entry &getEntry(const char *name, BinaryDType dtype) const;
+
+    std::string filename_;
+    std::string kind_;
+    std::vector<Entry> entries_;
+    const char *data_;
+    size_t size_;
+};
+
+}  // namespace epidemics
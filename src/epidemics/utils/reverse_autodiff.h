@@ -0,0 +1,171 @@
+#pragma once
+
+#include <cassert>
+#include <cmath>
+#include <vector>
+
+namespace epidemics {
+
+/** Tape of elementary operations for reverse-mode autodifferentiation.
+ *
+ * Each node stores up to two parent nodes and the partial derivatives with
+ * respect to them. Nodes are appended in the evaluation order, such that
+ * the adjoints can be propagated with a single reverse sweep.
+ */
+class ReverseTape {
+public:
+    /// Add an independent variable, returns its index.
+    int newVariable() {
+        nodes_.push_back({-1, -1, 0.0, 0.0});
+        return (int)nodes_.size() - 1;
+    }
+
+    /// Add a node depending on `a` and `b` (-1 for none), returns its index.
+    int push(int a, double da, int b, double db) {
+        nodes_.push_back({a, b, da, db});
+        return (int)nodes_.size() - 1;
+    }
+
+    size_t size() const noexcept { return nodes_.size(); }
+
+    /// Remove all nodes, keeping the allocated memory.
+    void clear() noexcept { nodes_.clear(); }
+
+    /// Propagate the adjoints `adj` (one per node) from the last node to the
+    /// first, in place. Afterwards, `adj[i]` of an independent variable `i`
+    /// is the derivative of the seeded output with respect to it.
+    void backward(std::vector<double> &adj) const {
+        assert(adj.size() == nodes_.size());
+        for (size_t i = nodes_.size(); i-- > 0; ) {
+            const double w = adj[i];
+            if (w == 0.0)
+                continue;
+            const Node &n = nodes_[i];
+            if (n.a >= 0)
+                adj[n.a] += n.da * w;
+            if (n.b >= 0)
+                adj[n.b] += n.db * w;
+        }
+    }
+
+    /// The tape the operations on `ReverseAD` values are recorded to.
+    static ReverseTape *&active() noexcept {
+        static thread_local ReverseTape *tape = nullptr;
+        return tape;
+    }
+
+private:
+    struct Node {
+        int a;
+        int b;
+        double da;
+        double db;
+    };
+
+    std::vector<Node> nodes_;
+};
+
+
+/** Reverse-mode autodifferentiation scalar.
+ *
+ * Operations on values depending on independent variables are recorded to
+ * `ReverseTape::active()`. Constants (`index() == -1`) are not recorded.
+ */
+class ReverseAD {
+public:
+    using ValueType = double;
+
+    /* implicit */ ReverseAD(double value = 0.0) noexcept : v_{value}, idx_{-1} { }
+
+    /// Create an independent variable on the active tape.
+    static ReverseAD variable(double value) {
+        return ReverseAD{value, ReverseTape::active()->newVariable()};
+    }
+
+    double val() const noexcept { return v_; }
+    int index() const noexcept { return idx_; }
+    explicit operator double() const noexcept { return v_; }
+
+    ReverseAD operator+() const { return *this; }
+    ReverseAD operator-() const { return unary(-v_, -1.0); }
+
+    friend ReverseAD operator+(const ReverseAD &a, const ReverseAD &b) {
+        return binary(a.v_ + b.v_, a, 1.0, b, 1.0);
+    }
+    friend ReverseAD operator-(const ReverseAD &a, const ReverseAD &b) {
+        return binary(a.v_ - b.v_, a, 1.0, b, -1.0);
+    }
+    friend ReverseAD operator*(const ReverseAD &a, const ReverseAD &b) {
+        return binary(a.v_ * b.v_, a, b.v_, b, a.v_);
+    }
+    friend ReverseAD operator/(const ReverseAD &a, const ReverseAD &b) {
+        const double inv = 1 / b.v_;
+        return binary(a.v_ * inv, a, inv, b, -a.v_ * inv * inv);
+    }
+    friend ReverseAD operator+(const ReverseAD &a, double b) { return a.unary(a.v_ + b, 1.0); }
+    friend ReverseAD operator+(double a, const ReverseAD &b) { return b.unary(a + b.v_, 1.0); }
+    friend ReverseAD operator-(const ReverseAD &a, double b) { return a.unary(a.v_ - b, 1.0); }
+    friend ReverseAD operator-(double a, const ReverseAD &b) { return b.unary(a - b.v_, -1.0); }
+    friend ReverseAD operator*(const ReverseAD &a, double b) { return a.unary(a.v_ * b, b); }
+    friend ReverseAD operator*(double a, const ReverseAD &b) { return b.unary(a * b.v_, a); }
+    friend ReverseAD operator/(const ReverseAD &a, double b) { return a.unary(a.v_ / b, 1 / b); }
+    friend ReverseAD operator/(double a, const ReverseAD &b) {
+        const double inv = 1 / b.v_;
+        return b.unary(a * inv, -a * inv * inv);
+    }
+
+    template <typename U>
+    ReverseAD &operator+=(const U &b) { return *this = *this + b; }
+    template <typename U>
+    ReverseAD &operator-=(const U &b) { return *this = *this - b; }
+    template <typename U>
+    ReverseAD &operator*=(const U &b) { return *this = *this * b; }
+    template <typename U>
+    ReverseAD &operator/=(const U &b) { return *this = *this / b; }
+
+#define EPIDEMICS_REVERSE_AD_COMPARISON(OP) \
+    friend bool operator OP(const ReverseAD &a, const ReverseAD &b) { return a.v_ OP b.v_; } \
+    friend bool operator OP(const ReverseAD &a, double b) { return a.v_ OP b; } \
+    friend bool operator OP(double a, const ReverseAD &b) { return a OP b.v_; }
+    EPIDEMICS_REVERSE_AD_COMPARISON(==)
+    EPIDEMICS_REVERSE_AD_COMPARISON(!=)
+    EPIDEMICS_REVERSE_AD_COMPARISON(<)
+    EPIDEMICS_REVERSE_AD_COMPARISON(<=)
+    EPIDEMICS_REVERSE_AD_COMPARISON(>)
+    EPIDEMICS_REVERSE_AD_COMPARISON(>=)
+#undef EPIDEMICS_REVERSE_AD_COMPARISON
+
+    friend ReverseAD exp(const ReverseAD &x) {
+        using std::exp;
+        const double e = exp(x.v_);
+        return x.unary(e, e);
+    }
+    friend ReverseAD log(const ReverseAD &x) {
+        using std::log;
+        return x.unary(log(x.v_), 1 / x.v_);
+    }
+
+private:
+    ReverseAD(double value, int index) noexcept : v_{value}, idx_{index} { }
+
+    ReverseAD unary(double value, double d) const {
+        if (idx_ < 0)
+            return ReverseAD{value};
+        return ReverseAD{value, ReverseTape::active()->push(idx_, d, -1, 0.0)};
+    }
+
+    static ReverseAD binary(double value,
+                            const ReverseAD &a, double da,
+                            const ReverseAD &b, double db) {
+        if (a.idx_ < 0)
+            return b.unary(value, db);
+        if (b.idx_ < 0)
+            return a.unary(value, da);
+        return ReverseAD{value, ReverseTape::active()->push(a.idx_, da, b.idx_, db)};
+    }
+
+    double v_;
+    int idx_;
+};
+
+}  // namespace epidemics
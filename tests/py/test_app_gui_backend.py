@@ -0,0 +1,115 @@
+import concurrent.futures
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from common import TestCaseEx
+
+def import_server():
+    """Import `server` and its `main`, which clash with the modules of other applications."""
+    names = ['main', 'model', 'server']
+    modules = {name: sys.modules.pop(name) for name in names if name in sys.modules}
+    path = list(sys.path)
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                    '..', '..', 'applications', 'gui_backend'))
+    try:
+        import server
+    finally:
+        sys.path[:] = path
+        for name in names:
+            sys.modules.pop(name, None)
+        sys.modules.update(modules)
+    return server
+
+server = import_server()
+
+OPTIONS = {'data': [1.0, 2.0, 4.0], 'populationSize': 1000}
+
+class TestAppGUIBackend(TestCaseEx):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.service = server.Service(self.tmp_dir)
+        # Run requests in threads, such that `run_request` can be stubbed.
+        self.service.pool.shutdown()
+        self.service.pool = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+
+    def tearDown(self):
+        self.service.pool.shutdown()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_get_args(self):
+        args = server.get_args(dict(OPTIONS, nSamples=100))
+        self.assertEqual(args.nSamples, 100)
+        self.assertEqual(args.data, OPTIONS['data'])
+        with self.assertRaises(ValueError):
+            server.get_args(dict(OPTIONS, unknown=1))
+        with self.assertRaises(ValueError):
+            server.get_args({'data': [1.0]})
+
+    def test_cache_key(self):
+        key = server.cache_key(server.get_args(OPTIONS))
+        self.assertEqual(key, server.cache_key(server.get_args(dict(OPTIONS, nThreads=8, dataFolder='x'))))
+        self.assertNotEqual(key, server.cache_key(server.get_args(dict(OPTIONS, nSamples=100))))
+        self.assertNotEqual(key, server.cache_key(server.get_args(dict(OPTIONS, data=[1.0, 2.0]))))
+
+    def test_deduplication(self):
+        """Test that identical concurrent requests run once and the result is cached."""
+        release = threading.Event()
+        calls = []
+        def run_request(args):
+            calls.append(args.dataFolder)
+            release.wait(10)
+            js = {'folder': args.dataFolder}
+            os.makedirs(args.dataFolder)
+            with open(os.path.join(args.dataFolder, 'intervals.json'), 'w') as f:
+                json.dump(js, f)
+            return js
+
+        results = []
+        with mock.patch.object(server, 'run_request', run_request):
+            threads = [threading.Thread(target=lambda: results.append(self.service.intervals(OPTIONS)))
+                       for _ in range(4)]
+            for t in threads:
+                t.start()
+            while self.service.status()['running'] == 0:
+                time.sleep(0.01)
+            time.sleep(0.1)
+            release.set()
+            for t in threads:
+                t.join(10)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{'folder': calls[0]}] * 4)
+        status = self.service.status()
+        self.assertEqual((status['completed'], status['failed'], status['running']), (1, 0, 0))
+
+        cached = status['cached']
+        self.assertEqual(self.service.intervals(OPTIONS), {'folder': calls[0]})
+        self.assertEqual(self.service.status()['cached'], cached + 1)
+        self.assertEqual(len(calls), 1)
+
+    def test_done_before_callback(self):
+        """Test a request that completes before its callback is registered."""
+        future = concurrent.futures.Future()
+        future.set_result({'done': True})
+        with mock.patch.object(self.service.pool, 'submit', return_value=future):
+            self.assertEqual(self.service.intervals(OPTIONS), {'done': True})
+        self.assertEqual(self.service.status()['completed'], 1)
+
+    def test_error(self):
+        """Test that errors of a request are raised and the request can be retried."""
+        def run_request(args):
+            raise RuntimeError('failed')
+
+        with mock.patch.object(server, 'run_request', run_request):
+            with self.assertRaises(RuntimeError):
+                self.service.intervals(OPTIONS)
+        self.assertEqual(self.service.status(), {'cached': 0, 'completed': 0, 'failed': 1, 'running': 0})
+
+        with mock.patch.object(server, 'run_request', lambda args: {'ok': True}):
+            self.assertEqual(self.service.intervals(OPTIONS), {'ok': True})
@@ -0,0 +1,143 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+from common import TestCaseEx
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             '..', '..', 'applications', 'inference_cantons'))
+from data import Data
+from model import Model
+from ode import Seir, SeirCpp
+
+PARAMS_TO_INFER = ['R0', 'Z', 'D', 'nu', 'theta_b', 'tact', 'kbeta', 'beta_corr0', 'beta_corr1']
+
+def make_data():
+    data = Data()
+    n_regions = 4
+    data.time = np.arange(20.0)
+    data.total_infected = np.cumsum(np.ones((n_regions, 20)), axis=1)
+    data.population = np.array([100000.0, 200000.0, 50000.0, 80000.0])
+    data.name = ['AA', 'BB', 'CC', 'DD']
+    rng = np.random.RandomState(12345)
+    data.commute_matrix = rng.uniform(0, 1000, (n_regions, n_regions))
+    data.commute_airports = np.array([0.0, 5.0, 0.0, 1.0])
+    data.commute_borders = np.array([3.0, 0.0, 2.0, 4.0])
+    data.fit_importance = np.array([1.0, 2.0, 0.5, 1.0])
+    data.beta_corr_regions = {'beta_corr0': [0, 2], 'beta_corr1': [1, 2]}
+    return data
+
+
+class TestAppInferenceCantons(TestCaseEx):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _model(self, params_to_infer=PARAMS_TO_INFER, **kwargs):
+        return Model(make_data(), SeirCpp(), list(params_to_infer), observations=['infections'],
+                     lastDay='2020-06-13', dataFolder=self.tmp_dir, silent=True, **kwargs)
+
+    def _reference(self, model, p):
+        """The evaluation before the design block, constructing everything per call."""
+        m = model.data['Model']
+        t = m['x-data']
+        ode = SeirCpp()
+        params = dict(ode.params_fixed.items())
+        for i, name in enumerate(model.params_to_infer):
+            params[name] = p[i]
+        params['N'] = np.array(m['Population Size'])
+        params['C'] = np.array(m['Commute Matrix'])
+        params['Qa'] = np.array(m['Infected Commuters Airports'])
+        params['Qb'] = np.array(m['Infected Commuters Borders'])
+        params['beta_corr_regions'] = m['beta_corr_regions']
+
+        tt1 = [min(t) - 1] + list(t[0::model.n_regions])
+        _, _, Icum = ode.solve_S_I_Icum(params, [0, max(t)], m['Initial Condition'], tt1)
+        Idaily = list(np.diff(Icum, axis=1).T.flatten())
+        dispersion = np.ones(len(Idaily)) * p[-1]
+        for i in range(model.n_regions):
+            dispersion[i::model.n_regions] *= m['Fit Importance'][i]
+        return Idaily, list(dispersion)
+
+    def test_computational_model_unchanged(self):
+        """Test the design block against the per-evaluation construction."""
+        model = self._model()
+        for p in [[1.5, 2.0, 3.0, 0.7, 0.05, 8.0, 0.4, 0.1, -0.2, 2.0],
+                  [2.5, 1.0, 2.0, 0.3, 0.08, 12.0, 0.6, -0.3, 0.3, 0.5]]:
+            s = {'Parameters': p}
+            model.computational_model(s)
+            y, dispersion = self._reference(model, p)
+            np.testing.assert_array_equal(s['Reference Evaluations'], y)
+            np.testing.assert_array_equal(s['Dispersion'], dispersion)
+            self.assertGreater(max(y), 0.0)
+
+    def test_aggregation(self):
+        """Test observing groups of regions, aggregated inside the C++ solve."""
+        P = np.array([[1.0, 0.0, 1.0, 0.0],
+                      [0.0, 1.0, 0.0, 1.0]])
+        data = make_data()
+        data.total_infected = data.total_infected[:2]
+        data.fit_importance = data.fit_importance[:2]
+        data.name = ['AC', 'BD']
+        data.aggregation = P
+        model = Model(data, SeirCpp(), list(PARAMS_TO_INFER), observations=['infections'],
+                      lastDay='2020-06-13', dataFolder=self.tmp_dir, silent=True)
+        full = self._model()
+
+        p = [1.5, 2.0, 3.0, 0.7, 0.05, 8.0, 0.4, 0.1, -0.2, 2.0]
+        s = {'Parameters': p}
+        model.computational_model(s)
+        d = full.design
+        _, _, Icum = full.ode.solve_S_I_Icum(full.get_params(p), d.t_span, d.y0, d.t_eval)
+        expected = np.diff(P @ Icum, axis=1).T.flatten()
+        # Daily increments of Icum = N - S - E lose digits to cancellation.
+        np.testing.assert_allclose(s['Reference Evaluations'], expected, rtol=1e-6)
+        self.assertEqual(len(s['Dispersion']), len(expected))
+
+        s = {'Parameters': p}
+        model.computational_model_propagate(s)
+        self.assertEqual(s['Saved Results']['Number of Variables'], 2)
+
+    def test_gradient(self):
+        """Test the derivatives against finite differences, with overlapping beta_corr groups."""
+        params_to_infer = [name for name in PARAMS_TO_INFER if name != 'tact']
+        model = self._model(params_to_infer, sampler='mTMCMC')
+        p = np.array([1.5, 2.0, 3.0, 0.7, 0.05, 0.4, 0.1, -0.2, 2.0])
+        s = {'Parameters': list(p)}
+        model.computational_model(s)
+        grad = np.array(s['Gradient Mean'])
+        for k in range(len(p) - 1):
+            h = 1e-4 * max(1.0, abs(p[k]))
+            y = []
+            for sign in [1, -1]:
+                q = p.copy()
+                q[k] += sign * h
+                sq = {'Parameters': list(q)}
+                model.computational_model(sq)
+                y.append(np.array(sq['Reference Evaluations']))
+            fd = (y[0] - y[1]) / (2 * h)
+            np.testing.assert_allclose(grad[:, k], fd, rtol=1e-4, atol=1e-4 * np.abs(fd).max(),
+                                       err_msg=params_to_infer[k])
+        np.testing.assert_array_equal(grad[:, -1], 0)
+
+    def test_no_gradient_tact(self):
+        """Test that samplers with derivatives reject inferring `tact`."""
+        with self.assertRaises(ValueError):
+            self._model(sampler='mTMCMC')
+        model = self._model()
+        params = model.get_params([1.5, 2.0, 3.0, 0.7, 0.05, 8.0, 0.4, 0.1, -0.2, 2.0])
+        d = model.design
+        with self.assertRaises(ValueError):
+            model.ode.solve_S_I_Icum_grad(params, d.t_span, d.y0, d.t_eval, ['R0', 'tact'])
+
+    def test_no_gradient_ode(self):
+        """Test that samplers with derivatives reject an ode without derivatives."""
+        params_to_infer = [name for name in PARAMS_TO_INFER if name != 'tact']
+        with self.assertRaises(ValueError):
+            Model(make_data(), Seir(), params_to_infer, observations=['infections'],
+                  lastDay='2020-06-13', dataFolder=self.tmp_dir, silent=True, sampler='HMC')
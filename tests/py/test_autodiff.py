@@ -119,3 +119,86 @@ class TestAutoDiff(TestCaseEx):
                 compare(static.Ir(k), custom[2, k], custom_der[2, k])
                 compare(static.Iu(k), custom[3, k], custom_der[3, k])
                 compare(static.N(k),  custom[4, k], custom_der[4, k])
+
+    def test_custom_derivatives_arguments(self):
+        """Test NumPy inputs and the validation of derivative matrices."""
+        import numpy as np
+        dp = libepidemics.country.DesignParameters(N=1000)
+        solver = sir.Solver(dp)
+        params = sir.Parameters(beta=0.3, gamma=0.1)
+        y0 = sir.State((990, 10, 0))
+        out, out_der = country_custom_derivatives(
+                solver, params, y0, np.eye(2, 5), np.eye(3, 5, k=2), t_eval=[0., 1., 2.])
+        self.assertEqual(out.shape, (3, 3))
+        self.assertEqual(out_der.shape, (3, 3, 5))
+        np.testing.assert_array_equal(out_der[0], np.eye(3, 5, k=2))
+
+        with self.assertRaises(TypeError):
+            country_custom_derivatives(solver, params, y0, np.eye(2, 5), np.eye(3, 4), [0., 1.])
+        with self.assertRaises(TypeError):
+            country_custom_derivatives(solver, params, y0, np.eye(3, 5), np.eye(3, 5), [0., 1.])
+
+
+class TestADPool(TestCaseEx):
+    """Test the DynamicAD block pools through the country solver."""
+    N = 5
+
+    def _solve(self):
+        import numpy as np
+        solver = sir.Solver(libepidemics.country.DesignParameters(N=1000))
+        params = sir.Parameters(beta=0.3, gamma=0.1)
+        y0 = sir.State((990, 10, 0))
+        return country_custom_derivatives(
+                solver, params, y0, np.eye(2, self.N), np.eye(3, self.N, k=2),
+                t_eval=[0., 1., 5., 10.], dt=0.1)
+
+    def _run(self):
+        """Solve and compute with DynamicAD values in nested pool scopes.
+
+        Returns the solutions, the values and derivatives of the DynamicAD
+        values, and the number of live blocks of the pool at each stage.
+        """
+        AD = sir.DynamicAD
+        live = lambda: (libepidemics._ad_pool_num_live(self.N),
+                        libepidemics._ad_pool_num_live(2))
+        solutions = [self._solve()]
+        stages = [live()]
+        with libepidemics._ADPoolScope(self.N):
+            a = AD(1.5, [1., 0., 2., 0., -1.])
+            with libepidemics._ADPoolScope(2):
+                b = AD(0.5, [0.25, -1.])
+                c = AD(0.7, [0., 1., 0., 3., 0.])  # Not from the inner pool.
+                stages.append(live())
+                solutions.append(self._solve())
+                d = a * c - 2.0 / a  # Not from the inner pool.
+                stages.append(live())
+            solutions.append(self._solve())
+            e = (b * b + 1.0) / b  # Not from the outer pool.
+            f = d / c + a
+            stages.append(live())
+        # Values from the pools outlive the scopes, mixed with heap values.
+        g = f * a - c
+        solutions.append(self._solve())
+        stages.append(live())
+        values = [(x.val(), x.d()) for x in (a, b, c, d, e, f, g)]
+        return solutions, values, stages
+
+    def test_pool(self):
+        """Test that the pools give bitwise the same results as the heap."""
+        import numpy as np
+        previous = libepidemics._set_ad_pool_enabled(False)
+        try:
+            expected, expected_values, stages = self._run()
+        finally:
+            libepidemics._set_ad_pool_enabled(previous)
+        self.assertEqual(stages, [(0, 0)] * 5)
+
+        for repeat in range(3):
+            solutions, values, stages = self._run()
+            self.assertEqual(stages, [(0, 0), (1, 1), (1, 1), (2, 1), (2, 1)])
+            self.assertEqual(values, expected_values)
+            for (y, dy), (y_exp, dy_exp) in zip(solutions, expected):
+                np.testing.assert_array_equal(y, y_exp)
+                np.testing.assert_array_equal(dy, dy_exp)
+            self.assertEqual(libepidemics._ad_pool_num_live(self.N), 0)
+            self.assertEqual(libepidemics._ad_pool_num_live(2), 0)
@@ -0,0 +1,49 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from epidemics.utils.cache import cache_to_file, load_df_npz, save_df_npz
+
+class TestCacheToFile(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_df_npz_roundtrip(self):
+        """Test that .df.npz files preserve values and narrow dtypes."""
+        df = pd.DataFrame({
+            'key': ['MUN-0001', 'MUN-0002', 'MUN-0001'],
+            'num_people': np.array([147, 106, 3], dtype=np.int64),
+            'value': [0.5, 1.5, np.nan],
+        })
+        path = os.path.join(self.tmp_dir, 'test.df.npz')
+        save_df_npz(df, path)
+        loaded = load_df_npz(path)
+
+        self.assertEqual(list(loaded.columns), ['key', 'num_people', 'value'])
+        self.assertIsInstance(loaded['key'].dtype, pd.CategoricalDtype)
+        self.assertEqual(list(loaded['key']), list(df['key']))
+        self.assertEqual(loaded['num_people'].dtype, np.int32)
+        self.assertEqual(list(loaded['num_people']), [147, 106, 3])
+        np.testing.assert_array_equal(loaded['value'], df['value'])
+
+    def test_cache_to_file_df_npz(self):
+        """Test that the decorated function is evaluated only once."""
+        calls = []
+
+        @cache_to_file(os.path.join(self.tmp_dir, 'func.df.npz'))
+        def func():
+            calls.append(1)
+            return pd.DataFrame({'a': ['x', 'y'], 'b': [1, 2]})
+
+        first = func()
+        second = func()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(list(first['a']), list(second['a']))
+        self.assertEqual(list(first['b']), list(second['b']))
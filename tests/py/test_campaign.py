@@ -0,0 +1,111 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import textwrap
+import unittest
+
+from epidemics.campaign import Campaign, Task, expand_jobs, run_tasks
+
+# Mimics sample_knested.py, stores the number of threads in evidence.json.
+SCRIPT = textwrap.dedent("""
+    import argparse, json, os
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-cm')
+    parser.add_argument('-c')
+    parser.add_argument('-df')
+    parser.add_argument('-nt', type=int)
+    parser.add_argument('-bs')
+    parser.add_argument('-m')
+    parser.add_argument('-ld')
+    parser.add_argument('--fail', action='store_true')
+    args = parser.parse_args()
+    if args.fail:
+        raise SystemExit(1)
+    folder = os.path.join(args.df, args.c, args.cm)
+    os.makedirs(os.path.join(folder, '_korali_samples'))
+    with open(os.path.join(folder, 'evidence.json'), 'w') as f:
+        json.dump({'nThreads': args.nt}, f)
+""")
+
+
+class TestCampaign(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        script = os.path.join(self.tmp_dir, 'script.py')
+        with open(script, 'w') as f:
+            f.write(SCRIPT)
+        self.spec = {
+            'base': os.path.join(self.tmp_dir, 'data'),
+            'script': script,
+            'models': ['A', 'B'],
+            'countries': ['x', 'y'],
+            'lastDays': ['2020-05-01', '2020-06-01'],
+            'nThreads': {'A': 2, 'default': 1},
+            'plot': False,
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _run(self, **kwargs):
+        return Campaign(self.spec, cores=3, pollInterval=0.01, **kwargs).run()
+
+    def test_jobs(self):
+        """Test the expansion of the sweep into jobs."""
+        jobs = expand_jobs(self.spec)
+        self.assertEqual(len(jobs), 8)
+        self.assertEqual(sorted(set(job.nThreads for job in jobs)), [1, 2])
+        self.assertEqual(len(set(job.folder for job in jobs)), 8)
+        for job in jobs:
+            self.assertEqual(job.folder, os.path.join(
+                    self.spec['base'], job.lastDay, job.country, job.model))
+
+    def test_run_and_resume(self):
+        """Test running, skipping up-to-date jobs and rerunning interrupted jobs."""
+        self.assertEqual(self._run(), 0)
+        jobs = expand_jobs(self.spec)
+        with open(os.path.join(self.spec['base'], 'campaign.json')) as f:
+            state = json.load(f)
+        for job in jobs:
+            self.assertEqual(state[job.name]['status'], 'done')
+            self.assertGreater(state[job.name]['wallTime'], 0.0)
+            with open(os.path.join(job.folder, 'evidence.json')) as f:
+                self.assertEqual(json.load(f)['nThreads'], job.nThreads)
+            self.assertFalse(os.path.exists(os.path.join(job.folder, '_korali_samples')))
+
+        campaign = Campaign(self.spec, cores=3)
+        self.assertEqual(campaign.pending(), [])
+
+        # Mark one job as interrupted and remove the output of another.
+        campaign.state[jobs[0].name]['status'] = 'running'
+        campaign._save_state()
+        os.remove(os.path.join(jobs[1].folder, 'evidence.json'))
+        self.assertEqual([job.name for job in Campaign(self.spec).pending()],
+                         [jobs[0].name, jobs[1].name])
+
+        # Changing the command invalidates all jobs.
+        self.spec['args'] = ['--fail']
+        self.assertEqual(self._run(), 8)
+        with open(os.path.join(self.spec['base'], 'campaign.json')) as f:
+            state = json.load(f)
+        self.assertEqual(set(s['status'] for s in state.values()), {'failed'})
+
+    def test_run_tasks(self):
+        """Test the packing of tasks onto the cores and the niceness."""
+        script = "import os, sys, time; t = time.time(); time.sleep(0.2); print(t, time.time(), os.nice(0))"
+        tasks = [Task(str(i), [[sys.executable, '-c', script]], nThreads=2,
+                      log=os.path.join(self.tmp_dir, 'logs', f'{i}.out'), nice=5 * (i == 0))
+                 for i in range(4)]
+        returncodes = run_tasks(tasks + [Task('fail', [[sys.executable, '-c', 'exit(3)']])],
+                                cores=4, pollInterval=0.01)
+        self.assertEqual(returncodes, {'0': 0, '1': 0, '2': 0, '3': 0, 'fail': 3})
+
+        runs = []
+        for i in range(4):
+            with open(os.path.join(self.tmp_dir, 'logs', f'{i}.out')) as f:
+                runs.append([float(x) for x in f.read().split()])
+        self.assertEqual(runs[0][2], runs[1][2] + 5)
+        for start, _, _ in runs:
+            self.assertLessEqual(sum(s <= start < e for s, e, _ in runs), 2)
@@ -0,0 +1,71 @@
+import unittest
+
+import numpy as np
+
+from common import TestCaseEx
+
+import libepidemics
+import libepidemics.cantons.seiin as seiin
+
+try:
+    import torch
+    from epidemics.cantons.py.solver import BatchSolver
+except ImportError:
+    torch = None
+
+
+@unittest.skipIf(torch is None, "PyTorch not available.")
+class TestCantonsBatchSolver(TestCaseEx):
+    def setUp(self):
+        K = 4
+        np.random.seed(12345)
+        # Symmetric nonzero pattern, see the note about `nonzero_Mij` in seiin.h.
+        mask = np.random.rand(K, K) < 0.6
+        Mij = 100 * np.random.rand(K, K) * (mask | mask.T)
+        np.fill_diagonal(Mij, 0.0)
+        self.K = K
+        self.Mij = Mij
+        self.dp = libepidemics.cantons.DesignParameters(
+                ["C" + str(k) for k in range(K)], np.full(K, 1e5), Mij,
+                np.zeros((K, K)), np.zeros((0, K)), np.zeros(K))
+        N0 = 1e5 + 1e4 * np.random.rand(K)
+        Ir0 = np.random.rand(K) * 10
+        self.y0 = np.concatenate((N0 - Ir0, np.zeros(K), Ir0, np.zeros(K), N0))
+        # beta, mu, alpha, Z, D, theta
+        self.params = np.array([
+            [1.12, 0.5, 0.3, 3.69, 3.47, 1.36],
+            [0.80, 0.2, 0.7, 2.00, 4.00, 0.50],
+            [1.50, 0.0, 1.0, 5.00, 2.00, 2.00],
+        ])
+
+    def test_solve(self):
+        """Test the batched solver against the C++ solver, parameter set by parameter set."""
+        num_days = 5
+        solver = BatchSolver(torch.tensor(self.Mij).to_sparse(), iterations_per_day=20)
+        out = solver.solve(torch.tensor(self.y0), torch.tensor(self.params), num_days)
+        self.assertEqual(tuple(out.shape), (num_days + 1, len(self.params), 5 * self.K))
+
+        cpp_solver = seiin.Solver(self.dp)
+        for b, p in enumerate(self.params):
+            states = cpp_solver.solve(seiin.Parameters(*p), seiin.State(self.y0.tolist()),
+                                      list(range(num_days + 1)), dt=0.01)
+            expected = np.array([state.tolist() for state in states])
+            np.testing.assert_allclose(out[:, b, :].numpy(), expected, rtol=1e-7)
+
+    def test_gradients(self):
+        """Test autograd derivatives against the C++ forward-mode autodiff."""
+        num_days = 3
+        solver = BatchSolver(torch.tensor(self.Mij), iterations_per_day=20)
+        params = torch.tensor(self.params, requires_grad=True)
+        out = solver.solve(torch.tensor(self.y0), params, num_days)
+        # Total number of documented infected on the last day, per parameter set.
+        out[-1, :, 2 * self.K : 3 * self.K].sum().backward()
+
+        cpp_solver = seiin.Solver(self.dp)
+        for b, p in enumerate(self.params):
+            states = cpp_solver.solve_params_ad(
+                    seiin.Parameters(*p), seiin.State(self.y0.tolist()),
+                    list(range(num_days + 1)), dt=0.01)
+            Ir = states[-1].Ir()
+            expected = [sum(Ir[k].d(i) for k in range(self.K)) for i in range(6)]
+            np.testing.assert_allclose(params.grad[b].numpy(), expected, rtol=1e-5)
@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import scipy.sparse
+
+from common import TestCaseEx
+
+import libepidemics
+from epidemics.cantons.py.model import PyDesignParameters, ReferenceData
+import epidemics.utils.binary as binary
+
+class TestCantonsBinaryIO(TestCaseEx):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _design_parameters(self, sparse):
+        np.random.seed(12345)
+        K = 5
+        keys = ['R' + str(k) for k in range(K)]
+        Mij = np.random.rand(K, K) * (np.random.rand(K, K) < 0.5)
+        np.fill_diagonal(Mij, 0.0)
+        Cij = np.random.rand(K, K) * (np.random.rand(K, K) < 0.5)
+        if sparse:
+            Mij = scipy.sparse.csr_matrix(Mij)
+            Cij = scipy.sparse.csr_matrix(Cij)
+        return PyDesignParameters(keys, 1e5 * np.random.rand(K) + 1e5, Mij, Cij,
+                                  ext_com_Iu=np.random.rand(3, K), Ui=np.random.rand(K))
+
+    def test_arrays(self):
+        """Test the roundtrip of the generic binary container."""
+        path = os.path.join(self.tmp_dir, 'arrays.bin')
+        arrays = {
+            'a': np.arange(5, dtype=np.float64),
+            'b': np.arange(3, dtype=np.int32),
+            'c': np.arange(7, dtype=np.int64),
+            'd': np.frombuffer(b'xyz', dtype=np.uint8),
+        }
+        binary.save_arrays(path, 'test', arrays)
+        self.assertTrue(binary.is_binary_file(path))
+        loaded = binary.load_arrays(path, 'test')
+        self.assertEqual(list(loaded), list(arrays))
+        for name, a in arrays.items():
+            self.assertEqual(loaded[name].dtype, a.dtype)
+            np.testing.assert_array_equal(loaded[name], a)
+            self.assertFalse(loaded[name].flags.writeable)
+            self.assertEqual(loaded[name].ctypes.data % 8, 0)
+
+        with self.assertRaises(ValueError):
+            binary.load_arrays(path, 'other')
+        with self.assertRaises(TypeError):
+            binary.save_arrays(path, 'test', {'x': np.zeros(3, dtype=np.float32)})
+
+    def test_design_parameters(self):
+        """Test that Python and C++ readers reproduce the stored design parameters."""
+        for sparse in [False, True]:
+            dp = self._design_parameters(sparse)
+            path = os.path.join(self.tmp_dir, 'design.dat')
+            dp.save_cpp_dat(path)
+
+            loaded = PyDesignParameters.load_cpp_dat(path)
+            self.assertEqual(loaded.region_keys, dp.region_keys)
+            self.assertEqual(scipy.sparse.issparse(loaded.Mij), sparse)
+            for a, b in [(loaded.Mij, dp.Mij), (loaded.Cij, dp.Cij)]:
+                np.testing.assert_array_equal(
+                        a.toarray() if sparse else a, b.toarray() if sparse else b)
+
+            cpp = libepidemics.cantons.read_design_parameters(path)
+            expected = dp.to_cpp()
+            self.assertEqual(cpp.region_keys, expected.region_keys)
+            self.assertEqual(cpp.num_regions, expected.num_regions)
+            for attr in ['Ni', 'Mij', 'Cij', 'Ui', 'ext_com_iu']:
+                np.testing.assert_array_equal(getattr(cpp, attr), getattr(expected, attr))
+
+    def test_reference_data(self):
+        """Test that Python and C++ readers reproduce the stored reference data."""
+        rd = ReferenceData(['A', 'B'], {'A': [1., np.nan, 3.], 'B': [np.nan, 5.]})
+        path = os.path.join(self.tmp_dir, 'reference.dat')
+        rd.save_cpp_dat(path)
+
+        loaded = ReferenceData.load_cpp_dat(path)
+        self.assertEqual(loaded.region_keys, ['A', 'B'])
+        self.assertEqual(sorted(loaded.cases_data_points), sorted(rd.cases_data_points))
+
+        cpp = libepidemics.cantons.read_reference_data(path)
+        np.testing.assert_array_equal(cpp.cases, rd.cases)
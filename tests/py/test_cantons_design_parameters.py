@@ -0,0 +1,47 @@
+import numpy as np
+
+from common import TestCaseEx, flatten
+
+import libepidemics
+
+class TestCantonsDesignParameters(TestCaseEx):
+    def test_numpy_constructor(self):
+        """Test that NumPy arrays and lists give the same DesignParameters."""
+        np.random.seed(12345)
+        K = 4
+        days = 3
+        keys = ["C" + str(k) for k in range(K)]
+        Ni = 1e6 + 1e6 * np.random.rand(K)
+        Mij = 1000 * np.random.rand(K, K)
+        Cij = 1000 * np.random.rand(K, K)
+        ext_com_iu = 100 * np.random.rand(days, K)
+        Ui = np.random.rand(K)
+
+        dp_list = libepidemics.cantons.DesignParameters(
+                keys, Ni.tolist(), flatten(Mij), flatten(Cij),
+                flatten(ext_com_iu), Ui.tolist())
+        dp_numpy = libepidemics.cantons.DesignParameters(
+                keys, Ni, Mij, Cij, ext_com_iu, Ui)
+
+        self.assertEqual(dp_numpy.num_regions, K)
+        self.assertEqual(dp_numpy.region_keys, keys)
+        np.testing.assert_array_equal(dp_numpy.Mij, dp_list.Mij)
+        np.testing.assert_array_equal(dp_numpy.Mij, Mij.ravel())
+        np.testing.assert_array_equal(dp_numpy.Cij, Cij.ravel())
+        np.testing.assert_array_equal(dp_numpy.Ni, Ni)
+        np.testing.assert_array_equal(dp_numpy.Ui, Ui)
+        self.assertFalse(dp_numpy.Mij.flags.writeable)
+
+        with self.assertRaises(ValueError):
+            libepidemics.cantons.DesignParameters(
+                    keys, Ni, Mij[:-1], Cij, ext_com_iu, Ui)
+
+    def test_reference_data(self):
+        """Test the structured array constructor of ReferenceData."""
+        cases = np.zeros(3, dtype=libepidemics.cantons.DATA_POINT_DTYPE)
+        cases['day'] = [0, 1, 5]
+        cases['region'] = [2, 0, 1]
+        cases['value'] = [10., 20., 30.]
+        rd = libepidemics.cantons.ReferenceData(cases)
+        np.testing.assert_array_equal(rd.cases, cases)
+        np.testing.assert_array_equal(rd.get_reference_data(), [10., 20., 30.])
@@ -0,0 +1,85 @@
+import unittest
+
+import numpy as np
+
+from epidemics.cantons.py.model import PyDesignParameters, build_commute_matrix, \
+        build_membership_matrix, aggregate_design_parameters
+
+class TestCantonsNetwork(unittest.TestCase):
+    def test_build_commute_matrix(self):
+        """Test the sparse builder against the dense per-record loop."""
+        np.random.seed(12345)
+        N = 50
+        M = 1000
+        keys = ['MUN-{:04}'.format(k) for k in range(N)]
+        # Include some unknown keys, which must be ignored.
+        key_home = ['MUN-{:04}'.format(k) for k in np.random.randint(0, N + 5, M)]
+        key_work = ['MUN-{:04}'.format(k) for k in np.random.randint(0, N + 5, M)]
+        num_people = np.random.randint(1, 100, M)
+
+        Cij = build_commute_matrix(keys, key_home, key_work, num_people)
+
+        key_to_index = {key: k for k, key in enumerate(keys)}
+        expected = np.zeros((N, N))
+        for home, work, n in zip(key_home, key_work, num_people):
+            if home in key_to_index and work in key_to_index:
+                expected[key_to_index[work], key_to_index[home]] += n
+
+        self.assertEqual(Cij.format, 'csr')
+        np.testing.assert_array_equal(Cij.toarray(), expected)
+
+    def test_aggregate_design_parameters(self):
+        """Test aggregation of municipality-level data to cantons."""
+        keys = ['M0', 'M1', 'M2', 'M3']
+        groups = {'M0': 'A', 'M1': 'B', 'M2': 'A', 'M3': 'B'}
+        group_keys, P = build_membership_matrix(keys, groups)
+        self.assertEqual(group_keys, ['A', 'B'])
+        np.testing.assert_array_equal(P.toarray(), [[1, 0, 1, 0], [0, 1, 0, 1]])
+
+        Cij = build_commute_matrix(keys, ['M0', 'M1', 'M2', 'M2'],
+                                   ['M1', 'M0', 'M0', 'M3'], [10, 20, 30, 40])
+        Mij = Cij + Cij.transpose()
+        dp = PyDesignParameters(keys, [100, 200, 300, 400], Mij, Cij,
+                                ext_com_Iu=[[1, 2, 3, 4]])
+        agg = aggregate_design_parameters(dp, group_keys, P)
+
+        self.assertEqual(agg.region_keys, ['A', 'B'])
+        self.assertEqual(list(agg.region_population), [400, 600])
+        # M0->M1 (10) and M2->M3 (40) are A->B, M1->M0 (20) is B->A, M2->M0 is within A.
+        np.testing.assert_array_equal(agg.Cij.toarray(), [[0, 20], [50, 0]])
+        np.testing.assert_array_equal(agg.Mij.toarray(), [[0, 70], [70, 0]])
+        np.testing.assert_array_equal(agg.ext_com_Iu[0], [4, 6])
+
+    def test_solve_aggregated(self):
+        """Test that the C++ aggregated solve matches aggregating full states."""
+        import libepidemics
+        import libepidemics.cantons.seiin as seiin
+        from epidemics.cantons.py.model import make_cpp_aggregation
+
+        np.random.seed(12345)
+        N = 12
+        keys = ['M' + str(k) for k in range(N)]
+        groups = {key: 'ABC'[k % 3] for k, key in enumerate(keys)}
+        group_keys, P = build_membership_matrix(keys, groups)
+        agg = make_cpp_aggregation(P)
+        self.assertEqual((agg.num_groups, agg.num_regions), (3, N))
+
+        Mij = 100 * np.random.rand(N, N)
+        Mij = Mij + Mij.T
+        np.fill_diagonal(Mij, 0.0)
+        dp = PyDesignParameters(keys, 1e4 + 1e4 * np.random.rand(N), Mij, np.zeros((N, N)))
+        solver = seiin.Solver(dp.to_cpp())
+        params = seiin.Parameters(beta=1.1, mu=0.5, alpha=0.3, Z=3.7, D=3.5, theta=1.3)
+        Ir0 = np.random.rand(N)
+        y0 = seiin.State(np.concatenate((dp.region_population - Ir0, np.zeros(N), Ir0,
+                                         np.zeros(N), dp.region_population)).tolist())
+        t_eval = [0., 1., 2., 5.]
+
+        vars = [2, 3]  # Ir, Iu
+        out = solver.solve_aggregated(params, y0, t_eval, agg, vars)
+        self.assertEqual(out.shape, (len(vars), 3, len(t_eval)))
+
+        full = solver.solve_array(params, y0, t_eval)
+        expected = np.einsum('gi,vit->vgt', P.toarray(), full[vars])
+        np.testing.assert_allclose(out, expected, rtol=1e-12)
+        np.testing.assert_allclose(agg(full[2, :, -1]), expected[0, :, -1], rtol=1e-12)
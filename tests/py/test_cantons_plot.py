@@ -0,0 +1,75 @@
+import io
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from epidemics.cantons.data.swiss_cantons import CODE_TO_NAME
+from epidemics.cantons.py.model import PyDesignParameters
+import epidemics.cantons.py.plot as plot
+
+class FakeFFmpeg:
+    """Stands in for the ffmpeg process of `Renderer.save_movie`."""
+    def __init__(self, cmd, stdin):
+        self.cmd = cmd
+        self.stdin = io.BytesIO()
+        self.stdin.close = lambda: None
+        self.returncode = 0
+        FakeFFmpeg.last = self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+def frame_callback(rend):
+    codes = list(rend.get_codes())
+    frame = rend.get_frame()
+    rend.set_values({c: (i + frame) % 4 / 3 for i, c in enumerate(codes)})
+    rend.set_texts({c: str(frame) for c in codes})
+
+
+class TestCantonsPlot(unittest.TestCase):
+    def setUp(self):
+        keys = list(CODE_TO_NAME)
+        K = len(keys)
+        Mij = np.random.RandomState(12345).uniform(0, 100, (K, K))
+        self.dp = PyDesignParameters(keys, np.full(K, 1000.0), Mij, Mij.T.copy())
+
+    def _render(self, frames, jobs):
+        rend = plot.Renderer(frame_callback, self.dp, resolution=(160, 120))
+        with mock.patch.object(plot.subprocess, 'Popen', FakeFFmpeg):
+            rend.save_movie(frames=frames, filename='unused.mp4', jobs=jobs)
+        width, height = rend.fig.canvas.get_width_height()
+        data = FakeFFmpeg.last.stdin.getvalue()
+        self.assertIn('{:}x{:}'.format(width, height), FakeFFmpeg.last.cmd)
+        self.assertEqual(len(data), frames * width * height * 4)
+        return np.frombuffer(data, dtype=np.uint8).reshape(frames, height, width, 4)
+
+    def test_save_movie(self):
+        """Test the blitted frames, rendered serially and by worker processes."""
+        images = self._render(4, jobs=1)
+        for k in range(1, 4):
+            self.assertFalse(np.array_equal(images[0], images[k]))
+        # Frame 4 repeats the colors of frame 0, only the text differs.
+        np.testing.assert_array_equal(self._render(4, jobs=2), images)
+
+    def test_blit_matches_full_draw(self):
+        """Test that a blitted frame matches the frame drawn from scratch."""
+        rend = plot.Renderer(frame_callback, self.dp, resolution=(160, 120))
+        rend.max_frame = 2
+        rend.init_blit()
+        rend.render_frame(0)
+        blitted = np.frombuffer(rend.render_frame(2), dtype=np.uint8)
+
+        rend = plot.Renderer(frame_callback, self.dp, resolution=(160, 120))
+        rend.max_frame = 2
+        rend.init_plot()
+        rend.update_plot(2, silent=True)
+        rend.fig.canvas.draw()
+        full = np.frombuffer(bytes(rend.fig.canvas.buffer_rgba()), dtype=np.uint8)
+        # Equal up to antialiasing at the edges of the animated artists.
+        diff = np.abs(blitted.astype(int) - full.astype(int))
+        self.assertLess(np.mean(diff > 10), 0.01)
@@ -1,5 +1,8 @@
+import numpy as np
+
 from common import TestCaseEx, gen_canton_design_parameters
 
+import libepidemics
 import libepidemics.cantons.sei_c as sei_c
 
 # TODO: Compare with a Python implementation.
@@ -25,3 +28,93 @@ class TestCantonsSEI_C(TestCaseEx):
                 self.assertRelative(noad.S(k), ad.S(k).val(), tolerance=1e-12)
                 self.assertRelative(noad.E(k), ad.E(k).val(), tolerance=1e-12)
                 self.assertRelative(noad.I(k), ad.I(k).val(), tolerance=1e-12)
+
+    def test_setters(self):
+        """Test that updating the source terms and Ui of an existing solver
+        is equivalent to creating a new solver."""
+        K = 3
+        days = 10
+        dp = gen_canton_design_parameters(K=K, days=days)
+        np.random.seed(54321)
+        ext_com_iu = 100 * np.random.rand(days, K)
+        Ui = np.random.rand(K)
+
+        solver = sei_c.Solver(dp)
+        solver.set_ext_com_iu(ext_com_iu)
+        solver.set_Ui(Ui)
+        fresh = sei_c.Solver(libepidemics.cantons.DesignParameters(
+                dp.region_keys, dp.Ni, dp.Mij, dp.Cij, ext_com_iu, Ui))
+
+        params = sei_c.Parameters(beta=0.3, nu=0.7, Z=0.03, D=4.0, tact=5.0, kbeta=0.789)
+        y0 = sei_c.State((10, 11, 12, 1, 2, 3, 5, 6, 7))
+        t_eval = [1., 2., 3., 4., 5., 6., 7.]
+        for a, b in zip(solver.solve(params, y0, t_eval), fresh.solve(params, y0, t_eval)):
+            self.assertEqual(a.tolist(), b.tolist())
+
+        with self.assertRaises(ValueError):
+            solver.set_Ui(np.zeros(K + 1))
+
+    def test_dense_output(self):
+        """Test that dense output matches the solution at the requested times."""
+        K = 3
+        dp = gen_canton_design_parameters(K=K, days=10)
+        solver = sei_c.Solver(dp)
+        params = sei_c.Parameters(beta=0.3, nu=0.7, Z=3.0, D=4.0, tact=5.0, kbeta=0.789)
+        y0 = sei_c.State((10, 11, 12, 1, 2, 3, 5, 6, 7))
+        t_eval = [0., 0.25, 1., 1.37, 2.5, 4., 4.01]
+
+        # The right-hand side is discontinuous at integer times (daily
+        # external cases), so the convergence is only of first order.
+        exact = solver.solve_array(params, y0, t_eval, dt=1e-4)
+        dense = solver.solve_array(params, y0, t_eval, dt=0.1, dense_output=True)
+        self.assertEqual(exact.shape, (3, K, len(t_eval)))
+        self.assertEqual(dense.shape, (3, K, len(t_eval)))
+        np.testing.assert_allclose(dense, exact, rtol=1e-4)
+
+        # The array layout matches the list of states.
+        states = solver.solve(params, y0, t_eval, dt=0.1, dense_output=True)
+        for k, state in enumerate(states):
+            np.testing.assert_array_equal(dense[:, :, k].ravel(), state.tolist())
+
+    def test_design_derivatives(self):
+        """Test the derivatives wrt Ui and the external commuters against finite differences."""
+        from epidemics.utils.autodiff import cantons_custom_derivatives
+
+        K = 3
+        days = 10
+        dp = gen_canton_design_parameters(K=K, days=days)
+        np.random.seed(54321)
+        ext_com_iu = np.random.rand(days, K)
+        Ui = 0.1 * np.random.rand(K)
+        params = [0.3, 0.7, 3.0, 4.0, 5.0, 0.789]
+        y0 = sei_c.State((10, 11, 12, 1, 2, 3, 5, 6, 7))
+        t_eval = [0., 1., 2.5, 4.]
+
+        # Derivatives wrt Ui[1] and a scaling factor of ext_com_iu.
+        Ui_der = np.zeros((K, 2))
+        Ui_der[1, 0] = 1
+        ext_der = np.zeros((days, K, 2))
+        ext_der[:, :, 1] = ext_com_iu
+
+        def solve(dUi, s):
+            solver = sei_c.Solver(dp)
+            solver.set_Ui(Ui + dUi * Ui_der[:, 0])
+            solver.set_ext_com_iu((1 + s) * ext_com_iu)
+            return solver, solver.solve_array(sei_c.Parameters(*params), y0, t_eval)
+
+        solver, y = solve(0, 0)
+        solver.set_design_derivatives(Ui_der, ext_der)
+        ad, ad_der = cantons_custom_derivatives(
+                solver, params, y0, np.zeros((6, 2)).tolist(),
+                np.zeros((3 * K, 2)).tolist(), t_eval)
+        np.testing.assert_allclose(ad.transpose(1, 2, 0), y, rtol=1e-12)
+
+        eps = 1e-4
+        fd_Ui = (solve(eps, 0)[1] - solve(-eps, 0)[1]) / (2 * eps)
+        fd_ext = (solve(0, eps)[1] - solve(0, -eps)[1]) / (2 * eps)
+        der = ad_der.transpose(1, 2, 0, 3)
+        np.testing.assert_allclose(der[..., 0], fd_Ui, rtol=1e-4, atol=1e-12)
+        np.testing.assert_allclose(der[..., 1], fd_ext, rtol=1e-4, atol=1e-12)
+
+        with self.assertRaises(ValueError):
+            solver.set_design_derivatives(np.zeros((K + 1, 2)), ext_der)
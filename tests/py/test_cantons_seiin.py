@@ -95,3 +95,46 @@ class TestCantonsSEIIN(TestCaseEx):
                 self.assertRelative(noad.Ir(k), py[2 * K + k], tolerance=1e-7)
                 self.assertRelative(noad.Iu(k), py[3 * K + k], tolerance=1e-7)
                 self.assertRelative(noad.N(k),  py[4 * K + k], tolerance=1e-7)
+
+    def test_adjoint(self):
+        """Test the adjoint gradient against forward-mode autodiff."""
+        from epidemics.utils.autodiff import cantons_custom_derivatives
+
+        K = 3
+        dp = gen_canton_design_parameters(K=K, days=0)
+        solver = seiin.Solver(dp)
+        params = seiin.Parameters(beta=0.3, mu=0.7, alpha=0.03, Z=4.0, D=5.0, theta=0.789)
+        y0 = seiin.State([1.0e6, 0.9e6, 0.8e6, 1, 2, 3, 5, 6, 7, 0, 1, 2, 3000000, 2000000, 1000000])
+        t_eval = [0., 0.3, 0.6, 1., 2.55, 4.]
+
+        # Linear loss L = sum(w * y), such that dL/dy = w.
+        np.random.seed(1234)
+        w = np.random.rand(5, K, len(t_eval))
+        dparams, dy0 = solver.solve_adjoint(params, y0, t_eval, w, dt=0.1)
+        self.assertEqual(dparams.shape, (6,))
+        self.assertEqual(dy0.shape, (5, K))
+
+        states = solver.solve_params_ad(params, y0, t_eval, dt=0.1)
+        expected = np.zeros(6)
+        for t, state in enumerate(states):
+            for v in range(5):
+                for k in range(K):
+                    expected += w[v, k, t] * np.array(state(v * K + k).d())
+        np.testing.assert_allclose(dparams, expected, rtol=1e-9)
+
+        y0_der = np.eye(5 * K).tolist()
+        params_der = np.zeros((6, 5 * K)).tolist()
+        _, der = cantons_custom_derivatives(
+                solver, params, y0, params_der, y0_der, t_eval, dt=0.1)
+        # der: [day, var, canton, derivative]
+        expected = np.einsum('vkt,tvkd->d', w, der).reshape(5, K)
+        np.testing.assert_allclose(dy0, expected, rtol=1e-9, atol=1e-12)
+
+        # Checkpointing does not affect the result.
+        for steps in [1, 7, 1000]:
+            dp_, dy0_ = solver.solve_adjoint(params, y0, t_eval, w, dt=0.1, checkpoint_steps=steps)
+            np.testing.assert_array_equal(dp_, dparams)
+            np.testing.assert_array_equal(dy0_, dy0)
+
+        with self.assertRaises(ValueError):
+            solver.solve_adjoint(params, y0, t_eval, w[:, :, 1:])
@@ -0,0 +1,122 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+import numpy as np
+import scipy.optimize
+
+from common import TestCaseEx
+
+from epidemics.country.reparam.seiir_int.nbin import Model
+
+PARAMS = [2.5, 5.0, 3.0, 0.5, 0.6, 20.0, 10.0, 0.4, 20.0]
+N = 1000000
+
+class TestCountryLeastSquares(TestCaseEx):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_file = os.path.join(self.tmp_dir, 'data.txt')
+        self._write_data(100 * np.exp(0.1 * np.arange(50)))
+        model = self._model()
+        sol = model.solve_ode(y0=model.data['Model']['Initial Condition'], T=49,
+                              t_eval=list(range(50)), N=N, p=PARAMS)
+        self._write_data(np.maximum.accumulate(np.round(sol.y - sol.y[0] + 100)))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_data(self, infected):
+        """Write cumulative infected, one value per day."""
+        with open(self.data_file, 'w') as f:
+            f.write(f'test\n{N}\n{len(infected)}\n' + ''.join(f'{x}\n' for x in infected))
+
+    def _model(self, **kwargs):
+        return Model(synthetic=True, dataFile=self.data_file, observations=['infections'],
+                     dataFolder=os.path.join(self.tmp_dir, 'data'), preprocess=False, silent=True,
+                     **kwargs)
+
+    def test_evaluate_reference(self):
+        """Test the sensitivities of the daily infected against finite differences."""
+        model = self._model()
+        s = {'Parameters': PARAMS}
+        model.computational_model(s)
+        y, J = model.evaluate_reference(PARAMS, jacobian=True)
+        np.testing.assert_allclose(y, s['Reference Evaluations'], rtol=1e-12)
+        self.assertEqual(J.shape, (len(y), len(PARAMS)))
+
+        # The intervention parameters do not enter the initial condition.
+        for j in [5, 6, 7]:
+            p = np.array(PARAMS)
+            p[j] += 1e-6
+            D = (model.evaluate_reference(p)[0] - y) / 1e-6
+            self.assertLess(np.linalg.norm(J[:, j] - D), 1e-2 * np.linalg.norm(D))
+        np.testing.assert_array_equal(J[:, -1], 0.0)
+
+    def test_least_squares(self):
+        model = self._model()
+        js = model.least_squares(maxiter=30, nStarts=4)
+
+        p = np.array(js['Parameter'])
+        bounds = model.get_variables_and_distributions()['Distributions']
+        for x, d in zip(p, bounds):
+            self.assertTrue(d['Minimum'] <= x <= d['Maximum'])
+        self.assertGreater(model.evaluate_log_likelihood(p), model.evaluate_log_likelihood(PARAMS))
+
+        with open(model.saveInfo['cmaes']) as f:
+            self.assertEqual(json.load(f), js)
+        self.assertEqual(js['Names'], [x['Name'] for x in model.parameters])
+        self.assertTrue(model.has_been_called['optimize'])
+        np.testing.assert_array_equal([x['Values'][0] for x in model.parameters], p)
+
+    def test_least_squares_informed_priors(self):
+        """Test that the starts and the estimate stay within the bounds with informed priors."""
+        model = self._model(useInformedPriors=True)
+        starts = []
+        least_squares = scipy.optimize.least_squares
+        def record(fun, x0, **kwargs):
+            starts.append((x0, kwargs['bounds']))
+            return least_squares(fun, x0, **kwargs)
+        with mock.patch.object(scipy.optimize, 'least_squares', record):
+            js = model.least_squares(maxiter=5, nStarts=4)
+
+        bounds = model.get_variables_and_distributions()['Distributions']
+        lower = [d['Minimum'] for d in bounds[:-1]]
+        upper = [d['Maximum'] for d in bounds[:-1]]
+        self.assertEqual(len(starts), 4)
+        for x0, (lb, ub) in starts:
+            np.testing.assert_array_equal(lb, lower)
+            np.testing.assert_array_equal(ub, upper)
+            self.assertTrue(((x0 >= lb) & (x0 <= ub)).all())
+        for x, d in zip(js['Parameter'], bounds):
+            self.assertTrue(d['Minimum'] <= x <= d['Maximum'])
+        self.assertTrue(np.isfinite(js['Value']))
+
+    def test_least_squares_sensitivities_per_start(self):
+        """Test that sensitivities which agree only at the first start are replaced by finite differences."""
+        model = self._model()
+        names = [v['Name'] for v in model.get_variables_and_distributions()['Variables']]
+        j = names.index('kbeta')
+        evaluate_reference = model.evaluate_reference
+        first = []
+        def wrong_elsewhere(p, jacobian=False):
+            y, J = evaluate_reference(p, jacobian=jacobian)
+            if jacobian:
+                if not first:
+                    first.append(np.array(p))
+                elif not np.array_equal(p, first[0]):
+                    J = J.copy()
+                    J[:, j] *= 2.0
+            return y, J
+        messages = []
+        with mock.patch.object(model, 'evaluate_reference', wrong_elsewhere), \
+             mock.patch('epidemics.epidemics.printlog', messages.append):
+            model.least_squares(maxiter=5, nStarts=3)
+
+        used = [m for m in messages if 'using sensitivities' in m]
+        self.assertEqual(len(used), 3)
+        self.assertIn("'kbeta'", used[0])
+        # The intervention of the second start acts after the data, so the check of
+        # kbeta only fails at the third start.
+        self.assertNotIn("'kbeta'", used[2])
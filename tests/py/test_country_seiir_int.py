@@ -68,3 +68,23 @@ class TestCountrySIR(TestCaseEx):
             self.assertRelative(py[2], ad.Ir().val(), tolerance=1e-6)
             self.assertRelative(py[3], ad.Iu().val(), tolerance=1e-6)
             self.assertRelative(py[4], ad.R().val(), tolerance=1e-6)
+
+    def test_restart(self):
+        """Test resuming the integration from a state at t0 > 0, across the intervention."""
+        seiir_int = libepidemics.country.seiir_int
+        dp        = libepidemics.country.DesignParameters(N=100500)
+        solver    = seiir_int.Solver(dp)
+        params    = seiir_int.Parameters(beta=0.2, mu=0.1, alpha=0.15, Z=5.3, D=3.2, tact=10.0, dtact=2.0, kbeta=0.5)
+
+        y0     = (1e5, 0.0, 1., 0.0, 200.)  # S, E, Ir, Iu, R
+        t_eval = [0.0, 5.0, 8.0, 11.0, 20.0]
+        full    = solver.solve(params, seiir_int.State(y0), t_eval=t_eval, dt=0.01)
+        resumed = solver.solve(params, full[1], t_eval=t_eval[2:], dt=0.01, start_time=5.0)
+
+        self.assertEqual(len(resumed), 3)
+        for a, b in zip(full[2:], resumed):
+            for x, y in zip(a.tolist(), b.tolist()):
+                self.assertRelative(x, y, tolerance=1e-10)
+
+        with self.assertRaises(ValueError):
+            solver.solve(params, full[1], t_eval=[4.0, 8.0], start_time=5.0)
@@ -0,0 +1,161 @@
+import os
+import pickle
+import shutil
+import tempfile
+from unittest import mock
+
+import numpy as np
+
+from common import TestCaseEx
+
+from epidemics.country.reparam.seiir_int.nbin import Model
+
+PARAMS = [2.5, 5.0, 3.0, 0.5, 0.6, 20.0, 10.0, 0.4, 20.0]
+N = 1000000
+
+class TestCountrySMC(TestCaseEx):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.data_file = os.path.join(self.tmp_dir, 'data.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _write_data(self, T, model=None):
+        """Write cumulative infected for T days, generated by the model itself."""
+        if model is None:
+            infected = 100 * np.exp(0.1 * np.arange(T))
+        else:
+            sol = model.solve_ode(y0=model.data['Model']['Initial Condition'], T=T - 1,
+                                  t_eval=list(range(T)), N=N, p=PARAMS)
+            infected = np.maximum.accumulate(np.round(sol.y - sol.y[0] + 100))
+        with open(self.data_file, 'w') as f:
+            f.write(f'test\n{N}\n{T}\n' + ''.join(f'{x}\n' for x in infected))
+
+    def _model(self):
+        return Model(synthetic=True, dataFile=self.data_file, observations=['infections'],
+                     dataFolder=os.path.join(self.tmp_dir, 'data'), preprocess=False, silent=True)
+
+    def test_assimilate(self):
+        """Test restarting from cached states and assimilating new days."""
+        self._write_data(40)
+        self._write_data(40, self._model())
+        model = self._model()
+
+        np.random.seed(12345)
+        x = np.array(PARAMS) * (1 + 0.05 * np.random.randn(50, len(PARAMS)))
+        js = model.get_variables_and_distributions()
+        model.parameters = [{'Name': v['Name'], 'Values': x[:, j]} for j, v in enumerate(js['Variables'])]
+        model.has_been_called['sample'] = True
+
+        self.assertTrue(model.smc_is_restartable())
+        model.smc_init()
+        t0 = model.smc['Time']
+        self.assertEqual(t0, 39)
+        self.assertEqual(len(model.endOfData), 50)
+        model.smc['Log Evidence'] = 0.0
+
+        self._write_data(45, model)
+        model.load_data()
+        model.process_data()
+        restarted, state1, _ = model.smc_evaluate((x[0], model.smc['States'][0], t0))
+        full, state2, _ = model.smc_evaluate((x[0], None, t0))
+        self.assertEqual(len(restarted['Reference Evaluations']), 5)
+        np.testing.assert_allclose(restarted['Reference Evaluations'], full['Reference Evaluations'], rtol=1e-10)
+        np.testing.assert_allclose(state1, state2, rtol=1e-10)
+
+        model.assimilate(minESS=0.99, nMoves=1)
+        self.assertEqual(model.smc['Time'], 44)
+        self.assertTrue(np.isfinite(model.smc['Log Evidence']))
+        self.assertLess(model.smc['Log Evidence'], 0.0)
+        np.testing.assert_array_equal(model.smc['Log Weights'], 0.0)
+        self.assertEqual(len(model.parameters[0]['Values']), 50)
+        self.assertTrue(os.path.isfile(model.saveInfo['posterior samples']))
+
+        # The particles are propagated from the solutions stored by the assimilation.
+        y0 = model.data['Model']['Initial Condition']
+        t = np.arange(51.0)
+        p = model.smc['Particles'][0]
+        self.assertIsNotNone(model.load_end_of_data(p, 44))
+        expected = model.solve_ode(y0=y0, T=t[-1], t_eval=t.tolist(), N=N, p=list(p))
+        with mock.patch.object(Model, 'solve_ode', autospec=True, side_effect=Model.solve_ode) as solve_ode:
+            sol = model.solve_propagation(y0=y0, t=t, N=N, p=list(p))
+        self.assertEqual(solve_ode.call_count, 1)
+        self.assertIsNotNone(solve_ode.call_args.kwargs['state'])
+        for attr in ['y', 'e', 'r', 'iu']:
+            np.testing.assert_allclose(getattr(sol, attr), getattr(expected, attr), rtol=1e-10)
+
+    def test_solve_propagation(self):
+        """Test propagating from the stored end-of-data solution."""
+        self._write_data(40)
+        model = self._model()
+        y0 = model.data['Model']['Initial Condition']
+        t = np.arange(51.0)
+        expected = model.solve_ode(y0=y0, T=t[-1], t_eval=t.tolist(), N=N, p=PARAMS)
+        for _ in range(2):
+            sol = model.solve_propagation(y0=y0, t=t, N=N, p=PARAMS)
+            self.assertEqual(len(model.endOfData), 1)
+            for attr in ['y', 'e', 'r', 'iu']:
+                np.testing.assert_allclose(getattr(sol, attr), getattr(expected, attr), rtol=1e-10)
+
+    def test_end_of_data_size(self):
+        """Test that the stored solutions are bounded and not pickled."""
+        self._write_data(40)
+        model = self._model()
+        model.endOfDataSize = 3
+        y0 = model.data['Model']['Initial Condition']
+        t = np.arange(51.0)
+        for k in range(5):
+            p = list(PARAMS)
+            p[0] += 0.01 * k
+            model.solve_propagation(y0=y0, t=t, N=N, p=p)
+        self.assertEqual(len(model.endOfData), 3)
+        self.assertIsNone(model.load_end_of_data(PARAMS, 39))
+        self.assertIsNotNone(model.load_end_of_data(p, 39))
+
+        loaded = pickle.loads(pickle.dumps(model))
+        self.assertNotIn('endOfData', vars(loaded))
+        sol = loaded.solve_propagation(y0=y0, t=t, N=N, p=p)
+        self.assertEqual(len(loaded.endOfData), 1)
+        self.assertEqual(len(sol.y), len(t))
+
+    def test_computational_model_end_of_data(self):
+        """Test propagating from the solutions stored by `computational_model`."""
+        self._write_data(40)
+        model = self._model()
+        model.computational_model({'Parameters': list(PARAMS)})
+        self.assertIsNotNone(model.load_end_of_data(PARAMS, 39))
+
+        y0 = model.data['Model']['Initial Condition']
+        t = np.arange(51.0)
+        expected = model.solve_ode(y0=y0, T=t[-1], t_eval=t.tolist(), N=N, p=PARAMS)
+        with mock.patch.object(Model, 'solve_ode', autospec=True, side_effect=Model.solve_ode) as solve_ode:
+            sol = model.solve_propagation(y0=y0, t=t, N=N, p=list(PARAMS))
+        self.assertEqual(solve_ode.call_count, 1)
+        self.assertIsNotNone(solve_ode.call_args.kwargs['state'])
+        for attr in ['y', 'e', 'r', 'iu']:
+            np.testing.assert_allclose(getattr(sol, attr), getattr(expected, attr), rtol=1e-10)
+
+        # Restarted solutions have no gradients, as they miss the dependence before the restart.
+        self.assertTrue(hasattr(expected, 'gradMu'))
+        self.assertFalse(hasattr(sol, 'gradMu'))
+        self.assertFalse(hasattr(sol, 'gradSig'))
+
+    def test_map_samples(self):
+        """Test evaluating samples with the worker pool of the model."""
+        self._write_data(40)
+        model = self._model()
+        model.nThreads = 2
+        x = [np.array(PARAMS) * (1 + 0.01 * k) for k in range(4)]
+        expected = [model.evaluate_log_likelihood(p) for p in x]
+        try:
+            np.testing.assert_allclose(model.map_samples(model.evaluate_log_likelihood, x), expected, rtol=1e-12)
+            pool = model.workerPool
+            np.testing.assert_allclose(model.map_samples(model.evaluate_log_likelihood, x), expected, rtol=1e-12)
+            self.assertIs(model.workerPool, pool)
+            self.assertNotIn('workerPool', vars(pickle.loads(pickle.dumps(model))))
+
+            # Functions which cannot be pickled are evaluated serially.
+            self.assertEqual(model.map_samples(lambda p: p[0], x), [p[0] for p in x])
+        finally:
+            model.workerPool.pool.terminate()
@@ -0,0 +1,75 @@
+import io
+import os
+import pathlib
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from epidemics.data import bundle
+from epidemics.utils.io import download_and_save, set_data_mirror
+
+class TestDataBundle(unittest.TestCase):
+    def setUp(self):
+        """Create a fake upstream served over HTTP and an empty mirror root."""
+        self.tmp_dir = pathlib.Path(tempfile.mkdtemp())
+        self.upstream = self.tmp_dir / 'upstream'
+        self.upstream.mkdir()
+        self.sources = [s for s in bundle.SOURCES if s.group in bundle.DEFAULT_GROUPS]
+        for s in self.sources:
+            with open(self.upstream / s.filename, 'wb') as f:
+                f.write(s.filename.encode('utf8'))
+        self.server, self.base_url = bundle.serve(self.upstream)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        set_data_mirror(None)
+        shutil.rmtree(self.tmp_dir)
+
+    def test_prefetch_and_resolve(self):
+        """Test that prefetched files are served from the mirror."""
+        mirror = bundle.prefetch(self.tmp_dir / 'mirror', version='v1',
+                                 base_url=self.base_url, jobs=3)
+        self.assertEqual(bundle.verify(mirror), [])
+        self.assertEqual(os.readlink(self.tmp_dir / 'mirror' / 'latest'), 'v1')
+
+        # Shut down the upstream, the mirror must not need it.
+        self.server.shutdown()
+        set_data_mirror(self.tmp_dir / 'mirror' / 'latest')
+        for s in self.sources:
+            path = self.tmp_dir / 'downloads' / s.filename
+            self.assertEqual(download_and_save(s.url, path), s.filename.encode('utf8'))
+            self.assertIsNone(download_and_save(s.url, path, load=False))
+            self.assertTrue(path.exists())
+
+        with self.assertRaises(FileNotFoundError):
+            download_and_save('https://example.com/unknown.csv', self.tmp_dir / 'unknown.csv')
+
+    def test_pack_and_load_bundle(self):
+        """Test that a packed bundle can be used as a mirror."""
+        mirror = bundle.prefetch(self.tmp_dir / 'mirror', version='v2',
+                                 base_url=self.base_url)
+        tarball = self.tmp_dir / 'mirror.tar.gz'
+        bundle.pack(mirror, tarball)
+        extracted = bundle.load_bundle(tarball, root=self.tmp_dir / 'extracted')
+        self.assertEqual(extracted, self.tmp_dir / 'extracted' / 'v2')
+        self.assertEqual(bundle.verify(extracted), [])
+
+        s = self.sources[0]
+        set_data_mirror(extracted)
+        self.assertEqual(download_and_save(s.url, self.tmp_dir / s.filename),
+                         s.filename.encode('utf8'))
+
+    def test_load_bundle_rejects_traversal(self):
+        """Test that members outside of the version directory are rejected."""
+        for name in ['v3/../../escaped', '/v3/escaped', '../escaped']:
+            tarball = self.tmp_dir / 'evil.tar.gz'
+            with tarfile.open(tarball, 'w:gz') as tar:
+                for arcname in ['v3/manifest.json', name]:
+                    info = tarfile.TarInfo(arcname)
+                    info.size = 1
+                    tar.addfile(info, io.BytesIO(b'x'))
+            with self.assertRaises(ValueError):
+                bundle.load_bundle(tarball, root=self.tmp_dir / 'extracted')
+            self.assertFalse((self.tmp_dir / 'escaped').exists())
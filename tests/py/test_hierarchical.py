@@ -0,0 +1,199 @@
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+from unittest import mock
+
+import numpy as np
+import scipy.stats
+from scipy.special import logsumexp
+
+from common import TestCaseEx
+
+from epidemics.utils.hierarchical import COMPACT_FILE, PsiLikelihood, compress_samples, effective_sample_size, \
+    export_compact, load_compact, load_korali_samples, theta_log_weights
+
+class TestHierarchical(TestCaseEx):
+    def setUp(self):
+        rng = np.random.RandomState(12345)
+        self.samples = [np.abs(rng.standard_normal((n, 3))) + 0.1 for n in (50, 80, 30)]
+        self.logPriors = [rng.standard_normal(len(x)) for x in self.samples]
+        self.conditionals = [('Normal', 0, 1), ('LogNormal', 2, 3), ('Uniform', 4, 5)]
+
+    def _reference(self, psi):
+        """Korali's Psi likelihood, one sample at a time."""
+        llk = 0.0
+        for x, logPrior in zip(self.samples, self.logPriors):
+            terms = []
+            for theta, lp in zip(x, logPrior):
+                terms.append(scipy.stats.norm.logpdf(theta[0], psi[0], psi[1])
+                             + scipy.stats.lognorm.logpdf(theta[1], psi[3], scale=np.exp(psi[2]))
+                             + scipy.stats.uniform.logpdf(theta[2], psi[4], psi[5] - psi[4]) - lp)
+            llk += logsumexp(terms) - np.log(len(x))
+        return llk
+
+    def test_psi_likelihood(self):
+        """Test the vectorized likelihood against a sample by sample evaluation."""
+        psi = np.array([[0.5, 1.0, -0.5, 0.8, 0.0, 5.0],
+                        [1.0, 0.3, 0.0, 1.5, 0.1, 3.0],
+                        [0.5, 1.0, -0.5, 0.8, 0.5, 5.0]])
+        expected = [self._reference(p) for p in psi]
+        for maxElements in [2**24, 1]:
+            f = PsiLikelihood(self.samples, self.logPriors, self.conditionals, maxElements=maxElements)
+            np.testing.assert_allclose(f(psi), expected, rtol=1e-12)
+
+        # Invalid hyperparameters and regions without samples in the support.
+        psi = np.array([[0.5, -1.0, 0.0, 1.0, 0.0, 5.0],
+                        [0.5, 1.0, 0.0, 1.0, 10.0, 11.0]])
+        np.testing.assert_array_equal(f(psi), -np.inf)
+
+    def test_load_korali_samples(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'latest')
+            js = {
+                'Variables': [{'Name': 'R0', 'Prior Distribution': 'Prior R0'},
+                              {'Name': 'D', 'Prior Distribution': 'Prior D'}],
+                'Distributions': [{'Name': 'Prior R0', 'Type': 'Univariate/Uniform', 'Minimum': 0.5, 'Maximum': 2.5},
+                                  {'Name': 'Prior D', 'Type': 'Univariate/Gamma', 'Shape': 5.0, 'Scale': 1.0}],
+                'Results': {'Sample Database': [[1.0, 2.0], [1.5, 3.0]]},
+            }
+            with open(path, 'w') as f:
+                json.dump(js, f)
+            names, samples, logPrior, logLikelihood = load_korali_samples(path)
+            self.assertEqual(names, ['R0', 'D'])
+            np.testing.assert_array_equal(samples, [[1.0, 2.0], [1.5, 3.0]])
+            expected = np.log(0.5) + scipy.stats.gamma.logpdf([2.0, 3.0], 5.0)
+            np.testing.assert_allclose(logPrior, expected, rtol=1e-12)
+            self.assertTrue(np.isnan(logLikelihood).all())
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_compress_samples(self):
+        """Test merging duplicates and thinning to the target effective sample size."""
+        rng = np.random.RandomState(12345)
+        x = rng.standard_normal((1000, 2))
+        idx, logw = compress_samples(x[np.repeat(np.arange(1000), 3)], targetESS=2000, rng=rng)
+        self.assertEqual(len(idx), 1000)
+        self.assertRelative(effective_sample_size(logw), 1000, 1e-12)
+
+        idx, logw = compress_samples(x, targetESS=100, rng=rng)
+        self.assertEqual(len(idx), 100)
+        self.assertRelative(effective_sample_size(logw), 100, 1e-12)
+
+        # Weighted samples keep (approximately) their weighted mean.
+        logWeights = -0.5 * np.sum((x - 0.5)**2, axis=1)
+        idx, logw = compress_samples(x, logWeights, targetESS=500, rng=rng)
+        w = np.exp(logWeights - logsumexp(logWeights))
+        np.testing.assert_allclose(np.exp(logw) @ x[idx], w @ x, atol=0.02)
+
+    def test_compact_io(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'posterior_compact.npz')
+            x = self.samples[0]
+            ess = export_compact(path, ['a', 'b', 'c'], x, self.logPriors[0], np.zeros(len(x)), targetESS=20)
+            self.assertRelative(ess, 20, 1e-12)
+            compact = load_compact(path, ['c', 'a', 'b'])
+            self.assertEqual(compact['names'], ['c', 'a', 'b'])
+            self.assertEqual(compact['values'].shape, (20, 3))
+            for values, logPrior in zip(compact['values'], compact['logPrior']):
+                i = np.where((x[:, [2, 0, 1]] == values).all(axis=1))[0][0]
+                self.assertEqual(logPrior, self.logPriors[0][i])
+
+            # Weighted and equally weighted samples give the same Psi likelihood.
+            psi = np.array([0.5, 1.0, -0.5, 0.8, 0.0, 5.0])
+            logWeights = [np.log(np.arange(1, len(x) + 1)) for x in self.samples]
+            samples = [np.repeat(x, np.arange(1, len(x) + 1), axis=0) for x in self.samples]
+            logPriors = [np.repeat(lp, np.arange(1, len(lp) + 1)) for lp in self.logPriors]
+            f = PsiLikelihood(self.samples, self.logPriors, self.conditionals, logWeights=logWeights)
+            g = PsiLikelihood(samples, logPriors, self.conditionals)
+            self.assertRelative(f(psi)[0], g(psi)[0], 1e-12)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_theta_log_weights(self):
+        """Test the phase 3 weights against a sample by sample evaluation."""
+        x, logPrior = self.samples[1], self.logPriors[1]
+        psi = np.array([[0.5, 1.0, -0.5, 0.8, 0.0, 5.0],
+                        [1.0, 0.3, 0.0, 1.5, 0.1, 3.0]])
+        expected = []
+        for theta, lp in zip(x, logPrior):
+            expected.append(logsumexp([scipy.stats.norm.logpdf(theta[0], p[0], p[1])
+                                       + scipy.stats.lognorm.logpdf(theta[1], p[3], scale=np.exp(p[2]))
+                                       + scipy.stats.uniform.logpdf(theta[2], p[4], p[5] - p[4])
+                                       for p in psi]) - lp)
+        expected = np.array(expected) - logsumexp(expected)
+        for maxElements in [2**24, 1]:
+            logw = theta_log_weights(x, logPrior, psi, self.conditionals, maxElements=maxElements)
+            np.testing.assert_allclose(logw, expected, rtol=1e-12)
+
+    def test_get_conditionals(self):
+        """Test the conditional priors of the phase 2 application."""
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                     '..', '..', 'applications', 'hierarchical'))
+        from phase_2 import get_conditionals
+        variables = [{'name': 'R0', 'cond_type': 'Normal', 'Mean': (0, 10), 'Std': (0, 5)},
+                     {'name': 'D', 'cond_type': 'LogNormal', 'Mu': (0, 3), 'Sigma': (0, 1)},
+                     {'name': 'Z', 'cond_type': 'Uniform', 'Minimum': (0, 5), 'Maximum': (5, 30)}]
+        self.assertEqual(get_conditionals(variables), self.conditionals)
+        with self.assertRaises(ValueError):
+            get_conditionals([{'name': 'R0', 'cond_type': 'Gamma', 'Shape': (0, 5), 'Scale': (0, 5)}])
+
+    def test_phase_3_propagation(self):
+        """Test propagating the compact phase 3 posterior, with fewer samples than the default."""
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                     '..', '..', 'applications', 'hierarchical'))
+        import phase_3
+        from epidemics.country.reparam.seiir_int.nbin import Model
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            data_file = os.path.join(tmp_dir, 'data.txt')
+            infected = np.round(100 * np.exp(0.1 * np.arange(30)))
+            with open(data_file, 'w') as f:
+                f.write('test\n1000000\n30\n' + ''.join(f'{x}\n' for x in infected))
+
+            models = []
+            def make_model(**kwargs):
+                models.append(Model(synthetic=True, dataFile=data_file, observations=['infections'],
+                                    dataFolder=kwargs['dataFolder'], preprocess=False, silent=True))
+                return models[-1]
+
+            names = [v['Name'] for v in make_model(dataFolder=tmp_dir).get_variables_and_distributions()['Variables']]
+            x = np.array([2.5, 5.0, 3.0, 0.5, 0.6, 20.0, 10.0, 0.4, 20.0]) \
+                * (1 + 0.01 * np.random.RandomState(12345).randn(50, len(names)))
+            export_compact(os.path.join(tmp_dir, COMPACT_FILE), names, x,
+                           np.zeros(len(x)), np.zeros(len(x)), targetESS=20)
+
+            calls = []
+            def propagate(self, nPropagate=1000):
+                calls.append(random.sample(range(self.nSamples), nPropagate))
+            with mock.patch.object(phase_3, 'import_from', return_value=make_model), \
+                 mock.patch.object(Model, 'propagate', propagate):
+                phase_3.propagation('country.reparam.seiir_int.nbin', 'test', tmp_dir, plot=False)
+            self.assertEqual(len(calls), 1)
+            self.assertEqual(len(calls[0]), 20)
+
+            a = phase_3.load_model(models[-1].saveInfo['state'])
+            self.assertEqual(a.nSamples, 20)
+            self.assertEqual([p['Name'] for p in a.parameters], names)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_phase_3_regions(self):
+        """Test that phase 3 selects all regions in the same folder as phase 2."""
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                     '..', '..', 'applications', 'hierarchical'))
+        import phase_3
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            for name in ['italy', 'switzerland', '_hierarchical']:
+                os.makedirs(os.path.join(tmp_dir, name))
+            regions, folder_name = phase_3.get_regions('all', tmp_dir)
+            self.assertEqual(sorted(regions), ['italy', 'switzerland'])
+            self.assertEqual(folder_name, '/all_countries')
+        finally:
+            shutil.rmtree(tmp_dir)
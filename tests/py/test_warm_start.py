@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import scipy.integrate
+import scipy.stats
+
+from common import TestCaseEx
+
+from epidemics.utils.misc import TruncatedDistribution
+from epidemics.utils.warm_start import WarmStartProposal, importance_resample, \
+    load_posterior_samples, log_prior, reference_log_likelihood, save_posterior_samples
+
+class TestWarmStart(TestCaseEx):
+    def test_log_likelihood(self):
+        """Test the reference log-likelihoods against scipy distributions."""
+        y = np.array([0., 3., 10., 25.])
+        m = np.array([1.5, 2.5, 12., 20.])
+        r = np.array([2.0, 2.0, 2.0, 2.0])
+        s = {'Reference Evaluations': m, 'Dispersion': r, 'Standard Deviation': 0.5 * m}
+
+        expected = scipy.stats.nbinom.logpmf(y, r, r / (m + r)).sum()
+        self.assertRelative(reference_log_likelihood('Negative Binomial', y, s), expected, 1e-12)
+        expected = scipy.stats.poisson.logpmf(y, m).sum()
+        self.assertRelative(reference_log_likelihood('Poisson', y, s), expected, 1e-12)
+        expected = scipy.stats.geom.logpmf(y + 1, 1 / (1 + m)).sum()
+        self.assertRelative(reference_log_likelihood('Geometric', y, s), expected, 1e-12)
+        expected = scipy.stats.truncnorm.logpdf(y, -2.0, np.inf, m, 0.5 * m).sum()
+        self.assertRelative(reference_log_likelihood('Positive Normal', y, s), expected, 1e-12)
+
+        with self.assertRaises(ValueError):
+            reference_log_likelihood('Unknown', y, s)
+
+    def test_posterior_samples_io(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            values = np.random.rand(10, 3)
+            save_posterior_samples(os.path.join(tmp_dir, 'posterior_samples.npz'), ['a', 'b', 'c'], values)
+            loaded = load_posterior_samples(tmp_dir, ['c', 'a', 'b'])
+            np.testing.assert_array_equal(loaded, values[:, [2, 0, 1]])
+            with self.assertRaises(ValueError):
+                load_posterior_samples(tmp_dir, ['a', 'b'])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_importance_sampling(self):
+        """Test the evidence and posterior of a Gaussian likelihood with a uniform prior."""
+        rng = np.random.RandomState(12345)
+        priors = [scipy.stats.uniform(-10.0, 20.0), scipy.stats.uniform(0.0, 10.0)]
+        mean = np.array([1.0, 4.0])
+        sigma = np.array([0.3, 0.5])
+
+        # The previous posterior is slightly shifted and narrower.
+        previous = mean + 0.1 + 0.9 * sigma * rng.standard_normal((1000, 2))
+        proposal = WarmStartProposal(previous, priors, rng=rng)
+        x = proposal.sample(20000)
+        logw = log_prior(priors, x) - proposal.logpdf(x) \
+             + scipy.stats.norm.logpdf(x, mean, sigma).sum(axis=1)
+        idx, logEvidence, ess = importance_resample(logw, len(x), rng=rng)
+
+        # The likelihood integrates to 1, the prior density is 1/200.
+        self.assertRelative(np.exp(logEvidence), 1 / 200, 0.02)
+        self.assertGreater(ess, 0.5 * len(x))
+        np.testing.assert_allclose(x[idx].mean(axis=0), mean, atol=0.02)
+        np.testing.assert_allclose(x[idx].std(axis=0), sigma, rtol=0.05)
+
+        # The error of the log evidence is the delta-method variance of the log mean weight.
+        w = np.exp(logw - logw.max())
+        self.assertRelative(1 / ess - 1 / len(w), np.var(w) / (len(w) * np.mean(w)**2), 1e-10)
+
+    def test_truncated_prior(self):
+        """Test a gamma prior truncated to the variable bounds."""
+        prior = TruncatedDistribution(scipy.stats.gamma(3.45, scale=1.51), 1.0, 8.0)
+        self.assertEqual(prior.support(), (1.0, 8.0))
+        self.assertEqual(prior.pdf(0.5), 0.0)
+        self.assertEqual(prior.logpdf(9.0), -np.inf)
+        self.assertRelative(scipy.integrate.quad(prior.pdf, 1.0, 8.0)[0], 1.0, 1e-10)
+        q = np.array([0.0, 0.05, 0.5, 0.95, 1.0])
+        np.testing.assert_allclose(prior.cdf(prior.ppf(q)), q, atol=1e-12)
+        self.assertEqual(prior.ppf(1.0), 8.0)
+        x = prior.rvs(size=1000, random_state=np.random.RandomState(12345))
+        self.assertTrue(((x >= 1.0) & (x <= 8.0)).all())
+        self.assertEqual(log_prior([prior], np.array([[0.5], [2.0]]))[0], -np.inf)